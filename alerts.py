@@ -0,0 +1,257 @@
+import atexit
+import hashlib
+import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from database import db
+from models import Ticket, Message
+import assignment
+import ticket_events
+
+# An alert repeating the fingerprint of one seen less than DEDUP_WINDOW
+# seconds ago is added as a message to that ticket instead of opening a
+# new one. Fingerprints are kept in a process-wide LRU of DEDUP_SIZE entries.
+DEDUP_WINDOW = float(os.environ.get("ALERT_DEDUP_WINDOW", 3600))
+DEDUP_SIZE = int(os.environ.get("ALERT_DEDUP_SIZE", 10000))
+
+# Alerts are written by one background thread, up to BATCH_SIZE per commit.
+# A full queue rejects new alerts so a storm can't grow memory without bound.
+QUEUE_SIZE = int(os.environ.get("ALERT_QUEUE_SIZE", 10000))
+BATCH_SIZE = int(os.environ.get("ALERT_BATCH_SIZE", 200))
+FLUSH_INTERVAL = float(os.environ.get("ALERT_FLUSH_INTERVAL", 0.5))
+
+DEFAULT_DEPARTMENT = os.environ.get("ALERT_DEPARTMENT", "TI")
+MAX_ALERTS = 1000  # per request
+
+PRIORITIES = ('Alta', 'Média', 'Baixa')
+SEVERITIES = {
+    'critical': 'Alta', 'error': 'Alta', 'high': 'Alta',
+    'warning': 'Média', 'medium': 'Média',
+    'info': 'Baixa', 'low': 'Baixa',
+}
+
+class AlertError(ValueError):
+    """Invalid alert payload"""
+
+class DedupCache:
+    """LRU of fingerprint -> [ticket id, last seen]. The ticket id is None
+    while the ticket for a new fingerprint is still queued."""
+
+    def __init__(self, window, size):
+        self.window = window
+        self.size = size
+        self._entries = OrderedDict()
+        self._by_ticket = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _drop(self, fingerprint):
+        entry = self._entries.pop(fingerprint, None)
+        if entry and entry[0] is not None:
+            self._by_ticket.pop(entry[0], None)
+
+    def seen(self, fingerprint, now=None):
+        """Record an occurrence; True if it repeats one inside the window"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            if entry is not None and now - entry[1] <= self.window:
+                entry[1] = now
+                self._entries.move_to_end(fingerprint)
+                return True
+            self._drop(fingerprint)
+            self._entries[fingerprint] = [None, now]
+            while len(self._entries) > self.size:
+                self._drop(next(iter(self._entries)))
+            return False
+
+    def ticket_for(self, fingerprint):
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            return entry[0] if entry else None
+
+    def bind(self, fingerprint, ticket_id):
+        """Attach the ticket opened for a fingerprint"""
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            if entry is not None:
+                entry[0] = ticket_id
+                self._by_ticket[ticket_id] = fingerprint
+
+    def forget(self, fingerprint):
+        with self._lock:
+            self._drop(fingerprint)
+
+    def forget_ticket(self, ticket_id):
+        """Stop routing repeats to a ticket (it was resolved, closed or deleted)"""
+        with self._lock:
+            fingerprint = self._by_ticket.pop(ticket_id, None)
+            if fingerprint is not None:
+                self._entries.pop(fingerprint, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_ticket.clear()
+
+cache = DedupCache(DEDUP_WINDOW, DEDUP_SIZE)
+
+_queue = queue.Queue(maxsize=QUEUE_SIZE)
+_writer = None
+_writer_lock = threading.Lock()
+
+def normalize(alert):
+    """Validate one alert and fill in defaults, raising AlertError"""
+    if not isinstance(alert, dict):
+        raise AlertError("Each alert must be an object")
+    title = str(alert.get('title') or '').strip()
+    if not title:
+        raise AlertError("title is required")
+    if len(title) > 200:
+        raise AlertError("title is longer than 200 characters")
+
+    priority = alert.get('priority')
+    if not priority:
+        priority = SEVERITIES.get(str(alert.get('severity', '')).lower(), 'Média')
+    if priority not in PRIORITIES:
+        raise AlertError(f"priority must be one of {', '.join(PRIORITIES)}")
+
+    department = str(alert.get('department') or DEFAULT_DEPARTMENT)
+    source = str(alert.get('source') or '')
+    fingerprint = alert.get('fingerprint')
+    if not fingerprint:
+        fingerprint = hashlib.sha1(f"{source}\0{department}\0{title}".encode()).hexdigest()
+
+    return {
+        'fingerprint': str(fingerprint),
+        'title': title,
+        'description': str(alert.get('description') or title),
+        'department': department,
+        'priority': priority,
+        'source': source,
+    }
+
+def submit(app, alerts, creator_id):
+    """Queue normalized alerts for the writer thread. Returns (new, duplicates,
+    rejected) counts; alerts that don't fit in the queue are rejected."""
+    _ensure_writer(app)
+    new = duplicates = 0
+    for position, alert in enumerate(alerts):
+        repeat = cache.seen(alert['fingerprint'])
+        try:
+            _queue.put_nowait((alert, creator_id, repeat))
+        except queue.Full:
+            if not repeat:
+                cache.forget(alert['fingerprint'])
+            return new, duplicates, len(alerts) - position
+        if repeat:
+            duplicates += 1
+        else:
+            new += 1
+    return new, duplicates, 0
+
+def pending():
+    return _queue.qsize()
+
+def _ensure_writer(app):
+    global _writer
+    if _writer is None or not _writer.is_alive():
+        with _writer_lock:
+            if _writer is None or not _writer.is_alive():
+                _writer = threading.Thread(target=_run_writer, args=(app,), name='alert-writer', daemon=True)
+                _writer.start()
+
+def _next_batch():
+    """Wait for one alert, then take whatever else arrives within FLUSH_INTERVAL"""
+    batch = [_queue.get()]
+    deadline = time.monotonic() + FLUSH_INTERVAL
+    while len(batch) < BATCH_SIZE:
+        remaining = deadline - time.monotonic()
+        try:
+            batch.append(_queue.get(timeout=remaining) if remaining > 0 else _queue.get_nowait())
+        except queue.Empty:
+            break
+    return batch
+
+def _run_writer(app):
+    while True:
+        batch = _next_batch()
+        try:
+            with app.app_context():
+                write_batch(batch)
+        finally:
+            for _ in batch:
+                _queue.task_done()
+
+def write_batch(batch):
+    """Write a batch of queued alerts in one transaction: a ticket for each
+    new fingerprint and a message on the open ticket for each repeat"""
+    session = db.session
+    opened = {}  # fingerprint -> Ticket created in this batch
+    try:
+        for alert, creator_id, repeat in batch:
+            fingerprint = alert['fingerprint']
+            ticket = opened.get(fingerprint)
+            ticket_id = cache.ticket_for(fingerprint) if repeat and ticket is None else None
+            if ticket is not None or ticket_id is not None:
+                # A ticket from this batch has no id until the flush
+                target = {'ticket': ticket} if ticket is not None else {'ticket_id': ticket_id}
+                session.add(Message(
+                    content=f"Alerta recebido novamente: {alert['description']}",
+                    user_id=creator_id,
+                    message_type='system',
+                    **target
+                ))
+                continue
+
+            # New fingerprint, or its ticket was closed or evicted meanwhile
+            ticket = Ticket(
+                title=alert['title'],
+                description=alert['description'],
+                department=alert['department'],
+                priority=alert['priority'],
+                observations=f"Alerta automático ({alert['source']})" if alert['source'] else 'Alerta automático',
+                creator_id=creator_id
+            )
+            session.add(ticket)
+            opened[fingerprint] = ticket
+
+        # One flush inserts all the tickets, then all the messages
+        session.flush()
+        if assignment.AUTO_ASSIGN:
+            assignment.auto_assign(session, list(opened.values()))
+        opened = {fingerprint: ticket.id for fingerprint, ticket in opened.items()}
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        logging.error(f"Failed to write {len(batch)} alerts: {e}")
+        for alert, _, repeat in batch:
+            if not repeat:
+                cache.forget(alert['fingerprint'])
+        return
+
+    for fingerprint, ticket_id in opened.items():
+        cache.bind(fingerprint, ticket_id)
+
+def flush(timeout=None):
+    """Wait until every queued alert has been written (or timeout seconds pass)"""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while _queue.unfinished_tasks:
+        if deadline is not None and time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+# Give queued alerts a chance to reach the database on a clean shutdown
+atexit.register(flush, 5)
+
+@ticket_events.subscribe
+def _on_ticket_changes(changes):
+    for change in changes:
+        if change.action == 'deleted' or change.status in ('Resolvido', 'Fechado'):
+            cache.forget_ticket(change.ticket_id)
@@ -1,3 +1,7 @@
+# Green-thread Socket.IO modes patch the stdlib before anything else loads
+import concurrency
+concurrency.monkey_patch()
+
 import os
 import logging
 from flask import Flask
@@ -6,77 +10,121 @@ from flask_jwt_extended import JWTManager
 from flask_socketio import SocketIO
 from flask_cors import CORS
 from database import db
-from simple_app import app as simple_app, User as SimpleUser, Ticket as SimpleTicket
+import archive
+import assets
+import bootstrap
+import compression
+import db_tuning
+import instrumentation
+import partitions
+import replicas
+import reporting
+import search
+import ticket_counters
+import ticket_events
+import notifications
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 
-# Create the app
-app = Flask(__name__)
-app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-change-in-production")
-app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
-
-# Configure CORS
-CORS(app, origins="*", supports_credentials=True)
-
-# Configure JWT
-app.config["JWT_SECRET_KEY"] = os.environ.get("JWT_SECRET_KEY", "jwt-secret-string")
-app.config["JWT_ACCESS_TOKEN_EXPIRES"] = False  # Token doesn't expire for demo
-jwt = JWTManager(app)
-
-# Configure database
-database_url = os.environ.get("DATABASE_URL", "sqlite:///helpdesk.db")
-app.config["SQLALCHEMY_DATABASE_URI"] = database_url
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-
-# Configure file uploads
-app.config["UPLOAD_FOLDER"] = "uploads"
-app.config["MAX_CONTENT_LENGTH"] = 16 * 1024 * 1024  # 16MB max file size
-
-# Initialize extensions
-db.init_app(app)
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
-
-# Ensure upload directory exists
-os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
-
-with app.app_context():
-    # Import models to ensure tables are created
-    from models import User, Ticket, Message, Attachment
-    import routes
-    import auth
-    import socketio_events
-    
-    # Force recreate all tables to ensure correct schema
-    db.drop_all()
-    db.create_all()
-    
-    # Create demo users
+# Extensions are created unbound and attached in create_app()
+jwt = JWTManager()
+socketio = SocketIO()
+
+def create_app():
+    """Create and configure the app. Nothing here touches the database, so a
+    worker is ready as soon as the modules are imported. Schema changes and
+    demo data are applied explicitly with `flask init-db` / `flask seed-demo`."""
+    app = Flask(__name__)
+    app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-change-in-production")
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
+
+    # Configure CORS
+    CORS(app, origins="*", supports_credentials=True)
+
+    # Configure JWT
+    app.config["JWT_SECRET_KEY"] = os.environ.get("JWT_SECRET_KEY", "jwt-secret-string")
+    app.config["JWT_ACCESS_TOKEN_EXPIRES"] = False  # Token doesn't expire for demo
+
+    # Configure database
+    database_url = os.environ.get("DATABASE_URL", "sqlite:///helpdesk.db")
+    app.config["SQLALCHEMY_DATABASE_URI"] = database_url
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = db_tuning.engine_options(database_url)
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    replicas.configure(app)
+
+    # Configure file uploads
+    app.config["UPLOAD_FOLDER"] = "uploads"
+    app.config["MAX_CONTENT_LENGTH"] = 16 * 1024 * 1024  # 16MB max file size
+
+    # Initialize extensions
+    jwt.init_app(app)
+    db.init_app(app)
+    db_tuning.init_app(app, db)
+    replicas.init_app(app, db)
+    # Shared by the workers of a multi-process deployment (e.g. redis://...)
+    # so that rooms and emits span all of them
+    socketio.init_app(app, cors_allowed_origins="*", async_mode=concurrency.ASYNC_MODE,
+                      message_queue=os.environ.get("SOCKETIO_MESSAGE_QUEUE"))
+
+    # Ensure upload directory exists
+    os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
+
+    # Request/SQL timing and /metrics first, so its latency includes the
+    # other hooks; then the template cache, static URLs and compression
+    instrumentation.init_app(app)
+    assets.init_app(app)
+    compression.init_app(app)
+
     from models import User
-    from werkzeug.security import generate_password_hash
-    
-    demo_users = [
-        {"username": "admin", "password": "admin123", "role": "Administrador", "email": "admin@company.com", "name": "Administrador Sistema"},
-        {"username": "tecnico1", "password": "tecnico123", "role": "Técnico", "email": "tecnico1@company.com", "name": "João Silva"},
-        {"username": "colaborador1", "password": "colab123", "role": "Colaborador", "email": "colaborador1@company.com", "name": "Maria Santos"},
-        {"username": "diretor", "password": "diretor123", "role": "Diretoria", "email": "diretor@company.com", "name": "Carlos Diretor"}
-    ]
-    
-    for user_data in demo_users:
-        user = User(
-            username=user_data["username"],
-            password_hash=generate_password_hash(user_data["password"]),
-            role=user_data["role"],
-            email=user_data["email"],
-            name=user_data["name"]
-        )
-        db.session.add(user)
-    
-    db.session.commit()
+    import dashboard_feed
+    import importer
+    bootstrap.register_commands(app, db, User)
+    archive.register_commands(app, db)
+    partitions.register_commands(app, db)
+    reporting.register_commands(app, db)
+    ticket_counters.register_commands(app, db)
+    search.register_commands(app, db)
+    importer.register_commands(app)
+    notifications.register_commands(app, db)
+    search.register_listeners(db.session)
+    ticket_events.register_listeners(db.session)
+    notifications.register_listeners(db.session)
+
+    # Opt-in for single-process setups; deployments run `flask init-db` once
+    if os.environ.get("AUTO_MIGRATE") == "1":
+        with app.app_context():
+            bootstrap.upgrade_schema(db)
+
+    # Deliver notifications from this process; otherwise run
+    # `flask dispatch-notifications` next to the web workers
+    if os.environ.get("NOTIFY_DISPATCHER") == "1":
+        notifications.start_dispatcher(app, db)
+
+    # Likewise for report figures, or run `flask compute-reports` periodically
+    if os.environ.get("REPORT_REFRESHER") == "1":
+        reporting.start_refresher(app, db)
+
+    # Dashboard deltas of the changes this worker commits; on by default so
+    # no worker drops its changes for want of viewers of its own
+    if os.environ.get("DASHBOARD_FEED", "1") == "1":
+        dashboard_feed.feed.start(app, socketio, db)
+
+    return app
+
+app = create_app()
+
+# Routes and socket handlers register themselves on the module-level app
+import routes  # noqa: E402,F401
+import socketio_events  # noqa: E402,F401
 
 if __name__ == "__main__":
-    socketio.run(app, host="0.0.0.0", port=5000, debug=True, use_reloader=False, log_output=True)
+    # Use the instance the routes were registered on (this file is also imported as `app`)
+    from app import app, socketio
+    with app.app_context():
+        bootstrap.upgrade_schema(db)
+    # The debugger allows code execution from the browser; opt in with FLASK_DEBUG=1
+    debug = os.environ.get("FLASK_DEBUG") == "1"
+    socketio.run(app, host="0.0.0.0", port=int(os.environ.get("PORT", 5000)), debug=debug,
+                 use_reloader=False, log_output=debug, allow_unsafe_werkzeug=True,
+                 **concurrency.server_options())
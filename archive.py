@@ -0,0 +1,134 @@
+import logging
+import os
+from collections import Counter
+from datetime import datetime, timedelta
+import click
+from sqlalchemy import delete, func, insert, literal, select
+
+# Tickets closed (status 'Fechado') more than ARCHIVE_AFTER_DAYS ago move to
+# the archive tables with their messages and attachment metadata, so the hot
+# tables, their indexes and counts only grow with recent work. Their search
+# documents stay in the index. Listings read the archive only when asked to
+# (see wanted()), single-ticket lookups fall back to it, and dashboard counts
+# and exports add it in (see count_by()).
+ARCHIVE_AFTER_DAYS = int(os.environ.get("ARCHIVE_AFTER_DAYS", 180))
+ARCHIVE_BATCH_SIZE = int(os.environ.get("ARCHIVE_BATCH_SIZE", 500))
+
+def _tables():
+    import models
+    return [
+        (models.Ticket.__table__, models.TicketArchive.__table__),
+        (models.Message.__table__, models.MessageArchive.__table__),
+        (models.Attachment.__table__, models.AttachmentArchive.__table__),
+    ]
+
+def _owner(table):
+    """The column holding the ticket id of a hot or archive table's rows"""
+    return table.c.id if 'ticket_id' not in table.c else table.c.ticket_id
+
+def wanted(args):
+    """Whether a listing's filters reach into the archive: closed tickets, or
+    archived=1 / archived=only"""
+    return args.get('status') == 'Fechado' or args.get('archived') in ('1', 'true', 'only')
+
+def only(args):
+    """Whether a listing asks for archived tickets alone"""
+    return args.get('archived') == 'only'
+
+def count_by(connection, group, since=None):
+    """Ticket counts by group(table), a column or expression of a ticket
+    table, over hot and archived tickets together; only those created since
+    a time when given"""
+    import models
+    counts = Counter()
+    for table in (models.Ticket.__table__, models.TicketArchive.__table__):
+        key = group(table)
+        query = select(key, func.count()).group_by(key)
+        if since is not None:
+            query = query.where(table.c.created_at >= since)
+        for value, count in connection.execute(query):
+            counts[value] += count
+    return counts
+
+def _pinned_tickets(connection):
+    """Tickets owning the newest ticket, message or attachment row. SQLite
+    hands out max(id) + 1 for new rows, so moving those would let a new
+    row reuse an archived id; they wait for the next run."""
+    pinned = set()
+    for hot, _ in _tables():
+        ticket_id = connection.execute(select(_owner(hot)).order_by(hot.c.id.desc()).limit(1)).scalar()
+        if ticket_id is not None:
+            pinned.add(ticket_id)
+    return pinned
+
+def candidates(connection, days=ARCHIVE_AFTER_DAYS, limit=None):
+    """Ids of the tickets closed more than days ago, oldest id first"""
+    import models
+    ticket = models.Ticket.__table__
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    query = select(ticket.c.id).where(
+        ticket.c.status == 'Fechado',
+        # Closed by bulk updates or imports without a closed_at
+        func.coalesce(ticket.c.closed_at, ticket.c.updated_at) < cutoff
+    ).order_by(ticket.c.id)
+    pinned = _pinned_tickets(connection)
+    if pinned:
+        query = query.where(ticket.c.id.notin_(pinned))
+    if limit:
+        query = query.limit(limit)
+    return [row[0] for row in connection.execute(query)]
+
+def move_tickets(connection, ticket_ids):
+    """Copy tickets, their messages and attachments to the archive and delete
+    the hot rows, in the caller's transaction. Children are deleted first
+    for the foreign keys."""
+    import partitions
+    now = datetime.utcnow()
+    tables = _tables()
+    # Messages of older months have moved to their month tables
+    message_archive = tables[1][1]
+    tables[2:2] = [(partitions.period_table(period), message_archive) for period in partitions.periods(connection)]
+    for hot, cold in tables:
+        columns = [c.name for c in hot.columns]
+        rows = select(*hot.columns).where(_owner(hot).in_(ticket_ids))
+        if 'archived_at' in cold.c:
+            columns.append('archived_at')
+            rows = rows.add_columns(literal(now, cold.c.archived_at.type))
+        connection.execute(insert(cold).from_select(columns, rows))
+    for hot, _ in reversed(tables):
+        connection.execute(delete(hot).where(_owner(hot).in_(ticket_ids)))
+
+def archive_closed(engine, days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH_SIZE, limit=None):
+    """Archive the tickets closed more than days ago, batch_size tickets per
+    transaction so writers are only held up briefly. Yields the size of
+    each batch."""
+    moved = 0
+    while limit is None or moved < limit:
+        size = batch_size if limit is None else min(batch_size, limit - moved)
+        with engine.begin() as connection:
+            ticket_ids = candidates(connection, days, size)
+            if not ticket_ids:
+                return
+            move_tickets(connection, ticket_ids)
+        moved += len(ticket_ids)
+        yield len(ticket_ids)
+
+def register_commands(app, db):
+
+    @app.cli.command('archive-tickets')
+    @click.option('--days', default=ARCHIVE_AFTER_DAYS, show_default=True, help='Closed at least this long ago.')
+    @click.option('--batch-size', default=ARCHIVE_BATCH_SIZE, show_default=True, help='Tickets per transaction.')
+    @click.option('--limit', type=int, help='Stop after this many tickets.')
+    @click.option('--dry-run', is_flag=True, help='Only count the tickets that would move.')
+    def archive_tickets_command(days, batch_size, limit, dry_run):
+        """Move closed tickets, their messages and attachments to the archive tables."""
+        if dry_run:
+            with db.engine.connect() as connection:
+                click.echo(f"{len(candidates(connection, days, limit))} ticket(s) would be archived")
+            return
+        total = 0
+        for count in archive_closed(db.engine, days, batch_size, limit):
+            total += count
+            click.echo(f"Archived {total} ticket(s)")
+        logging.info(f"Archived {total} ticket(s) closed more than {days} days ago")
+        click.echo(f"Done: {total} ticket(s) archived")
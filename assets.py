@@ -0,0 +1,127 @@
+import hashlib
+import os
+import threading
+import click
+from flask import request
+from jinja2 import FileSystemBytecodeCache
+
+# Compiled templates are kept on disk, so a new worker loads bytecode
+# instead of parsing the templates again. `flask prewarm-templates` fills
+# the cache at deploy time. Defaults to <instance>/jinja_cache.
+TEMPLATE_CACHE_DIR = os.environ.get("TEMPLATE_CACHE_DIR", "")
+
+# Static files that get a content hash in their URL (?v=<hash>) and are then
+# served as immutable for a year
+FINGERPRINTED = ('js/', 'css/')
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+HASH_LENGTH = 12
+# Copies written by `flask precompress-static`, served in place of the file
+PRECOMPRESSED_SUFFIXES = ('.gz', '.br')
+
+class AssetManifest:
+    """Content hashes of the fingerprinted static files, computed on first
+    use. In debug mode a changed file gets a new hash on the next lookup."""
+
+    def __init__(self, static_folder, check_mtime=lambda: False):
+        self.static_folder = static_folder
+        self.check_mtime = check_mtime  # Callable, so debug mode set later is seen
+        self._hashes = None  # filename -> (mtime, hash)
+        self._lock = threading.Lock()
+
+    def _hash_file(self, path):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(65536), b''):
+                digest.update(block)
+        return digest.hexdigest()[:HASH_LENGTH]
+
+    def _scan(self):
+        hashes = {}
+        for prefix in FINGERPRINTED:
+            folder = os.path.join(self.static_folder, prefix)
+            if not os.path.isdir(folder):
+                continue
+            for root, _, files in os.walk(folder):
+                for name in files:
+                    if name.endswith(PRECOMPRESSED_SUFFIXES):
+                        continue
+                    path = os.path.join(root, name)
+                    filename = os.path.relpath(path, self.static_folder).replace(os.sep, '/')
+                    hashes[filename] = (os.path.getmtime(path), self._hash_file(path))
+        return hashes
+
+    def load(self):
+        with self._lock:
+            if self._hashes is None:
+                self._hashes = self._scan()
+            return self._hashes
+
+    def version(self, filename):
+        """Get the content hash of a static file, or None if it isn't fingerprinted"""
+        entry = self.load().get(filename)
+        if entry is None:
+            return None
+        if self.check_mtime():
+            path = os.path.join(self.static_folder, filename)
+            mtime = os.path.getmtime(path)
+            if mtime != entry[0]:
+                entry = (mtime, self._hash_file(path))
+                with self._lock:
+                    self._hashes[filename] = entry
+        return entry[1]
+
+    def to_dict(self):
+        return {filename: entry[1] for filename, entry in sorted(self.load().items())}
+
+def init_app(app):
+    """Set up the template bytecode cache and static file fingerprinting"""
+    cache_dir = TEMPLATE_CACHE_DIR or os.path.join(app.instance_path, 'jinja_cache')
+    os.makedirs(cache_dir, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+
+    manifest = AssetManifest(app.static_folder, check_mtime=lambda: app.debug)
+    app.extensions['asset_manifest'] = manifest
+
+    @app.url_defaults
+    def fingerprint_static_urls(endpoint, values):
+        if endpoint == 'static' and 'v' not in values:
+            version = manifest.version(values.get('filename', ''))
+            if version:
+                values['v'] = version
+
+    @app.after_request
+    def cache_fingerprinted_assets(response):
+        # Only a URL with the current hash is immutable; anything else keeps
+        # the default revalidation
+        if request.endpoint == 'static' and response.status_code == 200:
+            version = request.args.get('v')
+            if version and version == manifest.version(request.view_args.get('filename', '')):
+                response.cache_control.public = True
+                response.cache_control.max_age = IMMUTABLE_MAX_AGE
+                response.cache_control.immutable = True
+                response.cache_control.no_cache = None
+        return response
+
+    register_commands(app)
+
+def prewarm_templates(app):
+    """Compile every template into the bytecode cache. Returns the count."""
+    count = 0
+    for name in app.jinja_env.list_templates(extensions=('html',)):
+        app.jinja_env.get_template(name)
+        count += 1
+    return count
+
+def register_commands(app):
+
+    @app.cli.command('prewarm-templates')
+    def prewarm_templates_command():
+        """Compile all templates into the bytecode cache."""
+        count = prewarm_templates(app)
+        click.echo(f"{count} templates compiled")
+
+    @app.cli.command('asset-manifest')
+    def asset_manifest_command():
+        """Show the content hashes used in static file URLs."""
+        for filename, version in app.extensions['asset_manifest'].to_dict().items():
+            click.echo(f"{version}  {filename}")
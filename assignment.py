@@ -0,0 +1,196 @@
+import heapq
+import os
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import event, inspect
+from models import User, Ticket, Message
+import identity
+import ticket_events
+
+# New tickets are given to the technician with the lowest weighted load
+AUTO_ASSIGN = os.environ.get("AUTO_ASSIGN", "0") == "1"
+
+OPEN_STATUSES = ('Aberto', 'Em Andamento')
+PRIORITY_WEIGHTS = {'Alta': 3.0, 'Média': 2.0, 'Baixa': 1.0}
+
+# SLA urgency multiplies the priority weight: overdue tickets weigh double,
+# tickets due within the hour one and a half times
+OVERDUE_FACTOR = 2.0
+DUE_SOON_FACTOR = 1.5
+DUE_SOON_SECONDS = 3600
+
+# Urgency is taken when a ticket changes, so the index is rebuilt from the
+# database every REFRESH_INTERVAL seconds to account for the clock moving on
+# (and for assignments that were rolled back)
+REFRESH_INTERVAL = float(os.environ.get("ASSIGNMENT_REFRESH_INTERVAL", 300))
+
+def ticket_weight(priority, sla_due, now=None):
+    """Load a ticket adds to its technician"""
+    weight = PRIORITY_WEIGHTS.get(priority, 1.0)
+    if sla_due is not None:
+        remaining = (sla_due - (now or datetime.utcnow())).total_seconds()
+        if remaining < 0:
+            weight *= OVERDUE_FACTOR
+        elif remaining < DUE_SOON_SECONDS:
+            weight *= DUE_SOON_FACTOR
+    return weight
+
+class LoadIndex:
+    """Weighted open-ticket load per technician, with a min-heap of
+    (load, technician) for O(log n) picks.
+
+    Every load change pushes a new heap entry; outdated entries are
+    recognized by their version and dropped when they reach the top."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._load = {}      # technician id -> weighted load
+        self._version = {}   # technician id -> version of its current heap entry
+        self._tickets = {}   # ticket id -> (technician id, weight)
+        self._heap = []
+        self._pending = None  # changes committed while a load is running
+        self.loaded_at = None
+        self.stale = False
+
+    def __len__(self):
+        return len(self._load)
+
+    def load_of(self, technician_id):
+        with self._lock:
+            return self._load.get(technician_id)
+
+    def _push(self, technician_id):
+        version = self._version.get(technician_id, 0) + 1
+        self._version[technician_id] = version
+        heapq.heappush(self._heap, (self._load[technician_id], technician_id, version))
+
+    def _compact(self):
+        # Outdated entries are otherwise only removed from the top
+        if len(self._heap) > 4 * len(self._load) + 64:
+            self._heap = [(self._load[t], t, self._version[t]) for t in self._load]
+            heapq.heapify(self._heap)
+
+    def _unassign(self, ticket_id):
+        previous = self._tickets.pop(ticket_id, None)
+        if previous and previous[0] in self._load:
+            self._load[previous[0]] -= previous[1]
+            self._push(previous[0])
+
+    def _assign(self, ticket_id, technician_id, weight):
+        self._unassign(ticket_id)
+        if technician_id in self._load:
+            self._tickets[ticket_id] = (technician_id, weight)
+            self._load[technician_id] += weight
+            self._push(technician_id)
+
+    def begin_load(self):
+        """Start buffering changes; call before reading the rows for load()"""
+        with self._lock:
+            if self._pending is None:
+                self._pending = []
+
+    def load(self, technician_ids, tickets, now=None):
+        """Replace the contents with the given technicians and their open
+        (id, assigned_to, priority, sla_due) tickets, then replay the
+        changes committed since begin_load()"""
+        now = now or datetime.utcnow()
+        with self._lock:
+            self._load = {t: 0.0 for t in technician_ids}
+            self._tickets = {}
+            for ticket_id, technician_id, priority, sla_due in tickets:
+                if technician_id in self._load:
+                    weight = ticket_weight(priority, sla_due, now)
+                    self._tickets[ticket_id] = (technician_id, weight)
+                    self._load[technician_id] += weight
+            self._version = {t: 1 for t in self._load}
+            self._heap = [(load, t, 1) for t, load in self._load.items()]
+            heapq.heapify(self._heap)
+            self._apply(self._pending or [], now)
+            self._pending = None
+            self.loaded_at = time.monotonic()
+            self.stale = False
+
+    def _apply(self, changes, now):
+        for change in changes:
+            if change.action == 'deleted' or change.status not in OPEN_STATUSES or change.assigned_to is None:
+                self._unassign(change.ticket_id)
+            else:
+                self._assign(change.ticket_id, change.assigned_to, ticket_weight(change.priority, change.sla_due, now))
+        self._compact()
+
+    def apply(self, changes):
+        """Apply committed TicketChange events"""
+        with self._lock:
+            if self._pending is not None:
+                self._pending.extend(changes)
+            elif self.loaded_at is not None:
+                self._apply(changes, datetime.utcnow())
+
+    def pick(self, ticket_id, weight):
+        """Reserve the least loaded technician for a ticket and return its id,
+        or None when there are no technicians"""
+        with self._lock:
+            while self._heap:
+                load, technician_id, version = self._heap[0]
+                if self._version.get(technician_id) == version:
+                    self._assign(ticket_id, technician_id, weight)
+                    return technician_id
+                heapq.heappop(self._heap)
+            return None
+
+    def needs_refresh(self):
+        return (self.loaded_at is None or self.stale
+                or time.monotonic() - self.loaded_at > REFRESH_INTERVAL)
+
+index = LoadIndex()
+
+def ensure_loaded(session):
+    """Build the index on first use, and rebuild it when it is out of date"""
+    if not index.needs_refresh():
+        return
+    index.begin_load()
+    technicians = [row.id for row in session.query(User.id).filter(User.role == 'Técnico', User.active.is_(True))]
+    tickets = session.query(
+        Ticket.id, Ticket.assigned_to, Ticket.priority, Ticket.sla_due
+    ).filter(Ticket.status.in_(OPEN_STATUSES), Ticket.assigned_to.isnot(None)).all()
+    index.load(technicians, tickets)
+
+def auto_assign(session, tickets, actor_id=None):
+    """Assign flushed, unassigned tickets to the least loaded technicians and
+    add a system message to each. Returns the technician ids (None where no
+    technician was available). The caller commits."""
+    ensure_loaded(session)
+    now = datetime.utcnow()
+    assigned = []
+    for ticket in tickets:
+        technician_id = None
+        if ticket.assigned_to is None and ticket.status in OPEN_STATUSES:
+            technician_id = index.pick(ticket.id, ticket_weight(ticket.priority, ticket.sla_due, now))
+        if technician_id is not None:
+            technician = identity.lookup(technician_id)
+            ticket.assigned_to = technician_id
+            session.add(Message(
+                content=f"Chamado atribuído automaticamente para {technician.name}",
+                ticket_id=ticket.id,
+                user_id=actor_id or ticket.creator_id,
+                message_type='system'
+            ))
+        assigned.append(technician_id)
+    return assigned
+
+@ticket_events.subscribe
+def _on_ticket_changes(changes):
+    index.apply(changes)
+
+# Technicians joining, leaving or changing role are picked up on the next rebuild
+@event.listens_for(User, 'after_insert')
+@event.listens_for(User, 'after_delete')
+def _on_user_added_or_removed(mapper, connection, target):
+    index.stale = True
+
+@event.listens_for(User, 'after_update')
+def _on_user_update(mapper, connection, target):
+    state = inspect(target)
+    if state.attrs.role.history.has_changes() or state.attrs.active.history.has_changes():
+        index.stale = True
@@ -1,14 +1,13 @@
-from flask_jwt_extended import verify_jwt_in_request, get_jwt_identity
+from flask_jwt_extended import verify_jwt_in_request
 from functools import wraps
 from flask import jsonify
-from models import User
+from identity import current_identity
 
 def admin_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
         verify_jwt_in_request()
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_identity()
         
         if not user or user.role != 'Administrador':
             return jsonify({'error': 'Admin access required'}), 403
@@ -20,8 +19,7 @@ def tech_or_admin_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
         verify_jwt_in_request()
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_identity()
         
         if not user or user.role not in ['Técnico', 'Administrador']:
             return jsonify({'error': 'Technical or admin access required'}), 403
@@ -33,8 +31,7 @@ def manager_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
         verify_jwt_in_request()
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_identity()
         
         if not user or user.role not in ['Administrador', 'Diretoria']:
             return jsonify({'error': 'Management access required'}), 403
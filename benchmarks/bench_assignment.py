@@ -0,0 +1,128 @@
+"""Auto-assignment simulation for assignment.LoadIndex.
+
+Loads an index with technicians and open tickets, then assigns a stream of
+new tickets while a share of the existing ones is closed or reassigned,
+the way a busy day looks. Compares a pick from the index with the scan over
+all open tickets it replaces, and prints timings and the resulting load
+spread as JSON:
+
+    python benchmarks/bench_assignment.py --technicians 200 --tickets 50000 --new 10000
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PRIORITIES = ('Alta', 'Média', 'Baixa')
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def random_ticket(rng, now):
+    priority = rng.choice(PRIORITIES)
+    return priority, now + timedelta(hours=rng.uniform(-6, 24))
+
+def scan_pick(technicians, tickets, assignment, now):
+    """What picking costs without the index: sum every open ticket per technician"""
+    load = {t: 0.0 for t in technicians}
+    for technician_id, priority, sla_due in tickets.values():
+        load[technician_id] += assignment.ticket_weight(priority, sla_due, now)
+    return min(load, key=lambda t: (load[t], t))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--technicians', type=int, default=200)
+    parser.add_argument('--tickets', type=int, default=50000)
+    parser.add_argument('--new', type=int, default=10000, help='tickets assigned through the index')
+    parser.add_argument('--scan-picks', type=int, default=50, help='picks timed with the full scan')
+    parser.add_argument('--churn', type=float, default=0.5, help='closed or reassigned tickets per new one')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    os.environ.setdefault('DATABASE_URL', 'sqlite://')
+    import assignment
+    import ticket_events
+
+    rng = random.Random(args.seed)
+    now = datetime.utcnow()
+    technicians = list(range(1, args.technicians + 1))
+    tickets = {}
+    for ticket_id in range(1, args.tickets + 1):
+        tickets[ticket_id] = (rng.choice(technicians),) + random_ticket(rng, now)
+
+    index = assignment.LoadIndex()
+    started = time.perf_counter()
+    index.load(technicians, [(i, t, p, s) for i, (t, p, s) in tickets.items()], now)
+    load_seconds = time.perf_counter() - started
+
+    pick_times, apply_times = [], []
+    next_id = args.tickets + 1
+    for _ in range(args.new):
+        priority, sla_due = random_ticket(rng, now)
+        started = time.perf_counter()
+        technician_id = index.pick(next_id, assignment.ticket_weight(priority, sla_due, now))
+        pick_times.append(time.perf_counter() - started)
+        tickets[next_id] = (technician_id, priority, sla_due)
+        next_id += 1
+
+        # Committed changes elsewhere: tickets closed or moved to someone else
+        changes = []
+        while rng.random() < args.churn / (1 + args.churn) and tickets:
+            ticket_id = rng.randrange(1, next_id)
+            if ticket_id not in tickets:
+                continue
+            technician_id, priority, sla_due = tickets[ticket_id]
+            if rng.random() < 0.7:
+                del tickets[ticket_id]
+                status = 'Fechado'
+            else:
+                technician_id = rng.choice(technicians)
+                tickets[ticket_id] = (technician_id, priority, sla_due)
+                status = 'Em Andamento'
+            changes.append(ticket_events.TicketChange(
+                'updated', ticket_id, '', '', '', status, priority, technician_id, 1, sla_due, {}
+            ))
+        if changes:
+            started = time.perf_counter()
+            index.apply(changes)
+            apply_times.append((time.perf_counter() - started) / len(changes))
+
+    scan_times = []
+    for _ in range(args.scan_picks):
+        started = time.perf_counter()
+        scan_pick(technicians, tickets, assignment, now)
+        scan_times.append(time.perf_counter() - started)
+
+    loads = [index.load_of(t) for t in technicians]
+    pick_mean = statistics.mean(pick_times)
+    print(json.dumps({
+        'technicians': args.technicians,
+        'open_tickets': len(tickets),
+        'assigned': args.new,
+        'load_seconds': round(load_seconds, 4),
+        'pick_us': {
+            'mean': round(pick_mean * 1e6, 2),
+            'p50': round(percentile(pick_times, 50) * 1e6, 2),
+            'p99': round(percentile(pick_times, 99) * 1e6, 2),
+        },
+        'apply_us_per_change': round(statistics.mean(apply_times) * 1e6, 2) if apply_times else None,
+        'scan_pick_ms': round(statistics.mean(scan_times) * 1e3, 2),
+        'speedup': round(statistics.mean(scan_times) / pick_mean, 1),
+        'load_spread': {
+            'min': round(min(loads), 1),
+            'max': round(max(loads), 1),
+            'stdev': round(statistics.pstdev(loads), 2),
+        },
+    }, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Response compression benchmark (compression.py).
+
+Seeds a temporary SQLite database with tickets, then requests the large
+API responses (ticket list, dashboard stats, CSV export) and the static
+scripts with each encoding, and prints bytes on the wire and CPU per request
+as JSON. Static files are precompressed into a copy of static/ first, so
+their numbers show what serving the stored copies costs:
+
+    python benchmarks/bench_compression.py --tickets 2000 --requests 20
+    COMPRESS_GZIP_LEVEL=1 python benchmarks/bench_compression.py
+
+brotli is only measured when the brotli package is installed.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+API_PATHS = ('/api/tickets', '/api/dashboard/stats', '/api/reports/export')
+STATIC_PATHS = ('/static/js/tickets.js', '/static/js/socket.js', '/static/js/app.js', '/static/css/custom.css')
+
+def measure(client, path, headers, requests):
+    """(bytes, CPU ms per request, wall ms per request, content encoding)"""
+    cpu, wall = [], []
+    size, encoding = 0, None
+    for _ in range(requests):
+        start_cpu, start_wall = time.process_time(), time.perf_counter()
+        response = client.get(path, headers=headers)
+        body = response.get_data()
+        cpu.append((time.process_time() - start_cpu) * 1000)
+        wall.append((time.perf_counter() - start_wall) * 1000)
+        size, encoding = len(body), response.headers.get('Content-Encoding')
+        response.close()
+    return size, statistics.median(cpu), statistics.median(wall), encoding
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tickets', type=int, default=2000)
+    parser.add_argument('--requests', type=int, default=20, help='requests per path and encoding')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp, 'compression.db')}"
+    os.environ.pop('AUTO_MIGRATE', None)
+    sys.path.insert(0, ROOT)
+
+    import logging
+    logging.disable(logging.INFO)
+    import app as helpdesk
+    import routes  # noqa: F401 (registers the API routes)
+    import bootstrap
+    import compression
+    import passwords
+    from models import User, Ticket
+
+    with helpdesk.app.app_context():
+        bootstrap.upgrade_schema(helpdesk.db)
+        admin = User(username='admin', password_hash=passwords.hash_password('bench123'),
+                     role='Administrador', email='admin@company.com', name='Admin')
+        helpdesk.db.session.add(admin)
+        helpdesk.db.session.flush()
+        helpdesk.db.session.add_all([
+            Ticket(title=f'Chamado {i}', description=f'Impressora do setor {i % 40} sem conexão com a rede',
+                   department=('TI', 'RH', 'Financeiro')[i % 3], priority=('Alta', 'Média', 'Baixa')[i % 3],
+                   status=('Aberto', 'Em Andamento', 'Resolvido', 'Fechado')[i % 4], creator_id=admin.id)
+            for i in range(args.tickets)
+        ])
+        helpdesk.db.session.commit()
+
+    static_copy = os.path.join(tmp, 'static')
+    shutil.copytree(helpdesk.app.static_folder, static_copy)
+    list(compression.precompress_static(static_copy))
+    helpdesk.app.static_folder = static_copy
+
+    client = helpdesk.app.test_client()
+    token = client.post('/api/login', json={'username': 'admin', 'password': 'bench123'}).get_json()['access_token']
+
+    encodings = ('identity',) + compression.available_encodings()
+    results = []
+    for path in API_PATHS + STATIC_PATHS:
+        auth = {'Authorization': f'Bearer {token}'} if path.startswith('/api/') else {}
+        baseline = None
+        for encoding in encodings:
+            size, cpu, wall, served = measure(client, path, dict(auth, **{'Accept-Encoding': encoding}), args.requests)
+            if baseline is None:
+                baseline = (size, cpu)
+            results.append({
+                'path': path,
+                'accept_encoding': encoding,
+                'content_encoding': served,
+                'bytes': size,
+                'saved_pct': round(100 * (1 - size / baseline[0]), 1) if baseline[0] else 0.0,
+                'cpu_ms': round(cpu, 3),
+                'cpu_overhead_ms': round(cpu - baseline[1], 3),
+                'wall_ms': round(wall, 3),
+            })
+
+    print(json.dumps({
+        'tickets': args.tickets,
+        'requests': args.requests,
+        'gzip_level': compression.GZIP_LEVEL,
+        'brotli_quality': compression.BROTLI_QUALITY if compression.brotli else None,
+        'min_size': compression.MIN_SIZE,
+        'results': results,
+    }, indent=2))
+    shutil.rmtree(tmp, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
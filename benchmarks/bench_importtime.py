@@ -0,0 +1,119 @@
+"""Import-time profile of the application modules.
+
+Runs `python -X importtime -c "import <module>"` in fresh interpreters, keeps
+the best total of several runs and lists the most expensive imports. Results
+can be compared with a stored baseline to catch startup regressions:
+
+    python benchmarks/bench_importtime.py simple_app --update-baseline
+    python benchmarks/bench_importtime.py simple_app --check
+
+--check exits with status 1 when the total grows beyond --tolerance or a
+top-level third-party package that wasn't imported before shows up (new
+application modules don't count). Re-record the baseline only when a
+change is meant to move it, and say why in that commit.
+"""
+import argparse
+import importlib.machinery
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_FILE = os.path.join(ROOT, 'benchmarks', 'importtime_baseline.json')
+
+LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)')
+
+def profile(module, database_url):
+    """Return {module: (self_us, cumulative_us)} for one interpreter run"""
+    env = dict(os.environ, DATABASE_URL=database_url)
+    env.pop('AUTO_MIGRATE', None)
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    timings = {}
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            timings[match.group(4)] = (int(match.group(1)), int(match.group(2)))
+    return timings
+
+def is_repo_module(name):
+    """Whether a top-level module is one of the application's own"""
+    return importlib.machinery.PathFinder.find_spec(name, [ROOT]) is not None
+
+def third_party_packages(timings):
+    """Top-level packages that are neither stdlib nor the application's
+    own modules, the ones worth watching for regressions"""
+    names = {name.split('.')[0] for name in timings}
+    ignored = {'sitecustomize', 'usercustomize'}
+    return sorted(n for n in names if n not in sys.stdlib_module_names and n not in ignored
+                  and not n.startswith('_') and not is_repo_module(n))
+
+def build_report(module, runs, top):
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = f"sqlite:///{os.path.join(tmp, 'importtime.db')}"
+        samples = [profile(module, database_url) for _ in range(runs)]
+
+    best = min(samples, key=lambda t: t[module][1])
+    heaviest = sorted(best.items(), key=lambda item: item[1][0], reverse=True)[:top]
+    return {
+        'module': module,
+        'total_ms': round(best[module][1] / 1000, 2),
+        'self_ms': round(best[module][0] / 1000, 2),
+        'module_count': len(best),
+        'packages': third_party_packages(best),
+        'heaviest_self_ms': {name: round(t[0] / 1000, 2) for name, t in heaviest},
+    }
+
+def load_baseline():
+    if not os.path.exists(BASELINE_FILE):
+        return {}
+    with open(BASELINE_FILE) as f:
+        return json.load(f)
+
+def check(report, baseline, tolerance):
+    """Return a list of regression messages (empty when within budget)"""
+    problems = []
+    limit = baseline['total_ms'] * (1 + tolerance)
+    if report['total_ms'] > limit:
+        problems.append(f"total {report['total_ms']}ms exceeds baseline {baseline['total_ms']}ms +{tolerance:.0%}")
+    new_packages = sorted(set(report['packages']) - set(baseline['packages']))
+    if new_packages:
+        problems.append(f"new packages imported at startup: {', '.join(new_packages)}")
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('module', nargs='?', default='simple_app')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--check', action='store_true')
+    parser.add_argument('--update-baseline', action='store_true')
+    args = parser.parse_args()
+
+    report = build_report(args.module, args.runs, args.top)
+    baselines = load_baseline()
+
+    if args.update_baseline:
+        baselines[args.module] = {k: report[k] for k in ('total_ms', 'module_count', 'packages')}
+        with open(BASELINE_FILE, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+    if args.check:
+        baseline = baselines.get(args.module)
+        if not baseline:
+            sys.exit(f"No baseline recorded for {args.module}")
+        report['regressions'] = check(report, baseline, args.tolerance)
+
+    print(json.dumps(report, indent=2))
+    if report.get('regressions'):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Login storm benchmark for POST /api/login (app.py).
+
+Seeds a temporary SQLite database with users, then fires concurrent logins
+through the Flask test client, the way a shift start hits the server, and
+prints throughput and latency percentiles as JSON:
+
+    python benchmarks/bench_login.py --users 50 --logins 400 --concurrency 32
+    python benchmarks/bench_login.py --no-cache --hash-method pbkdf2:sha256:600000
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--logins', type=int, default=400)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--hash-method', default=None)
+    parser.add_argument('--no-cache', action='store_true')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp, 'login.db')}"
+    os.environ.pop('AUTO_MIGRATE', None)
+    if args.hash_method:
+        os.environ['PASSWORD_HASH_METHOD'] = args.hash_method
+    if args.no_cache:
+        os.environ['LOGIN_CACHE_TTL'] = '0'
+    sys.path.insert(0, ROOT)
+
+    import logging
+    logging.disable(logging.INFO)
+    import app as helpdesk
+    import bootstrap
+    import passwords
+    from models import User
+
+    with helpdesk.app.app_context():
+        bootstrap.upgrade_schema(helpdesk.db)
+        password_hash = passwords.hash_password('storm123')
+        helpdesk.db.session.add_all([
+            User(username=f'user{i}', password_hash=password_hash, role='Colaborador',
+                 email=f'user{i}@company.com', name=f'User {i}')
+            for i in range(args.users)
+        ])
+        helpdesk.db.session.commit()
+
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+    counter = iter(range(args.logins))
+
+    def worker():
+        client = helpdesk.app.test_client()
+        while True:
+            with lock:
+                n = next(counter, None)
+            if n is None:
+                return
+            start = time.perf_counter()
+            response = client.post('/api/login', json={'username': f'user{n % args.users}', 'password': 'storm123'})
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                latencies.append(elapsed)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    threads = [threading.Thread(target=worker) for _ in range(args.concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    duration = time.perf_counter() - started
+
+    print(json.dumps({
+        'logins': args.logins,
+        'concurrency': args.concurrency,
+        'hash_method': passwords.method_prefix(),
+        'hash_workers': passwords.HASH_WORKERS,
+        'cache_ttl': passwords.CACHE_TTL,
+        'statuses': statuses,
+        'throughput_per_s': round(args.logins / duration, 1),
+        'latency_ms': {
+            'mean': round(statistics.mean(latencies), 2),
+            'p50': round(percentile(latencies, 50), 2),
+            'p95': round(percentile(latencies, 95), 2),
+            'p99': round(percentile(latencies, 99), 2),
+        },
+    }, indent=2))
+
+if __name__ == '__main__':
+    main()
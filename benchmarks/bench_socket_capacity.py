@@ -0,0 +1,319 @@
+"""Socket.IO connection capacity per SOCKETIO_ASYNC_MODE (app.py).
+
+Starts the server once per async mode on a seeded SQLite database, then
+opens authenticated WebSocket connections in steps and keeps them alive
+(answering pings), the way idle chat tabs sit on the server. After each
+step it records connect latency, failures, the server's threads and
+resident memory, and how long an HTTP request takes while all those
+sockets are open. Prints JSON:
+
+    python benchmarks/bench_socket_capacity.py --modes threading,eventlet --levels 250,500,1000,2000
+
+Modes whose package is not installed are skipped.
+"""
+import argparse
+import asyncio
+import base64
+import http.client
+import importlib.util
+import json
+import os
+import resource
+import socket
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVER_SCRIPT = (
+    "import sys; sys.path.insert(0, {root!r})\n"
+    "import app as helpdesk, concurrency\n"
+    "import logging; logging.disable(logging.WARNING)\n"
+    "helpdesk.socketio.run(helpdesk.app, host='127.0.0.1', port={port}, log_output=False,"
+    " allow_unsafe_werkzeug=True, **concurrency.server_options())\n"
+)
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return True
+        except OSError:
+            time.sleep(0.1)
+    return False
+
+def process_stats(pid):
+    """(threads, resident MB) of a process, from /proc"""
+    threads, rss = None, None
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('Threads:'):
+                    threads = int(line.split()[1])
+                elif line.startswith('VmRSS:'):
+                    rss = round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return threads, rss
+
+def http_request(port, method, path, token=None, body=None, timeout=60):
+    headers = {'Authorization': f'Bearer {token}'} if token else {}
+    payload = None
+    if body is not None:
+        payload = json.dumps(body)
+        headers['Content-Type'] = 'application/json'
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+    try:
+        connection.request(method, path, body=payload, headers=headers)
+        response = connection.getresponse()
+        return response.status, response.read()
+    finally:
+        connection.close()
+
+# Just enough of RFC 6455 for an Engine.IO client: masked text frames out,
+# unmasked frames in
+
+def encode_frame(text, opcode=0x1):
+    payload = text.encode() if isinstance(text, str) else text
+    mask = os.urandom(4)
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('!BB', 0x80 | opcode, 0x80 | length)
+    elif length < 65536:
+        header = struct.pack('!BBH', 0x80 | opcode, 0x80 | 126, length)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 0x80 | 127, length)
+    masked = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+    return header + mask + masked
+
+async def read_frame(reader):
+    first, second = await reader.readexactly(2)
+    length = second & 0x7f
+    if length == 126:
+        length = struct.unpack('!H', await reader.readexactly(2))[0]
+    elif length == 127:
+        length = struct.unpack('!Q', await reader.readexactly(8))[0]
+    if second & 0x80:
+        mask = await reader.readexactly(4)
+        data = bytes(b ^ mask[i % 4] for i, b in enumerate(await reader.readexactly(length)))
+    else:
+        data = await reader.readexactly(length)
+    return first & 0x0f, data
+
+class ChatSocket:
+    """One authenticated Socket.IO connection over WebSocket"""
+
+    def __init__(self):
+        self.reader = None
+        self.writer = None
+        self.task = None
+
+    async def connect(self, port, token):
+        self.reader, self.writer = await asyncio.open_connection('127.0.0.1', port)
+        key = base64.b64encode(os.urandom(16)).decode()
+        self.writer.write((
+            f"GET /socket.io/?EIO=4&transport=websocket HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\n"
+            f"Upgrade: websocket\r\nConnection: Upgrade\r\nSec-WebSocket-Key: {key}\r\n"
+            f"Sec-WebSocket-Version: 13\r\n\r\n"
+        ).encode())
+        headers = await self.reader.readuntil(b'\r\n\r\n')
+        if b' 101 ' not in headers.split(b'\r\n', 1)[0]:
+            raise ConnectionError(headers.split(b'\r\n', 1)[0].decode())
+        _, packet = await read_frame(self.reader)  # Engine.IO open: 0{"sid": ...}
+        if not packet.startswith(b'0'):
+            raise ConnectionError(f"Unexpected open packet {packet[:40]!r}")
+        self.writer.write(encode_frame('40' + json.dumps({'token': token})))
+        while True:
+            opcode, packet = await read_frame(self.reader)
+            if packet.startswith(b'40'):
+                break
+            if packet.startswith(b'44') or opcode == 0x8:
+                raise ConnectionError(f"Rejected: {packet[:80]!r}")
+            await self._answer(opcode, packet)
+        self.task = asyncio.ensure_future(self._keepalive())
+
+    async def _answer(self, opcode, packet):
+        if opcode == 0x9:
+            self.writer.write(encode_frame(packet, opcode=0xA))
+        elif packet == b'2':  # Engine.IO ping
+            self.writer.write(encode_frame('3'))
+
+    async def _keepalive(self):
+        try:
+            while True:
+                opcode, packet = await read_frame(self.reader)
+                if opcode == 0x8:
+                    return
+                await self._answer(opcode, packet)
+        except (asyncio.IncompleteReadError, ConnectionError, OSError):
+            return
+
+    def close(self):
+        if self.task:
+            self.task.cancel()
+        if self.writer:
+            self.writer.close()
+
+async def open_sockets(port, token, count, concurrency, timeout):
+    """Open count sockets, at most concurrency at a time. Returns the open
+    sockets, connect latencies (ms) and failures."""
+    limit = asyncio.Semaphore(concurrency)
+    opened, latencies, failures = [], [], []
+
+    async def one():
+        async with limit:
+            chat = ChatSocket()
+            start = time.perf_counter()
+            try:
+                await asyncio.wait_for(chat.connect(port, token), timeout)
+            except Exception as e:
+                chat.close()
+                failures.append(type(e).__name__)
+                return
+            latencies.append((time.perf_counter() - start) * 1000)
+            opened.append(chat)
+
+    await asyncio.gather(*(one() for _ in range(count)))
+    return opened, latencies, failures
+
+async def probe(port, token, requests, timeout):
+    """Latencies (ms) of sequential HTTP requests made while the sockets are
+    open, and the number that failed or timed out"""
+    samples, failed = [], 0
+    for _ in range(requests):
+        start = time.perf_counter()
+        try:
+            status, _ = await asyncio.to_thread(http_request, port, 'GET', '/api/dashboard/stats', token, None, timeout)
+        except OSError:
+            status = None
+        if status == 200:
+            samples.append((time.perf_counter() - start) * 1000)
+        else:
+            failed += 1
+    return samples, failed
+
+async def measure_mode(port, pid, token, levels, args):
+    sockets = []
+    steps = []
+    for level in levels:
+        wanted = level - len(sockets)
+        started = time.perf_counter()
+        opened, latencies, failures = await open_sockets(port, token, wanted, args.connect_concurrency,
+                                                         args.timeout)
+        sockets.extend(opened)
+        elapsed = time.perf_counter() - started
+        await asyncio.sleep(args.settle)
+        alive = sum(1 for chat in sockets if not chat.task.done())
+        threads, rss = process_stats(pid)
+        probes, probe_failures = await probe(port, token, args.probes, args.timeout)
+        steps.append({
+            'target': level,
+            'open': alive,
+            'failed': len(failures),
+            'failure_kinds': {kind: failures.count(kind) for kind in set(failures)},
+            'connects_per_s': round(len(opened) / elapsed, 1) if elapsed else None,
+            'connect_ms': {
+                'p50': round(percentile(latencies, 50), 2),
+                'p95': round(percentile(latencies, 95), 2),
+                'p99': round(percentile(latencies, 99), 2),
+            } if latencies else None,
+            'server_threads': threads,
+            'server_rss_mb': rss,
+            'probe_ms': {
+                'mean': round(statistics.mean(probes), 2),
+                'p95': round(percentile(probes, 95), 2),
+            } if probes else None,
+            'probe_failures': probe_failures,
+        })
+        print(f"{level} sockets: {alive} open, {len(failures)} failed, {threads} threads, {rss} MB", file=sys.stderr)
+        if len(failures) > wanted / 2:
+            break
+    for chat in sockets:
+        chat.close()
+    return steps
+
+def run_mode(mode, database_url, levels, args):
+    port = free_port()
+    env = dict(os.environ, DATABASE_URL=database_url, SOCKETIO_ASYNC_MODE=mode)
+    server = subprocess.Popen([sys.executable, '-c', SERVER_SCRIPT.format(root=ROOT, port=port)], env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if not wait_for_port(port):
+            return {'error': 'server did not start'}
+        status, body = http_request(port, 'POST', '/api/login', body={'username': 'admin', 'password': 'capacity123'})
+        if status != 200:
+            return {'error': f'login failed with {status}'}
+        token = json.loads(body)['access_token']
+        threads, rss = process_stats(server.pid)
+        return {
+            'idle': {'server_threads': threads, 'server_rss_mb': rss},
+            'steps': asyncio.run(measure_mode(port, server.pid, token, levels, args)),
+        }
+    finally:
+        server.terminate()
+        try:
+            server.wait(10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modes', default='threading,eventlet,gevent')
+    parser.add_argument('--levels', default='250,500,1000,2000', help='open sockets after each step')
+    parser.add_argument('--connect-concurrency', type=int, default=100)
+    parser.add_argument('--timeout', type=float, default=10.0, help='seconds per connect or probe request')
+    parser.add_argument('--settle', type=float, default=1.0, help='seconds to wait after each step')
+    parser.add_argument('--probes', type=int, default=20, help='HTTP requests timed per step')
+    args = parser.parse_args()
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    levels = sorted(int(level) for level in args.levels.split(','))
+
+    tmp = tempfile.mkdtemp()
+    database_url = f"sqlite:///{os.path.join(tmp, 'capacity.db')}"
+    os.environ['DATABASE_URL'] = database_url
+    os.environ.pop('AUTO_MIGRATE', None)
+    os.environ.pop('SOCKETIO_ASYNC_MODE', None)
+    sys.path.insert(0, ROOT)
+
+    import logging
+    logging.disable(logging.INFO)
+    import app as helpdesk
+    import bootstrap
+    import passwords
+    from models import User
+
+    with helpdesk.app.app_context():
+        bootstrap.upgrade_schema(helpdesk.db)
+        helpdesk.db.session.add(User(username='admin', password_hash=passwords.hash_password('capacity123'),
+                                     role='Administrador', email='admin@company.com', name='Admin'))
+        helpdesk.db.session.commit()
+
+    results = {}
+    for mode in (m.strip() for m in args.modes.split(',') if m.strip()):
+        if mode != 'threading' and importlib.util.find_spec(mode) is None:
+            results[mode] = {'skipped': f'{mode} is not installed'}
+            continue
+        print(f"Mode {mode}", file=sys.stderr)
+        results[mode] = run_mode(mode, database_url, levels, args)
+
+    print(json.dumps({'levels': levels, 'fd_limit': hard, 'modes': results}, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""SQLite under concurrent chat writes and dashboard reads (db_tuning.py).
+
+Seeds a temporary SQLite database, then for --seconds runs writer threads
+posting chat messages and reader threads loading the dashboard stats and
+ticket messages, all through the API. Prints JSON with throughput, latency
+percentiles and failed requests (e.g. "database is locked") per side.
+Compare the tuned defaults with SQLite's own settings:
+
+    python benchmarks/bench_sqlite_concurrency.py --writers 4 --readers 8
+    SQLITE_JOURNAL_MODE=DELETE SQLITE_SYNCHRONOUS=FULL SQLITE_MMAP_SIZE=0 \\
+        python benchmarks/bench_sqlite_concurrency.py --writers 4 --readers 8
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def summarize(latencies, failures, seconds):
+    return {
+        'requests': len(latencies) + failures,
+        'failed': failures,
+        'per_s': round(len(latencies) / seconds, 1),
+        'latency_ms': {
+            'p50': round(percentile(latencies, 50), 2),
+            'p95': round(percentile(latencies, 95), 2),
+            'p99': round(percentile(latencies, 99), 2),
+            'max': round(max(latencies), 2),
+        } if latencies else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tickets', type=int, default=2000)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10.0)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp, 'concurrency.db')}"
+    os.environ.pop('AUTO_MIGRATE', None)
+    sys.path.insert(0, ROOT)
+
+    import logging
+    logging.disable(logging.WARNING)
+    import app as helpdesk
+    import routes  # noqa: F401 (registers the API routes)
+    import bootstrap
+    import db_tuning
+    import passwords
+    from models import User, Ticket
+
+    with helpdesk.app.app_context():
+        bootstrap.upgrade_schema(helpdesk.db)
+        admin = User(username='admin', password_hash=passwords.hash_password('bench123'),
+                     role='Administrador', email='admin@company.com', name='Admin')
+        helpdesk.db.session.add(admin)
+        helpdesk.db.session.flush()
+        helpdesk.db.session.add_all([
+            Ticket(title=f'Chamado {i}', description=f'Impressora do setor {i % 40} sem conexão com a rede',
+                   department=('TI', 'RH', 'Financeiro')[i % 3], priority=('Alta', 'Média', 'Baixa')[i % 3],
+                   status=('Aberto', 'Em Andamento', 'Resolvido', 'Fechado')[i % 4], creator_id=admin.id)
+            for i in range(args.tickets)
+        ])
+        helpdesk.db.session.commit()
+
+    client = helpdesk.app.test_client()
+    token = client.post('/api/login', json={'username': 'admin', 'password': 'bench123'}).get_json()['access_token']
+    headers = {'Authorization': f'Bearer {token}'}
+
+    deadline = time.perf_counter() + args.seconds
+    results = {'write': ([], [0]), 'read': ([], [0])}
+    lock = threading.Lock()
+
+    def worker(side, index):
+        client = helpdesk.app.test_client()
+        latencies, failures = [], 0
+        n = 0
+        while time.perf_counter() < deadline:
+            ticket_id = 1 + (index * 7919 + n) % args.tickets
+            n += 1
+            start = time.perf_counter()
+            if side == 'write':
+                response = client.post(f'/api/tickets/{ticket_id}/messages', headers=headers,
+                                       json={'content': f'Mensagem {n} do cliente {index}'})
+                ok = response.status_code == 201
+            elif n % 2:
+                response = client.get('/api/dashboard/stats', headers=headers)
+                ok = response.status_code == 200
+            else:
+                response = client.get(f'/api/tickets/{ticket_id}/messages', headers=headers)
+                ok = response.status_code == 200
+            response.close()
+            if ok:
+                latencies.append((time.perf_counter() - start) * 1000)
+            else:
+                failures += 1
+        with lock:
+            results[side][0].extend(latencies)
+            results[side][1][0] += failures
+
+    threads = [threading.Thread(target=worker, args=('write', i)) for i in range(args.writers)]
+    threads += [threading.Thread(target=worker, args=('read', i)) for i in range(args.readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with helpdesk.app.app_context():
+        with helpdesk.db.engine.connect() as connection:
+            journal_mode = connection.exec_driver_sql('PRAGMA journal_mode').scalar()
+
+    print(json.dumps({
+        'tickets': args.tickets,
+        'writers': args.writers,
+        'readers': args.readers,
+        'seconds': args.seconds,
+        'journal_mode': journal_mode,
+        'synchronous': db_tuning.SQLITE_SYNCHRONOUS,
+        'busy_timeout_ms': db_tuning.SQLITE_BUSY_TIMEOUT_MS,
+        'mmap_size': db_tuning.SQLITE_MMAP_SIZE,
+        'write': summarize(results['write'][0], results['write'][1][0], args.seconds),
+        'read': summarize(results['read'][0], results['read'][1][0], args.seconds),
+    }, indent=2))
+    shutil.rmtree(tmp, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Worker startup benchmark for app.py.
+
+Spawns fresh interpreters that import the app (like a gunicorn worker boot)
+against a temporary SQLite database and reports wall-clock timings as JSON:
+
+    python benchmarks/bench_startup.py --runs 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Executed in the child process; prints the timings it measured
+CHILD = r"""
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+client.get('/login')
+first_request = time.perf_counter()
+with app.app.app_context():
+    import bootstrap
+    bootstrap.upgrade_schema(app.db)
+    upgraded = time.perf_counter()
+    bootstrap.upgrade_schema(app.db)
+    version_check = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - start) * 1000,
+    'first_request_ms': (first_request - imported) * 1000,
+    'upgrade_ms': (upgraded - first_request) * 1000,
+    'version_check_ms': (version_check - upgraded) * 1000,
+}))
+"""
+
+def run_once(database_url):
+    env = dict(os.environ, DATABASE_URL=database_url, PYTHONDONTWRITEBYTECODE='0')
+    env.pop('AUTO_MIGRATE', None)
+    result = subprocess.run(
+        [sys.executable, '-c', CHILD], cwd=ROOT, env=env,
+        capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def summarize(samples):
+    return {
+        'median': round(statistics.median(samples), 2),
+        'min': round(min(samples), 2),
+        'max': round(max(samples), 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = f"sqlite:///{os.path.join(tmp, 'startup.db')}"
+        runs = [run_once(database_url) for _ in range(args.runs)]
+
+    report = {key: summarize([r[key] for r in runs]) for key in runs[0]}
+    report['runs'] = args.runs
+    print(json.dumps(report, indent=2))
+
+if __name__ == '__main__':
+    main()
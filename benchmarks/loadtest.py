@@ -0,0 +1,457 @@
+"""Load test for the helpdesk API (app.py) and its Socket.IO chat.
+
+Seeds a SQLite database with bulk inserts, then runs each scenario with
+concurrent clients and prints throughput and latency percentiles as JSON.
+Requests go through the Flask test client, or over HTTP to a local server
+started on the seeded database (--server). Save the output of one commit
+and compare the next one against it:
+
+    python benchmarks/loadtest.py --tickets 2000 --clients 16 --output before.json
+    python benchmarks/loadtest.py --tickets 2000 --clients 16 --compare before.json
+    python benchmarks/loadtest.py --server --scenarios login,tickets,dashboard
+
+Scenarios: login, tickets, dashboard, export, chat. With --mixed they run at
+the same time, interleaved, instead of one after another. The same --seed
+gives the same data and request sequence.
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = ('login', 'tickets', 'dashboard', 'export', 'chat')
+PASSWORD = 'load123'
+DEPARTMENTS = ('TI', 'RH', 'Financeiro', 'Compras', 'Jurídico')
+PRIORITIES = ('Alta', 'Média', 'Baixa')
+STATUSES = ('Aberto', 'Em Andamento', 'Resolvido', 'Fechado')
+SLA_HOURS = {'Alta': 4, 'Média': 24, 'Baixa': 72}
+BATCH_SIZE = 5000
+
+SERVER_SCRIPT = (
+    "import sys, logging; sys.path.insert(0, {root!r}); logging.disable(logging.INFO)\n"
+    "from app import app, socketio\n"
+    "socketio.run(app, host='127.0.0.1', port={port}, allow_unsafe_werkzeug=True, log_output=False)\n"
+)
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def _batches(rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        yield rows[start:start + BATCH_SIZE]
+
+def seed(helpdesk, args):
+    """Bulk insert users, tickets, messages and attachments. Returns the
+    row counts and the usernames by role."""
+    import bootstrap
+    import passwords
+    import search
+    import ticket_counters
+    from sqlalchemy import insert
+    from models import User, Ticket, Message, Attachment
+
+    rng = random.Random(args.seed)
+    now = datetime.utcnow()
+    password_hash = passwords.hash_password(PASSWORD)
+    technicians = max(1, args.users // 10)
+
+    users = []
+    for i in range(args.users):
+        role = 'Administrador' if i == 0 else 'Técnico' if i <= technicians else 'Colaborador'
+        users.append({'id': i + 1, 'username': f'user{i}', 'password_hash': password_hash, 'role': role,
+                      'email': f'user{i}@company.com', 'name': f'User {i}', 'created_at': now, 'active': True})
+    staff_ids = [u['id'] for u in users if u['role'] == 'Técnico']
+    requester_ids = [u['id'] for u in users if u['role'] == 'Colaborador'] or [1]
+
+    tickets, messages, attachments = [], [], []
+    for ticket_id in range(1, args.tickets + 1):
+        created = now - timedelta(minutes=rng.randint(0, 180 * 24 * 60))
+        priority = rng.choice(PRIORITIES)
+        status = rng.choice(STATUSES)
+        sla_due = created + timedelta(hours=SLA_HOURS[priority])
+        creator = rng.choice(requester_ids)
+        assignee = rng.choice(staff_ids) if status != 'Aberto' or rng.random() < 0.5 else None
+        tickets.append({
+            'id': ticket_id, 'title': f'Chamado {ticket_id}: problema no setor {rng.randint(1, 60)}',
+            'description': ' '.join(rng.choice(('impressora', 'rede', 'acesso', 'senha', 'email', 'sistema',
+                                                'lento', 'erro', 'não', 'funciona')) for _ in range(20)),
+            'department': rng.choice(DEPARTMENTS), 'priority': priority, 'status': status,
+            'created_at': created, 'updated_at': created, 'sla_due': sla_due,
+            'sla_violated': status in ('Aberto', 'Em Andamento') and sla_due < now,
+            'resolved_at': created + timedelta(hours=rng.randint(1, 96)) if status in ('Resolvido', 'Fechado') else None,
+            'creator_id': creator, 'assigned_to': assignee,
+        })
+        for n in range(rng.randint(0, 2 * args.messages_per_ticket)):
+            messages.append({'content': f'Mensagem {n} sobre o chamado {ticket_id}', 'message_type': 'message',
+                             'timestamp': created + timedelta(minutes=10 * (n + 1)), 'ticket_id': ticket_id,
+                             'user_id': rng.choice((creator, assignee or creator))})
+        if rng.random() < args.attachments_per_ticket:
+            attachments.append({'filename': f'{ticket_id}_print.png', 'original_filename': 'print.png',
+                                'file_size': rng.randint(10_000, 2_000_000), 'mime_type': 'image/png',
+                                'uploaded_at': created, 'ticket_id': ticket_id, 'uploaded_by': creator})
+
+    started = time.perf_counter()
+    with helpdesk.app.app_context():
+        db = helpdesk.db
+        bootstrap.upgrade_schema(db)
+        # Core inserts skip the ORM listeners; the search index and the ticket
+        # counters are rebuilt at the end
+        for model, rows in ((User, users), (Ticket, tickets), (Message, messages), (Attachment, attachments)):
+            for batch in _batches(rows):
+                db.session.execute(insert(model.__table__), batch)
+        search.rebuild_index(db.session.connection())
+        db.session.commit()
+        for _ in ticket_counters.repair(db.engine):
+            pass
+    return {
+        'users': len(users), 'tickets': len(tickets), 'messages': len(messages),
+        'attachments': len(attachments), 'seconds': round(time.perf_counter() - started, 2),
+    }, {role: [u['username'] for u in users if u['role'] == role] for role in ('Administrador', 'Técnico', 'Colaborador')}
+
+class TestClientTransport:
+    """Requests through the Flask test client, in this process"""
+
+    def __init__(self, helpdesk):
+        self.helpdesk = helpdesk
+        self.client = helpdesk.app.test_client()
+
+    def request(self, method, path, token=None, body=None):
+        headers = {'Authorization': f'Bearer {token}'} if token else {}
+        response = self.client.open(path, method=method, headers=headers, json=body)
+        data = response.get_data()
+        response.close()
+        return response.status_code, data
+
+    def socket(self, token):
+        client = self.helpdesk.socketio.test_client(self.helpdesk.app, auth={'token': token})
+        return TestSocket(client)
+
+class TestSocket:
+
+    def __init__(self, client):
+        self.client = client
+
+    def call(self, event, data, reply):
+        """Emit an event and wait for the reply event. Test client handlers
+        run inline, so the reply is already queued when emit returns."""
+        self.client.emit(event, data)
+        received = self.client.get_received()
+        return any(packet['name'] == reply for packet in received)
+
+    def close(self):
+        self.client.disconnect()
+
+class HTTPTransport:
+    """Requests over HTTP to a server on localhost"""
+
+    def __init__(self, port):
+        self.port = port
+
+    def request(self, method, path, token=None, body=None):
+        headers = {'Authorization': f'Bearer {token}'} if token else {}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=120)
+        try:
+            connection.request(method, path, body=payload, headers=headers)
+            response = connection.getresponse()
+            return response.status, response.read()
+        finally:
+            connection.close()
+
+    def socket(self, token):
+        import socketio  # python-socketio's client needs requests or websocket-client
+        client = socketio.Client(reconnection=False)
+        return ServerSocket(client, self.port, token)
+
+class ServerSocket:
+
+    def __init__(self, client, port, token):
+        self.client = client
+        self._replies = {}
+        self._lock = threading.Condition()
+
+        @client.on('*')
+        def on_any(event, *args):
+            with self._lock:
+                self._replies[event] = self._replies.get(event, 0) + 1
+                self._lock.notify_all()
+
+        client.connect(f'http://127.0.0.1:{port}', auth={'token': token}, wait_timeout=10)
+
+    def call(self, event, data, reply, timeout=10):
+        with self._lock:
+            seen = self._replies.get(reply, 0)
+        self.client.emit(event, data)
+        with self._lock:
+            return self._lock.wait_for(lambda: self._replies.get(reply, 0) > seen, timeout)
+
+    def close(self):
+        self.client.disconnect()
+
+def start_server(database_url):
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    env = dict(os.environ, DATABASE_URL=database_url)
+    process = subprocess.Popen([sys.executable, '-c', SERVER_SCRIPT.format(root=ROOT, port=port)],
+                               env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return process, port
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("The server did not start within 30s")
+
+class Worker:
+    """One simulated client: a transport, its tokens and (lazily) a socket"""
+
+    def __init__(self, transport, tokens, usernames, ticket_count, rng):
+        self.transport = transport
+        self.tokens = tokens
+        self.usernames = usernames
+        self.ticket_count = ticket_count
+        self.rng = rng
+        self.socket = None
+        self.joined = set()
+
+    def run(self, scenario):
+        """Run one request of a scenario. Returns True when it succeeded."""
+        if scenario == 'login':
+            username = self.rng.choice(self.usernames)
+            status, _ = self.transport.request('POST', '/api/login', body={'username': username, 'password': PASSWORD})
+            return status == 200
+        if scenario == 'tickets':
+            status, _ = self.transport.request('GET', '/api/tickets', self.rng.choice(self.tokens['any']))
+            return status == 200
+        if scenario == 'dashboard':
+            status, _ = self.transport.request('GET', '/api/dashboard/stats', self.tokens['admin'])
+            return status == 200
+        if scenario == 'export':
+            status, _ = self.transport.request('GET', '/api/reports/export', self.tokens['admin'])
+            return status == 200
+        if scenario == 'chat':
+            if self.socket is None:
+                self.socket = self.transport.socket(self.tokens['admin'])
+            ticket_id = self.rng.randint(1, self.ticket_count)
+            if ticket_id not in self.joined:
+                self.socket.call('join_ticket', {'ticket_id': ticket_id}, 'joined_ticket')
+                self.joined.add(ticket_id)
+            return self.socket.call('send_message', {'ticket_id': ticket_id, 'content': 'Teste de carga'},
+                                    'new_message')
+        raise ValueError(f"Unknown scenario: {scenario}")
+
+    def close(self):
+        if self.socket is not None:
+            self.socket.close()
+
+def run_phase(workers, jobs):
+    """Run (scenario, ...) jobs across the workers. Returns per-scenario
+    latencies, failures and the phase duration."""
+    latencies = {}
+    failures = {}
+    lock = threading.Lock()
+    queue = iter(jobs)
+
+    def work(worker):
+        while True:
+            with lock:
+                scenario = next(queue, None)
+            if scenario is None:
+                return
+            start = time.perf_counter()
+            try:
+                ok = worker.run(scenario)
+            except Exception:
+                ok = False
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                latencies.setdefault(scenario, []).append(elapsed)
+                if not ok:
+                    failures[scenario] = failures.get(scenario, 0) + 1
+
+    threads = [threading.Thread(target=work, args=(worker,)) for worker in workers]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, failures, time.perf_counter() - started
+
+def summarize(samples, failures, duration):
+    return {
+        'requests': len(samples),
+        'errors': failures,
+        'throughput_per_s': round(len(samples) / duration, 1) if duration else 0.0,
+        'latency_ms': {
+            'mean': round(statistics.mean(samples), 2),
+            'p50': round(percentile(samples, 50), 2),
+            'p95': round(percentile(samples, 95), 2),
+            'p99': round(percentile(samples, 99), 2),
+            'max': round(max(samples), 2),
+        },
+    }
+
+def compare(report, baseline_path, max_regression):
+    """Print p95 and throughput changes against an earlier report. Returns
+    the scenarios whose p95 got worse by more than max_regression percent."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    regressions = []
+    for name, result in report['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name)
+        if not before or 'latency_ms' not in before or 'latency_ms' not in result:
+            continue
+        p95_change = 100 * (result['latency_ms']['p95'] / before['latency_ms']['p95'] - 1)
+        throughput_change = 100 * (result['throughput_per_s'] / before['throughput_per_s'] - 1)
+        print(f"{name:10} p95 {before['latency_ms']['p95']:9.2f} -> {result['latency_ms']['p95']:9.2f} ms "
+              f"({p95_change:+.1f}%)  throughput {throughput_change:+.1f}%", file=sys.stderr)
+        if p95_change > max_regression:
+            regressions.append(name)
+    return regressions
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--tickets', type=int, default=2000)
+    parser.add_argument('--messages-per-ticket', type=int, default=5, help='average; up to twice this many')
+    parser.add_argument('--attachments-per-ticket', type=float, default=0.2)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=400, help='requests per scenario')
+    parser.add_argument('--export-requests', type=int, default=20)
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--mixed', action='store_true', help='run the scenarios at the same time')
+    parser.add_argument('--server', action='store_true', help='send requests to a local server over HTTP')
+    parser.add_argument('--database', default=None, help='SQLite file to seed (default: a temporary one)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default=None, help='also write the JSON report here')
+    parser.add_argument('--compare', default=None, help='earlier JSON report to compare with')
+    parser.add_argument('--max-regression', type=float, default=20.0, help='allowed p95 increase, in percent')
+    args = parser.parse_args()
+
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    database = args.database or os.path.join(tempfile.mkdtemp(), 'loadtest.db')
+    if os.path.exists(database):
+        os.remove(database)
+    database_url = f"sqlite:///{database}"
+    os.environ['DATABASE_URL'] = database_url
+    os.environ.pop('AUTO_MIGRATE', None)
+    sys.path.insert(0, ROOT)
+
+    import logging
+    logging.disable(logging.WARNING)
+    import app as helpdesk
+
+    volumes, usernames = seed(helpdesk, args)
+
+    server = None
+    if args.server:
+        server, port = start_server(database_url)
+        make_transport = lambda: HTTPTransport(port)
+    else:
+        make_transport = lambda: TestClientTransport(helpdesk)
+
+    try:
+        # Tokens are fetched up front, outside the measured requests
+        setup = make_transport()
+        def login(username):
+            status, body = setup.request('POST', '/api/login', body={'username': username, 'password': PASSWORD})
+            if status != 200:
+                raise RuntimeError(f"Login as {username} failed with {status}")
+            return json.loads(body)['access_token']
+        admin = login(usernames['Administrador'][0])
+        sample = usernames['Técnico'][:5] + usernames['Colaborador'][:15]
+        tokens = {'admin': admin, 'any': [admin] + [login(username) for username in sample]}
+        all_usernames = [name for names in usernames.values() for name in names]
+
+        rng = random.Random(args.seed)
+        workers = [Worker(make_transport(), tokens, all_usernames, volumes['tickets'], random.Random(rng.random()))
+                   for _ in range(args.clients)]
+
+        def count(name):
+            return args.export_requests if name == 'export' else args.requests
+
+        # The Socket.IO client may be missing its transport packages
+        skipped = {}
+        if 'chat' in scenarios:
+            try:
+                setup.socket(admin).close()
+            except Exception as e:
+                skipped['chat'] = f"{type(e).__name__}: {e}"
+                scenarios.remove('chat')
+
+        results = {}
+        started = time.perf_counter()
+        if args.mixed:
+            jobs = [name for name in scenarios for _ in range(count(name))]
+            rng.shuffle(jobs)
+            latencies, failures, duration = run_phase(workers, jobs)
+            for name in scenarios:
+                if latencies.get(name):
+                    results[name] = summarize(latencies[name], failures.get(name, 0), duration)
+        else:
+            for name in scenarios:
+                latencies, failures, duration = run_phase(workers, [name] * count(name))
+                results[name] = summarize(latencies[name], failures.get(name, 0), duration)
+        total = time.perf_counter() - started
+        for worker in workers:
+            worker.close()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    report = {
+        'revision': git_revision(),
+        'target': 'server' if args.server else 'test-client',
+        'mixed': args.mixed,
+        'clients': args.clients,
+        'seed': args.seed,
+        'data': volumes,
+        'duration_s': round(total, 2),
+        'scenarios': results,
+    }
+    if skipped:
+        report['skipped'] = skipped
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    if args.compare:
+        regressions = compare(report, args.compare, args.max_regression)
+        if regressions:
+            print(f"p95 regressed by more than {args.max_regression}%: {', '.join(regressions)}", file=sys.stderr)
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
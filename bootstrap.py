@@ -0,0 +1,165 @@
+import logging
+import click
+from datetime import datetime
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError
+import passwords
+
+SCHEMA_VERSION_TABLE = 'schema_version'
+
+DEMO_USERS = [
+    {"username": "admin", "password": "admin123", "role": "Administrador", "email": "admin@company.com", "name": "Administrador Sistema"},
+    {"username": "tecnico1", "password": "tecnico123", "role": "Técnico", "email": "tecnico1@company.com", "name": "João Silva"},
+    {"username": "colaborador1", "password": "colab123", "role": "Colaborador", "email": "colaborador1@company.com", "name": "Maria Santos"},
+    {"username": "diretor", "password": "diretor123", "role": "Diretoria", "email": "diretor@company.com", "name": "Carlos Diretor"}
+]
+
+def _create_tables(db):
+    """Create any table missing from the database (existing tables are left alone).
+    models.py holds the full schema, shared by both apps, so its tables are
+    created whichever app runs the migration."""
+    import models
+    models.db.metadata.create_all(db.engine)
+    db.create_all()
+
+def _create_search_index(db):
+    import search
+    search.create_index(db)
+
+def _create_outbox_table(db):
+    import models
+    models.OutboxEvent.__table__.create(db.engine, checkfirst=True)
+
+def _create_indexes(db, model, names):
+    """Create a model's indexes by name. Migrations never loop over a model's
+    current index set: later migrations add indexes on columns that don't
+    exist yet when an older database gets here."""
+    for index in model.__table__.indexes:
+        if index.name in names:
+            index.create(db.engine, checkfirst=True)
+
+def _create_ticket_list_indexes(db):
+    import models
+    _create_indexes(db, models.Ticket, ('ix_ticket_created_at', 'ix_ticket_creator_created'))
+
+def _create_replica_heartbeat(db):
+    import models
+    models.ReplicaHeartbeat.__table__.create(db.engine, checkfirst=True)
+
+def _create_archive_tables(db):
+    import models
+    for model in (models.TicketArchive, models.MessageArchive, models.AttachmentArchive):
+        model.__table__.create(db.engine, checkfirst=True)
+
+def _partition_messages(db):
+    import partitions
+    partitions.partition_table(db)
+
+def _add_ticket_counters(db):
+    import ticket_counters
+    ticket_counters.add_columns(db)
+
+def _create_report_tables(db):
+    import models
+    models.ReportPeriod.__table__.create(db.engine, checkfirst=True)
+    _create_indexes(db, models.Ticket, ('ix_ticket_resolved_at', 'ix_ticket_closed_at'))
+    _create_indexes(db, models.TicketArchive, ('ix_ticket_archive_resolved_at', 'ix_ticket_archive_closed_at'))
+
+# Ordered list of (version, description, function). Every migration must be
+# idempotent: it can run again on a database that already has its changes.
+MIGRATIONS = [
+    (1, 'Initial schema', _create_tables),
+    (2, 'Full-text search index', _create_search_index),
+    (3, 'Notification outbox', _create_outbox_table),
+    (4, 'Ticket list indexes', _create_ticket_list_indexes),
+    (5, 'Replica heartbeat', _create_replica_heartbeat),
+    (6, 'Archive tables', _create_archive_tables),
+    (7, 'Message partitions', _partition_messages),
+    (8, 'Ticket counters', _add_ticket_counters),
+    (9, 'Report periods', _create_report_tables),
+]
+
+def latest_version(migrations=MIGRATIONS):
+    """Get the schema version the code expects"""
+    return migrations[-1][0] if migrations else 0
+
+def get_schema_version(db):
+    """Get the schema version applied to the database (0 when never bootstrapped)"""
+    if not inspect(db.engine).has_table(SCHEMA_VERSION_TABLE):
+        return 0
+    with db.engine.connect() as connection:
+        version = connection.execute(text(f"SELECT MAX(version) FROM {SCHEMA_VERSION_TABLE}")).scalar()
+    return version or 0
+
+def schema_is_current(db, migrations=MIGRATIONS):
+    """Check whether all migrations have been applied"""
+    return get_schema_version(db) >= latest_version(migrations)
+
+def upgrade_schema(db, migrations=MIGRATIONS):
+    """Apply pending migrations in order and return the resulting version"""
+    current = get_schema_version(db)
+    pending = [m for m in migrations if m[0] > current]
+    if not pending:
+        return current
+
+    with db.engine.begin() as connection:
+        connection.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {SCHEMA_VERSION_TABLE} ("
+            "version INTEGER PRIMARY KEY, description VARCHAR(200), applied_at TIMESTAMP)"
+        ))
+
+    for version, description, migrate in pending:
+        logging.info(f"Applying schema migration {version}: {description}")
+        migrate(db)
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(
+                    text(f"INSERT INTO {SCHEMA_VERSION_TABLE} (version, description, applied_at) VALUES (:v, :d, :t)"),
+                    {'v': version, 'd': description, 't': datetime.utcnow()}
+                )
+        except IntegrityError:
+            # Another worker recorded the same migration concurrently
+            logging.info(f"Schema migration {version} already recorded")
+
+    return pending[-1][0]
+
+def seed_demo_users(db, User, users=DEMO_USERS):
+    """Create the demo users that don't exist yet and return how many were added"""
+    existing = {u.username for u in User.query.with_entities(User.username)}
+    created = 0
+    for user_data in users:
+        if user_data["username"] in existing:
+            continue
+        db.session.add(User(
+            username=user_data["username"],
+            password_hash=passwords.hash_password(user_data["password"]),
+            role=user_data["role"],
+            email=user_data["email"],
+            name=user_data["name"]
+        ))
+        created += 1
+    db.session.commit()
+    return created
+
+def register_commands(app, db, User, migrations=MIGRATIONS):
+    """Register the database bootstrap commands on the app's CLI"""
+
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Apply pending schema migrations."""
+        before = get_schema_version(db)
+        after = upgrade_schema(db, migrations)
+        click.echo(f"Schema version {before} -> {after}")
+
+    @app.cli.command('seed-demo')
+    def seed_demo_command():
+        """Create the demo users (admin, tecnico1, colaborador1, diretor)."""
+        if not schema_is_current(db, migrations):
+            upgrade_schema(db, migrations)
+        created = seed_demo_users(db, User)
+        click.echo(f"{created} demo user(s) created")
+
+    @app.cli.command('schema-version')
+    def schema_version_command():
+        """Show the applied and expected schema versions."""
+        click.echo(f"Applied: {get_schema_version(db)} / expected: {latest_version(migrations)}")
@@ -0,0 +1,89 @@
+from datetime import datetime
+from sqlalchemy import case, func, insert, update
+from models import Ticket, Message
+import search
+import ticket_events
+
+OPERATIONS = ('assign', 'status', 'close')
+STATUSES = ('Aberto', 'Em Andamento', 'Resolvido', 'Fechado')
+
+# Upper bound of tickets touched by one request
+MAX_TICKETS = 5000
+
+class BulkError(ValueError):
+    """Invalid bulk request (unknown operation, bad value, too many tickets)"""
+
+def _status_values(new_status, now):
+    """Column values for a status change, mirroring the before_update hook in models.py"""
+    values = {'status': new_status, 'updated_at': now}
+    if new_status == 'Resolvido':
+        values['resolved_at'] = func.coalesce(Ticket.resolved_at, now)
+    elif new_status == 'Fechado':
+        values['closed_at'] = func.coalesce(Ticket.closed_at, now)
+    if new_status not in ('Resolvido', 'Fechado'):
+        values['sla_violated'] = case((Ticket.sla_due < now, True), else_=False)
+    return values
+
+def apply(session, ticket_query, operation, value, actor_id, assignee_name=None):
+    """Apply one operation to every ticket selected by ticket_query in a single
+    transaction: one UPDATE for the tickets and one multi-row INSERT for the
+    system messages. Returns the ids of the tickets that changed. The caller
+    commits."""
+    if operation not in OPERATIONS:
+        raise BulkError(f"operation must be one of {', '.join(OPERATIONS)}")
+    if operation == 'close':
+        operation, value = 'status', 'Fechado'
+    if operation == 'status' and value not in STATUSES:
+        raise BulkError(f"status must be one of {', '.join(STATUSES)}")
+
+    column = Ticket.status if operation == 'status' else Ticket.assigned_to
+    targets = ticket_query.with_entities(Ticket).limit(MAX_TICKETS + 1).all()
+    if len(targets) > MAX_TICKETS:
+        raise BulkError(f"At most {MAX_TICKETS} tickets per request")
+
+    changed = [t for t in targets if getattr(t, column.key) != value]
+    if not changed:
+        return []
+
+    now = datetime.utcnow()
+    ids = [t.id for t in changed]
+    if operation == 'status':
+        values = _status_values(value, now)
+        messages = [{
+            'content': f"Status alterado de '{t.status}' para '{value}'",
+            'ticket_id': t.id, 'user_id': actor_id, 'message_type': 'system', 'timestamp': now
+        } for t in changed]
+    else:
+        values = {'assigned_to': value, 'updated_at': now}
+        messages = [{
+            'content': f"Chamado atribuído para {assignee_name}",
+            'ticket_id': t.id, 'user_id': actor_id, 'message_type': 'system', 'timestamp': now
+        } for t in changed] if value else []
+
+    if messages:
+        # One system message per ticket; the insert below skips the counter listeners
+        values.update(message_count=Ticket.message_count + 1, last_activity_at=now)
+    session.execute(
+        update(Ticket).where(Ticket.id.in_(ids)).values(**values),
+        execution_options={'synchronize_session': False}
+    )
+
+    if messages:
+        inserted = session.execute(
+            insert(Message).returning(Message.id, Message.ticket_id, Message.content),
+            messages
+        ).all()
+        connection = session.connection()
+        if search.index_available(connection):
+            search.index_messages(connection, [dict(r._mapping) for r in inserted])
+
+    # Statements bypass the ORM hooks, so publish the changes explicitly
+    ticket_events.record(session, [
+        ticket_events.change_from_ticket('updated', t, {column.key: getattr(t, column.key)})._replace(
+            **{column.key: value}
+        ) for t in changed
+    ])
+    # Stale ORM copies of the updated tickets must not be flushed back
+    for t in changed:
+        session.expire(t)
+    return ids
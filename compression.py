@@ -0,0 +1,214 @@
+import gzip
+import mimetypes
+import os
+import zlib
+import click
+from flask import request, send_from_directory
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # Optional (the "compression" extra); responses fall back to gzip without it
+    brotli = None
+
+# Dynamic responses smaller than this go out as they are; the headers and
+# CPU cost more than the bytes saved
+MIN_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE", 1024))
+# Levels for per-request compression. Static files are compressed once at
+# deploy time (`flask precompress-static`) at the maximum levels instead.
+GZIP_LEVEL = int(os.environ.get("COMPRESS_GZIP_LEVEL", 6))
+BROTLI_QUALITY = int(os.environ.get("COMPRESS_BROTLI_QUALITY", 4))
+
+COMPRESSIBLE_TYPES = (
+    'text/', 'application/json', 'application/javascript', 'application/x-ndjson',
+    'application/xml', 'image/svg+xml',
+)
+PRECOMPRESS_EXTENSIONS = ('.js', '.css', '.html', '.json', '.svg', '.txt')
+
+# Preferred first when the client accepts several with the same quality
+SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+def available_encodings():
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+def negotiate(encodings=None):
+    """Best encoding the client accepts, or None for identity"""
+    return request.accept_encodings.best_match(encodings or available_encodings())
+
+def is_compressible(mimetype):
+    return bool(mimetype) and mimetype.startswith(COMPRESSIBLE_TYPES)
+
+class Compressor:
+    """Incremental gzip or brotli compressor with one interface for both"""
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._brotli = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._brotli = None
+            self._zlib = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # 31: gzip container
+
+    def compress(self, data):
+        if self._brotli:
+            return self._brotli.process(data)
+        return self._zlib.compress(data)
+
+    def flush(self):
+        """Emit everything compressed so far, without ending the stream"""
+        if self._brotli:
+            return self._brotli.flush()
+        return self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self._brotli:
+            return self._brotli.finish()
+        return self._zlib.flush()
+
+def compress(data, encoding):
+    compressor = Compressor(encoding)
+    return compressor.compress(data) + compressor.finish()
+
+def compress_stream(chunks, encoding, charset='utf-8'):
+    """Compress a streamed body chunk by chunk. Every chunk is flushed, so
+    progress lines (e.g. from the ticket import) still reach the client as
+    they are produced."""
+    compressor = Compressor(encoding)
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode(charset)
+            data = compressor.compress(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close:
+            close()
+
+def compress_response(response):
+    """Compress a response for the current request, if it is worth it"""
+    if (response.direct_passthrough or 'Content-Encoding' in response.headers
+            or response.status_code < 200 or response.status_code in (204, 206, 304)
+            or request.method == 'HEAD' or not is_compressible(response.mimetype)):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate()
+    if not encoding:
+        return response
+
+    if response.is_streamed:
+        response.response = compress_stream(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < MIN_SIZE:
+            return response
+        response.set_data(compress(data, encoding))
+
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f"{etag}-{encoding}", weak)
+    return response
+
+def precompressed_encodings(static_folder, filename):
+    """Encodings with an up-to-date precompressed copy of a static file.
+    Copies older than the file itself are ignored, so an edited file is
+    never shadowed by a stale one."""
+    source = safe_join(static_folder, filename)
+    if source is None:
+        return []
+    try:
+        source_mtime = os.path.getmtime(source)
+    except OSError:
+        return []
+    encodings = []
+    for encoding, suffix in SUFFIXES.items():
+        try:
+            if os.path.getmtime(source + suffix) >= source_mtime:
+                encodings.append(encoding)
+        except OSError:
+            continue
+    return encodings
+
+def init_app(app):
+    """Compress dynamic responses and serve precompressed static files"""
+    app.after_request(compress_response)
+
+    static_view = app.view_functions.get('static')
+    if static_view is not None:
+
+        def static(filename):
+            encodings = precompressed_encodings(app.static_folder, filename)
+            encoding = negotiate(encodings) if encodings else None
+            if encoding:
+                mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+                response = send_from_directory(app.static_folder, filename + SUFFIXES[encoding],
+                                               mimetype=mimetype, max_age=app.get_send_file_max_age(filename))
+                response.headers['Content-Encoding'] = encoding
+            else:
+                response = static_view(filename=filename)
+            if encodings:
+                response.vary.add('Accept-Encoding')
+            return response
+
+        app.view_functions['static'] = static
+
+    register_commands(app)
+
+def precompress_file(path, force=False):
+    """Write .gz (and .br when brotli is installed) next to a file. Variants
+    that would not be smaller than the file are removed instead.
+    Returns {encoding: compressed size} for the variants written."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    mtime = os.path.getmtime(path)
+    written = {}
+    for encoding in available_encodings():
+        target = path + SUFFIXES[encoding]
+        if not force and os.path.exists(target) and os.path.getmtime(target) >= mtime:
+            continue
+        if encoding == 'br':
+            compressed = brotli.compress(data, quality=11)
+        else:
+            compressed = gzip.compress(data, compresslevel=9, mtime=0)
+        if len(compressed) >= len(data):
+            if os.path.exists(target):
+                os.remove(target)
+            continue
+        with open(target, 'wb') as f:
+            f.write(compressed)
+        written[encoding] = len(compressed)
+    return written
+
+def precompress_static(static_folder, min_size=MIN_SIZE, force=False):
+    """Precompress every compressible static file. Yields (filename, size, written)."""
+    for root, _, files in os.walk(static_folder):
+        for name in sorted(files):
+            if not name.endswith(PRECOMPRESS_EXTENSIONS):
+                continue
+            path = os.path.join(root, name)
+            size = os.path.getsize(path)
+            if size < min_size:
+                continue
+            filename = os.path.relpath(path, static_folder).replace(os.sep, '/')
+            yield filename, size, precompress_file(path, force)
+
+def register_commands(app):
+
+    @app.cli.command('precompress-static')
+    @click.option('--force', is_flag=True, help='Recompress files that are already up to date.')
+    def precompress_static_command(force):
+        """Write .gz/.br copies of the static files."""
+        count = 0
+        for filename, size, written in precompress_static(app.static_folder, force=force):
+            if written:
+                count += 1
+                sizes = ', '.join(f"{encoding} {length}" for encoding, length in written.items())
+                click.echo(f"{filename}: {size} -> {sizes}")
+        if brotli is None:
+            click.echo("brotli is not installed; only .gz files were written")
+        click.echo(f"{count} files precompressed")
@@ -0,0 +1,74 @@
+import logging
+import os
+
+# How the Socket.IO server (app.py) handles connections:
+#   threading - one OS thread (or several) per open socket; the default
+#   gevent / eventlet - green threads on one event loop, so thousands of
+#       idle chat sockets cost little memory and no threads. Needs the
+#       package installed (`pip install ".[gevent]"` or ".[eventlet]");
+#       gevent is preferred, eventlet is in maintenance mode. Run with
+#       `SOCKETIO_ASYNC_MODE=gevent python app.py`.
+# In the green modes, PostgreSQL queries are made cooperative with
+# psycogreen (if installed), so a query waits on the loop instead of
+# blocking it, and pooled connections are handed out the same way. There
+# is no cooperative SQLite driver, so SQLite queries still block the loop;
+# use it there for development only.
+ASYNC_MODES = ('threading', 'eventlet', 'gevent')
+# Concurrent connections the eventlet server accepts (its own default is
+# 1024)
+MAX_CONNECTIONS = int(os.environ.get("SOCKETIO_MAX_CONNECTIONS", 10000))
+ASYNC_MODE = os.environ.get("SOCKETIO_ASYNC_MODE", "threading")
+GREEN = ASYNC_MODE in ('eventlet', 'gevent')
+
+_patched = False
+
+def monkey_patch():
+    """Patch the standard library for the green modes. Runs first in app.py,
+    before anything else imports socket or threading."""
+    global _patched
+    if ASYNC_MODE not in ASYNC_MODES:
+        raise ValueError(f"SOCKETIO_ASYNC_MODE must be one of {', '.join(ASYNC_MODES)}, not {ASYNC_MODE!r}")
+    if not GREEN or _patched:
+        return
+    _patched = True
+
+    if ASYNC_MODE == 'eventlet':
+        import eventlet
+        eventlet.monkey_patch()
+    else:
+        from gevent import monkey
+        monkey.patch_all()
+
+    database_url = os.environ.get("DATABASE_URL", "")
+    if database_url.startswith(('postgres://', 'postgresql')):
+        try:
+            if ASYNC_MODE == 'eventlet':
+                from psycogreen.eventlet import patch_psycopg
+            else:
+                from psycogreen.gevent import patch_psycopg
+            patch_psycopg()
+        except ImportError:
+            logging.warning("psycogreen is not installed; database queries will block the event loop")
+    else:
+        logging.warning(f"SOCKETIO_ASYNC_MODE={ASYNC_MODE} with SQLite: queries block the event loop")
+
+def server_options():
+    """Extra options for socketio.run() in the current mode"""
+    if ASYNC_MODE == 'eventlet':
+        return {'max_size': MAX_CONNECTIONS}
+    return {}
+
+def patched():
+    return _patched
+
+def run_in_thread(fn, *args):
+    """Run CPU-bound work (e.g. password hashing) on a native thread, so it
+    doesn't stall the event loop once monkey_patch() ran; inline otherwise. fn
+    must not use locks or other green primitives."""
+    if not _patched:
+        return fn(*args)
+    if ASYNC_MODE == 'eventlet':
+        from eventlet import tpool
+        return tpool.execute(fn, *args)
+    import gevent
+    return gevent.get_hub().threadpool.apply(fn, args)
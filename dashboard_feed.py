@@ -0,0 +1,146 @@
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from sqlalchemy import and_, case, func, select
+from models import Ticket
+import ticket_events
+
+# Dashboards load /api/dashboard/stats once, join this room and then apply
+# the deltas pushed here. Every worker runs the feed from app start and
+# publishes what it commits, viewers or not: with SOCKETIO_MESSAGE_QUEUE set
+# the room spans all workers, and a change made on one reaches the
+# dashboards connected to the others.
+ROOM = 'dashboard'
+OPEN_STATUSES = ('Aberto', 'Em Andamento')
+
+# At most one frame per FRAME_INTERVAL seconds, whatever the write rate.
+# SLA buckets move with the clock, so they are re-counted every SLA_REFRESH
+# seconds by workers with viewers, and by the committing worker on the next
+# frame after a change that affects them.
+FRAME_INTERVAL = float(os.environ.get("DASHBOARD_FRAME_INTERVAL", 1))
+SLA_REFRESH = float(os.environ.get("DASHBOARD_SLA_REFRESH", 30))
+SLA_WARNING = timedelta(hours=1)
+
+TOTAL_KEYS = {
+    'Aberto': 'open_tickets', 'Em Andamento': 'open_tickets',
+    'Resolvido': 'resolved_tickets', 'Fechado': 'closed_tickets',
+}
+
+def sla_counts(session, now=None):
+    """(violated, warning) counts of open tickets, in one query"""
+    now = now or datetime.utcnow()
+    row = session.execute(select(
+        func.coalesce(func.sum(case((Ticket.sla_due < now, 1), else_=0)), 0),
+        func.coalesce(func.sum(case((and_(Ticket.sla_due > now, Ticket.sla_due < now + SLA_WARNING), 1), else_=0)), 0),
+    ).where(Ticket.status.in_(OPEN_STATUSES))).one()
+    return int(row[0]), int(row[1])
+
+class DashboardFeed:
+    """Turns committed ticket changes into coalesced stat deltas"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._groups = {name: Counter() for name in ('totals', 'status', 'priority', 'department', 'activity')}
+        self._sla_dirty = False
+        self._sla = None
+        self._sla_checked = 0.0
+        self._viewers = set()
+        self._started = False
+
+    def _count(self, sign, status, priority, department):
+        groups = self._groups
+        groups['totals']['total_tickets'] += sign
+        groups['status'][status] += sign
+        if status in TOTAL_KEYS:
+            groups['totals'][TOTAL_KEYS[status]] += sign
+        groups['priority'][priority] += sign
+        groups['department'][department] += sign
+
+    def apply(self, changes):
+        """Accumulate the deltas of committed TicketChange events"""
+        today = datetime.utcnow().date().isoformat()
+        with self._lock:
+            if not self._started:
+                return
+            for change in changes:
+                if change.action == 'created':
+                    self._count(1, change.status, change.priority, change.department)
+                    self._groups['activity'][today] += 1
+                    self._sla_dirty = self._sla_dirty or change.status in OPEN_STATUSES
+                    continue
+                if change.action == 'deleted':
+                    self._count(-1, change.status, change.priority, change.department)
+                    self._sla_dirty = self._sla_dirty or change.status in OPEN_STATUSES
+                    continue
+
+                previous = change.previous
+                old_status = previous.get('status', change.status)
+                self._count(-1, old_status, previous.get('priority', change.priority),
+                            previous.get('department', change.department))
+                self._count(1, change.status, change.priority, change.department)
+                if 'sla_due' in previous or (old_status in OPEN_STATUSES) != (change.status in OPEN_STATUSES):
+                    self._sla_dirty = True
+
+    def next_frame(self, session, now=None):
+        """Take the pending deltas as a frame dict, or None when nothing changed.
+        Only non-zero entries are sent."""
+        monotonic = time.monotonic()
+        with self._lock:
+            frame = {}
+            for name, counter in self._groups.items():
+                values = {key: value for key, value in counter.items() if value}
+                if values:
+                    frame[name] = values
+                counter.clear()
+            recount = self._sla_dirty or (self._viewers and monotonic - self._sla_checked >= SLA_REFRESH)
+            self._sla_dirty = False
+
+        if recount:
+            sla = sla_counts(session, now)
+            self._sla_checked = monotonic
+            if sla != self._sla:
+                self._sla = sla
+                frame['sla'] = {'sla_violated': sla[0], 'sla_warning': sla[1]}
+        return frame or None
+
+    def join(self, sid):
+        with self._lock:
+            self._viewers.add(sid)
+
+    def leave(self, sid):
+        with self._lock:
+            self._viewers.discard(sid)
+
+    @property
+    def viewers(self):
+        return len(self._viewers)
+
+    def start(self, app, socketio, db):
+        """Start the frame loop (once) as a Socket.IO background task.
+        Changes are only accumulated once it runs."""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        socketio.start_background_task(self._run, app, socketio, db)
+
+    def _run(self, app, socketio, db):
+        while True:
+            socketio.sleep(FRAME_INTERVAL)
+            try:
+                with app.app_context():
+                    frame = self.next_frame(db.session)
+                    db.session.remove()
+                if frame:
+                    socketio.emit('dashboard_delta', frame, to=ROOM)
+            except Exception as e:
+                logging.error(f"Dashboard feed error: {e}")
+
+feed = DashboardFeed()
+
+@ticket_events.subscribe
+def _on_ticket_changes(changes):
+    feed.apply(changes)
@@ -1,7 +1,8 @@
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
+from replicas import RoutingSession
 
 class Base(DeclarativeBase):
     pass
 
-db = SQLAlchemy(model_class=Base)
\ No newline at end of file
+db = SQLAlchemy(model_class=Base, session_options={'class_': RoutingSession})
\ No newline at end of file
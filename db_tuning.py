@@ -0,0 +1,99 @@
+import os
+import threading
+from sqlalchemy import event
+import metrics
+
+# SQLite: WAL lets readers (dashboards, ticket lists) run while a chat
+# message is being written, instead of everyone queueing on the database
+# lock. With WAL, synchronous=NORMAL only syncs at checkpoints: a power loss
+# can drop the last commits but never corrupts the file. Writers that find
+# the database locked wait up to SQLITE_BUSY_TIMEOUT_MS before failing.
+SQLITE_JOURNAL_MODE = os.environ.get("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", 5000))
+SQLITE_MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+
+# PostgreSQL: connections per worker are DB_POOL_SIZE kept open plus up to
+# DB_MAX_OVERFLOW opened under load; a request waits DB_POOL_TIMEOUT seconds
+# for one before failing. Statements running longer than
+# DB_STATEMENT_TIMEOUT_MS are cancelled by the server (0 disables it).
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 20))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 300))
+DB_STATEMENT_TIMEOUT_MS = int(os.environ.get("DB_STATEMENT_TIMEOUT_MS", 30000))
+
+_engines = {}  # name -> engine, for the pool metrics
+_lock = threading.Lock()
+
+def is_sqlite(database_url):
+    return database_url.startswith('sqlite')
+
+def engine_options(database_url):
+    """SQLALCHEMY_ENGINE_OPTIONS for a database URL"""
+    if is_sqlite(database_url):
+        # Connections are local files; pinging them on every checkout is
+        # a wasted query
+        return {}
+    options = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": True,
+    }
+    if DB_STATEMENT_TIMEOUT_MS > 0:
+        options["connect_args"] = {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+    return options
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        # busy_timeout first, so switching the journal mode waits for a lock too
+        cursor.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA journal_mode = {SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+    finally:
+        cursor.close()
+
+def tune_engine(engine, name='default'):
+    """Apply the SQLite PRAGMAs to each new connection of engine and report
+    its pool in the metrics. Call before the engine opens a connection."""
+    with _lock:
+        if _engines.get(name) is engine:
+            return
+        _engines[name] = engine
+    if engine.dialect.name == 'sqlite':
+        event.listen(engine, 'connect', _sqlite_pragmas)
+
+def pool_connections():
+    """{(engine, state): connections} for the pools that keep counts"""
+    values = {}
+    for name, engine in list(_engines.items()):
+        pool = engine.pool
+        if hasattr(pool, 'checkedout'):
+            values[(name, 'checked_out')] = pool.checkedout()
+            values[(name, 'idle')] = pool.checkedin()
+    return values
+
+def pool_capacity():
+    """{(engine,): most connections the pool hands out}; unbounded pools
+    are left out"""
+    values = {}
+    for name, engine in list(_engines.items()):
+        pool = engine.pool
+        if hasattr(pool, 'size') and getattr(pool, '_max_overflow', -1) >= 0:
+            values[(name,)] = pool.size() + pool._max_overflow
+    return values
+
+metrics.gauge('db_pool_connections', 'Pooled database connections, by state.', ('engine', 'state'),
+              callback=pool_connections)
+metrics.gauge('db_pool_capacity', 'Most connections a pool hands out at once.', ('engine',),
+              callback=pool_capacity)
+
+def init_app(app, db):
+    """Tune the app's engines. Call right after db.init_app(app)."""
+    with app.app_context():
+        for bind, engine in db.engines.items():
+            tune_engine(engine, bind or 'default')
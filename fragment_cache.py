@@ -0,0 +1,42 @@
+import os
+import threading
+from collections import OrderedDict
+from markupsafe import Markup
+
+# Rendered HTML fragments, keyed by whatever identifies their content
+# (e.g. a row's id and updated_at). Keys change when the content does, so
+# entries are never invalidated, only evicted least recently used first.
+CACHE_SIZE = int(os.environ.get("FRAGMENT_CACHE_SIZE", 5000))
+
+class FragmentCache:
+
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_or_render(self, key, render):
+        """Get the cached fragment for key, or render() it and keep it"""
+        with self._lock:
+            fragment = self._entries.get(key)
+            if fragment is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return fragment
+
+        fragment = Markup(render())
+        with self._lock:
+            self.misses += 1
+            self._entries[key] = fragment
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+        return fragment
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
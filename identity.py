@@ -0,0 +1,77 @@
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from flask import g
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
+from database import db
+from models import User
+
+# Just what authorization checks need; the full User row is loaded only
+# where a route really uses it
+Identity = namedtuple('Identity', ['id', 'role', 'active', 'name'])
+
+CACHE_TTL = float(os.environ.get("IDENTITY_CACHE_TTL", 60))
+CACHE_SIZE = int(os.environ.get("IDENTITY_CACHE_SIZE", 1024))
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+def lookup(user_id):
+    """Get the identity of a user id from the process-wide LRU, querying on a miss"""
+    user_id = int(user_id)
+    now = time.monotonic()
+    with _lock:
+        entry = _cache.get(user_id)
+        if entry and entry[1] > now:
+            _cache.move_to_end(user_id)
+            return entry[0]
+
+    row = db.session.query(User.id, User.role, User.active, User.name).filter(User.id == user_id).first()
+    if not row:
+        return None
+
+    identity = Identity(row.id, row.role, bool(row.active), row.name)
+    with _lock:
+        _cache[user_id] = (identity, now + CACHE_TTL)
+        _cache.move_to_end(user_id)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return identity
+
+def invalidate(user_id=None):
+    """Drop one cached identity, or all of them"""
+    with _lock:
+        if user_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(int(user_id), None)
+
+def current_identity():
+    """Resolve the JWT user once per request. Returns None for unknown or
+    inactive users; the JWT must already be verified."""
+    if 'identity' not in g:
+        identity = lookup(get_jwt_identity())
+        g.identity = identity if identity and identity.active else None
+    return g.identity
+
+# Invalidate on user changes: right away at flush, and again after commit so
+# a concurrent request can't re-cache the pre-commit row
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def _user_changed(mapper, connection, target):
+    invalidate(target.id)
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('identity_changed', set()).add(target.id)
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_committed(session):
+    for user_id in session.info.pop('identity_changed', ()):
+        invalidate(user_id)
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_changes(session):
+    session.info.pop('identity_changed', None)
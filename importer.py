@@ -0,0 +1,237 @@
+import csv
+import io
+import json
+import click
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
+from database import db
+from models import User, Ticket
+from utils import get_sla_hours
+import search
+import ticket_events
+
+PRIORITIES = ('Alta', 'Média', 'Baixa')
+STATUSES = ('Aberto', 'Em Andamento', 'Resolvido', 'Fechado')
+
+CHUNK_SIZE = 500
+MAX_REPORTED_ERRORS = 1000
+
+class ImportReport:
+    """Running totals of an import, with the first MAX_REPORTED_ERRORS row errors"""
+
+    def __init__(self):
+        self.processed = 0
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+
+    def add_error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'error': message})
+
+    def to_dict(self, include_errors=True):
+        result = {'processed': self.processed, 'imported': self.imported, 'failed': self.failed}
+        if include_errors:
+            result['errors'] = self.errors
+        return result
+
+def detect_format(filename, content_type=None):
+    """Pick 'csv' or 'jsonl' from a file name or content type"""
+    name = (filename or '').lower()
+    if name.endswith(('.jsonl', '.ndjson', '.json')) or 'json' in (content_type or ''):
+        return 'jsonl'
+    return 'csv'
+
+def iter_records(stream, fmt):
+    """Yield (line number, record dict or error message) from a text stream"""
+    if fmt == 'jsonl':
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield line_number, f"Invalid JSON: {e}"
+                continue
+            yield line_number, record if isinstance(record, dict) else "Each line must be a JSON object"
+    else:
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+
+def _parse_datetime(value):
+    if not value:
+        return None
+    if isinstance(value, str):
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).replace(tzinfo=None)
+    raise ValueError(f"Invalid date: {value!r}")
+
+def _user_id(value, usernames, user_ids):
+    """Resolve a user given as id or username against the preloaded users"""
+    if value in (None, ''):
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError(f"Invalid user {value!r}")
+    if isinstance(value, int) or value.isdigit():
+        user_id = int(value)
+        if user_id not in user_ids:
+            raise ValueError(f"Unknown user id {user_id}")
+        return user_id
+    if value not in usernames:
+        raise ValueError(f"Unknown user {value!r}")
+    return usernames[value]
+
+def validate(record, default_creator_id, usernames, user_ids, now):
+    """Turn an input record into ticket column values, raising ValueError"""
+    def text_field(name, required=True):
+        value = record.get(name)
+        # JSON Lines can carry numbers, lists or objects where text belongs
+        if value is not None and not isinstance(value, str):
+            raise ValueError(f"{name} must be text")
+        value = value.strip() if value is not None else value
+        if required and not value:
+            raise ValueError(f"{name} is required")
+        return value or ''
+
+    priority = text_field('priority')
+    if priority not in PRIORITIES:
+        raise ValueError(f"priority must be one of {', '.join(PRIORITIES)}")
+    status = text_field('status', required=False) or 'Aberto'
+    if status not in STATUSES:
+        raise ValueError(f"status must be one of {', '.join(STATUSES)}")
+
+    title = text_field('title')
+    if len(title) > 200:
+        raise ValueError("title is longer than 200 characters")
+
+    created_at = _parse_datetime(record.get('created_at')) or now
+    creator_id = _user_id(record.get('creator') or record.get('creator_id'), usernames, user_ids) or default_creator_id
+    if creator_id is None:
+        raise ValueError("creator is required")
+
+    return {
+        'title': title,
+        'description': text_field('description'),
+        'department': text_field('department'),
+        'priority': priority,
+        'status': status,
+        'observations': text_field('observations', required=False),
+        'created_at': created_at,
+        'updated_at': created_at,
+        'last_activity_at': created_at,
+        # SLA for the whole chunk here, since executemany skips the ORM hook
+        'sla_due': created_at + timedelta(hours=get_sla_hours(priority)),
+        'resolved_at': _parse_datetime(record.get('resolved_at')),
+        'closed_at': _parse_datetime(record.get('closed_at')),
+        'creator_id': creator_id,
+        'assigned_to': _user_id(record.get('assigned_to'), usernames, user_ids),
+    }
+
+def _insert_rows(session, rows):
+    """executemany INSERT of one chunk, indexed for search and published to
+    the ticket event subscribers. Returns the new ids, in the order of rows
+    (batched RETURNING, e.g. on PostgreSQL, doesn't keep it by itself)."""
+    query = insert(Ticket).returning(Ticket.id, sort_by_parameter_order=True)
+    ids = session.execute(query, rows).scalars().all()
+    connection = session.connection()
+    if search.index_available(connection):
+        search.index_tickets(connection, [dict(row, id=ticket_id) for row, ticket_id in zip(rows, ids)])
+    ticket_events.record(session, [
+        ticket_events.TicketChange(
+            'created', ticket_id, row['title'], row['description'], row['department'],
+            row['status'], row['priority'], row['assigned_to'], row['creator_id'], row['sla_due'], {}
+        ) for row, ticket_id in zip(rows, ids)
+    ])
+    return ids
+
+def _flush_chunk(session, chunk, report):
+    """Insert a chunk in one transaction. If the database rejects it, retry
+    row by row so only the offending rows are reported."""
+    if not chunk:
+        return
+    try:
+        _insert_rows(session, [row for _, row in chunk])
+        session.commit()
+        report.imported += len(chunk)
+        return
+    except SQLAlchemyError:
+        session.rollback()
+
+    for line, row in chunk:
+        try:
+            _insert_rows(session, [row])
+            session.commit()
+            report.imported += 1
+        except SQLAlchemyError as e:
+            session.rollback()
+            report.add_error(line, str(e.orig if hasattr(e, 'orig') else e))
+
+def iter_import(stream, fmt, default_creator_id=None, chunk_size=CHUNK_SIZE):
+    """Stream tickets from a CSV or JSON Lines text stream into the database,
+    yielding the running report after each committed chunk. Invalid rows are
+    reported and skipped."""
+    session = db.session
+    users = session.query(User.id, User.username).all()
+    usernames = {u.username: u.id for u in users}
+    user_ids = {u.id for u in users}
+
+    report = ImportReport()
+    chunk = []
+    now = datetime.utcnow()
+    for line, record in iter_records(stream, fmt):
+        report.processed += 1
+        if isinstance(record, str):
+            report.add_error(line, record)
+            continue
+        try:
+            chunk.append((line, validate(record, default_creator_id, usernames, user_ids, now)))
+        except ValueError as e:
+            report.add_error(line, str(e))
+
+        if len(chunk) >= chunk_size:
+            _flush_chunk(session, chunk, report)
+            chunk = []
+            yield report
+
+    _flush_chunk(session, chunk, report)
+    yield report
+
+def import_tickets(stream, fmt, default_creator_id=None, chunk_size=CHUNK_SIZE, progress=None):
+    """Run a whole import and return its report; progress(report) is called per chunk"""
+    report = ImportReport()
+    for report in iter_import(stream, fmt, default_creator_id, chunk_size):
+        if progress:
+            progress(report)
+    return report
+
+def open_text(binary_stream):
+    """Decode an uploaded byte stream (UTF-8, BOM tolerated) without reading it all"""
+    return io.TextIOWrapper(binary_stream, encoding='utf-8-sig', newline='')
+
+def register_commands(app):
+
+    @app.cli.command('import-tickets')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), default=None,
+                  help='Input format (default: from the file extension).')
+    @click.option('--creator', default=None, help='Username for rows without a creator.')
+    @click.option('--chunk-size', default=CHUNK_SIZE, show_default=True)
+    def import_tickets_command(path, fmt, creator, chunk_size):
+        """Bulk import tickets from a CSV or JSON Lines file."""
+        default_creator_id = None
+        if creator:
+            user = User.query.filter_by(username=creator).first()
+            if not user:
+                raise click.BadParameter(f"Unknown user {creator!r}", param_hint='--creator')
+            default_creator_id = user.id
+
+        def progress(report):
+            click.echo(f"{report.processed} processed, {report.imported} imported, {report.failed} failed")
+
+        with open(path, encoding='utf-8-sig', newline='') as f:
+            report = import_tickets(f, fmt or detect_format(path), default_creator_id, chunk_size, progress)
+
+        for error in report.errors:
+            click.echo(f"line {error['line']}: {error['error']}", err=True)
@@ -0,0 +1,264 @@
+import hmac
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from flask import Response, g, has_request_context, jsonify, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import metrics
+
+# A statement shape run more than this many times in one request is logged
+# as a likely N+1 (a query per row instead of one for all of them)
+N_PLUS_ONE_THRESHOLD = int(os.environ.get("SQL_N_PLUS_ONE_THRESHOLD", 10))
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", 500))
+
+# Opt-in sampling profiler: a share of requests (PROFILE_SAMPLE_RATE) has its
+# stack sampled every PROFILE_INTERVAL_MS, and the samples of those slower
+# than PROFILE_SLOW_REQUEST_MS are logged. With PROFILE_DIR set, they are
+# also written there in the collapsed format flame graph tools read.
+PROFILE_SLOW_REQUEST_MS = float(os.environ.get("PROFILE_SLOW_REQUEST_MS", 0))
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", 1.0))
+PROFILE_INTERVAL = float(os.environ.get("PROFILE_INTERVAL_MS", 5)) / 1000
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "")
+PROFILE_TOP = 5
+PROFILE_MAX_DEPTH = 64
+
+# /metrics is off unless METRICS_ENABLED=1 or a METRICS_TOKEN is set; with
+# a token, scrapes must send it as a bearer token
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1" if METRICS_TOKEN else "0") == "1"
+
+SQL_VERBS = ('SELECT', 'INSERT', 'UPDATE', 'DELETE')
+
+REQUESTS = metrics.counter('http_requests_total', 'HTTP requests by route and status.',
+                           ('method', 'route', 'status'))
+REQUEST_DURATION = metrics.histogram('http_request_duration_seconds', 'Time spent in the request handler.',
+                                     ('method', 'route'))
+REQUESTS_IN_PROGRESS = metrics.gauge('http_requests_in_progress', 'Requests being handled.')
+REQUEST_QUERIES = metrics.histogram('http_request_sql_queries', 'SQL statements run per request.',
+                                    ('route',), buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500))
+REQUEST_SQL_DURATION = metrics.histogram('http_request_sql_duration_seconds', 'Time spent in SQL per request.',
+                                         ('route',))
+SQL_DURATION = metrics.histogram('sql_query_duration_seconds', 'SQL statement execution time.', ('verb',),
+                                 buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0))
+SLOW_QUERIES = metrics.counter('sql_slow_queries_total', 'SQL statements slower than SLOW_QUERY_MS.', ('verb',))
+N_PLUS_ONE = metrics.counter('sql_n_plus_one_total', 'Requests that repeated a statement shape too often.',
+                             ('route',))
+SLOW_PROFILES = metrics.counter('slow_request_profiles_total', 'Slow requests with a sampled profile.',
+                                ('route',))
+
+_IN_LIST = re.compile(r'\(\s*(\?|%\(\w+\)s|:\w+|\$\d+)(\s*,\s*(\?|%\(\w+\)s|:\w+|\$\d+))+\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+def statement_shape(statement):
+    """A statement with whitespace normalized and IN lists collapsed, so the
+    same query with other parameters or list sizes has the same shape"""
+    return _IN_LIST.sub('(?)', _WHITESPACE.sub(' ', statement).strip())
+
+def statement_verb(statement):
+    verb = statement.lstrip()[:6].upper()
+    return verb if verb in SQL_VERBS else 'OTHER'
+
+class RequestStats:
+    """SQL work done on behalf of one request"""
+    __slots__ = ('start', 'queries', 'sql_time', 'statements', 'profiled')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.statements = Counter()  # Raw text; shapes are only computed at the end
+        self.profiled = False
+
+    def repeated(self, threshold):
+        """(shape, count) of the statement shapes run more than threshold times"""
+        shapes = Counter()
+        for statement, count in self.statements.items():
+            shapes[statement_shape(statement)] += count
+        return [(shape, count) for shape, count in shapes.most_common() if count > threshold]
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('query_start')
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    verb = statement_verb(statement)
+    SQL_DURATION.observe(elapsed, verb=verb)
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        SLOW_QUERIES.inc(verb=verb)
+        logging.warning(f"Slow query ({elapsed * 1000:.0f} ms): {statement_shape(statement)[:500]}")
+
+    if has_request_context():
+        stats = g.get('_request_stats')
+        if stats is not None:
+            stats.queries += 1
+            stats.sql_time += elapsed
+            stats.statements[statement] += 1
+
+def _handle_error(context):
+    starts = context.connection.info.get('query_start') if context.connection is not None else None
+    if starts:
+        starts.pop()
+
+_engine_lock = threading.Lock()
+_engine_hooked = False
+
+def hook_engines():
+    """Time the statements of every engine, once per process"""
+    global _engine_hooked
+    with _engine_lock:
+        if _engine_hooked:
+            return
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+        _engine_hooked = True
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+def collapse_stack(frame):
+    """A stack as 'outer;...;inner' frame labels (the collapsed stack format)"""
+    labels = []
+    while frame is not None and len(labels) < PROFILE_MAX_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+class SamplingProfiler:
+    """Samples the stacks of registered threads from one background thread.
+    Only threads are seen, so green-thread workers are not profiled."""
+
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self._threads = {}  # thread ident -> Counter of collapsed stacks
+        self._lock = threading.Lock()
+        self._active = threading.Event()
+        self._sampler = None
+
+    def start(self, ident):
+        with self._lock:
+            self._threads[ident] = Counter()
+            self._active.set()
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+                self._sampler.start()
+
+    def stop(self, ident):
+        """Stop sampling a thread and get its samples (None if it wasn't sampled)"""
+        with self._lock:
+            stacks = self._threads.pop(ident, None)
+            if not self._threads:
+                self._active.clear()
+        return stacks
+
+    def _run(self):
+        own = threading.get_ident()
+        while True:
+            self._active.wait()
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for ident, stacks in self._threads.items():
+                    frame = frames.get(ident)
+                    if frame is not None and ident != own:
+                        stacks[collapse_stack(frame)] += 1
+
+profiler = SamplingProfiler()
+_app_files = set()  # Basenames of the app's modules, to pick them out of stacks
+
+def _route():
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+def _summarize_stack(stack):
+    """Innermost frame, then the innermost frames of the app's own modules"""
+    labels = stack.split(';')
+    own = [label for label in labels[:-1] if label.split(':', 1)[0] in _app_files]
+    return ' < '.join([labels[-1]] + own[::-1][:3])
+
+def _report_profile(route, elapsed, stats, stacks):
+    SLOW_PROFILES.inc(route=route)
+    total = sum(stacks.values())
+    lines = [f"Slow request {request.method} {request.path}: {elapsed * 1000:.0f} ms, "
+             f"{stats.queries} queries in {stats.sql_time * 1000:.0f} ms, {total} samples"]
+    for stack, count in stacks.most_common(PROFILE_TOP):
+        lines.append(f"  {count / total:.0%}  {_summarize_stack(stack)}")
+    logging.warning('\n'.join(lines))
+
+    if PROFILE_DIR:
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            name = f"{int(time.time() * 1000)}-{request.endpoint or 'unmatched'}.folded"
+            with open(os.path.join(PROFILE_DIR, name), 'w') as f:
+                for stack, count in stacks.items():
+                    f.write(f"{stack} {count}\n")
+        except OSError as e:
+            logging.error(f"Could not write profile: {e}")
+
+def _before_request():
+    stats = g._request_stats = RequestStats()
+    REQUESTS_IN_PROGRESS.inc()
+    if PROFILE_SLOW_REQUEST_MS > 0 and random.random() < PROFILE_SAMPLE_RATE:
+        profiler.start(threading.get_ident())
+        stats.profiled = True
+
+def _after_request(response):
+    stats = g.get('_request_stats')
+    if stats is None:
+        return response
+    elapsed = time.perf_counter() - stats.start
+    route = _route()
+    REQUESTS.inc(method=request.method, route=route, status=response.status_code)
+    REQUEST_DURATION.observe(elapsed, method=request.method, route=route)
+    REQUEST_QUERIES.observe(stats.queries, route=route)
+    REQUEST_SQL_DURATION.observe(stats.sql_time, route=route)
+
+    repeated = stats.repeated(N_PLUS_ONE_THRESHOLD)
+    if repeated:
+        N_PLUS_ONE.inc(route=route)
+        for shape, count in repeated:
+            logging.warning(f"Possible N+1 in {request.method} {route}: {count}x {shape[:300]}")
+
+    if stats.profiled:
+        stacks = profiler.stop(threading.get_ident())
+        stats.profiled = False
+        if stacks and elapsed * 1000 >= PROFILE_SLOW_REQUEST_MS:
+            _report_profile(route, elapsed, stats, stacks)
+    return response
+
+def _teardown_request(exc):
+    stats = g.pop('_request_stats', None)
+    if stats is None:
+        return
+    REQUESTS_IN_PROGRESS.dec()
+    if stats.profiled:
+        profiler.stop(threading.get_ident())
+
+def metrics_view():
+    if not METRICS_ENABLED:
+        return jsonify({'error': 'Not found'}), 404
+    if METRICS_TOKEN and not hmac.compare_digest(request.headers.get('Authorization', ''),
+                                                 f'Bearer {METRICS_TOKEN}'):
+        return jsonify({'error': 'Unauthorized'}), 401
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def init_app(app):
+    """Time requests and their SQL, and serve the metrics on /metrics
+    (when METRICS_ENABLED).
+    Set this up before other after_request hooks (e.g. compression), since
+    hooks run in reverse order and the latency should include theirs."""
+    hook_engines()
+    _app_files.update(name for name in os.listdir(app.root_path) if name.endswith('.py'))
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
@@ -1,6 +1,6 @@
 from database import db
 from datetime import datetime, timedelta
-from sqlalchemy import event
+from sqlalchemy import case, event, or_, update
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -36,6 +36,12 @@ class Ticket(db.Model):
     sla_due = db.Column(db.DateTime)
     sla_violated = db.Column(db.Boolean, default=False)
     
+    # Counters, kept by the listeners below and the bulk paths (repair them
+    # with `flask repair-ticket-counters`), so lists don't count per row
+    message_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    attachment_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    last_activity_at = db.Column(db.DateTime)  # Newest of creation, messages and attachments
+    
     # Foreign keys
     creator_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     assigned_to = db.Column(db.Integer, db.ForeignKey('user.id'))
@@ -43,6 +49,16 @@ class Ticket(db.Model):
     # Relationships
     messages = db.relationship('Message', backref='ticket', lazy='dynamic', cascade='all, delete-orphan')
     attachments = db.relationship('Attachment', backref='ticket', lazy='dynamic', cascade='all, delete-orphan')
+    
+    # Ticket lists are ordered newest first, for everyone or for one creator,
+    # or by recent activity; reports (reporting.py) pick a month's resolutions
+    __table_args__ = (
+        db.Index('ix_ticket_created_at', 'created_at'),
+        db.Index('ix_ticket_creator_created', 'creator_id', 'created_at'),
+        db.Index('ix_ticket_last_activity', 'last_activity_at'),
+        db.Index('ix_ticket_resolved_at', 'resolved_at'),
+        db.Index('ix_ticket_closed_at', 'closed_at'),
+    )
 
 class Message(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -53,6 +69,9 @@ class Message(db.Model):
     # Foreign keys
     ticket_id = db.Column(db.Integer, db.ForeignKey('ticket.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    
+    # A ticket's chat, oldest first (partitions.py moves old months out)
+    __table_args__ = (db.Index('ix_message_ticket_timestamp', 'ticket_id', 'timestamp'),)
 
 class Attachment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -69,10 +88,104 @@ class Attachment(db.Model):
     # Relationships
     uploader = db.relationship('User', backref='uploaded_files')
 
+class OutboxEvent(db.Model):
+    """Notification written in the same transaction as the ticket change and
+    delivered later by the notifications dispatcher"""
+    id = db.Column(db.Integer, primary_key=True)
+    event_type = db.Column(db.String(50), nullable=False)  # ticket.created, ticket.assigned, ...
+    channel = db.Column(db.String(20), nullable=False)  # email, webhook
+    endpoint = db.Column(db.String(500), nullable=False)  # Recipient address or webhook URL
+    payload = db.Column(db.Text, nullable=False)  # JSON
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+    
+    __table_args__ = (db.Index('ix_outbox_event_due', 'status', 'next_attempt_at'),)
+
+# Archive tier (archive.py): closed tickets moved out of the hot tables, with
+# their messages and attachment metadata. Same columns and ids as the hot
+# rows, plus when they were archived; read-only once there.
+class TicketArchive(db.Model):
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    title = db.Column(db.String(200), nullable=False)
+    description = db.Column(db.Text, nullable=False)
+    department = db.Column(db.String(100), nullable=False)
+    priority = db.Column(db.String(10), nullable=False)
+    status = db.Column(db.String(20))
+    observations = db.Column(db.Text)
+    created_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+    resolved_at = db.Column(db.DateTime)
+    closed_at = db.Column(db.DateTime)
+    sla_due = db.Column(db.DateTime)
+    sla_violated = db.Column(db.Boolean)
+    message_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    attachment_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    last_activity_at = db.Column(db.DateTime)
+    creator_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    assigned_to = db.Column(db.Integer, db.ForeignKey('user.id'))
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    creator = db.relationship('User', foreign_keys=[creator_id])
+    assignee = db.relationship('User', foreign_keys=[assigned_to])
+    messages = db.relationship('MessageArchive', backref='ticket', lazy='dynamic')
+    attachments = db.relationship('AttachmentArchive', backref='ticket', lazy='dynamic')
+    
+    __table_args__ = (
+        db.Index('ix_ticket_archive_created_at', 'created_at'),
+        db.Index('ix_ticket_archive_creator_created', 'creator_id', 'created_at'),
+        db.Index('ix_ticket_archive_resolved_at', 'resolved_at'),
+        db.Index('ix_ticket_archive_closed_at', 'closed_at'),
+    )
+
+class MessageArchive(db.Model):
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    content = db.Column(db.Text, nullable=False)
+    timestamp = db.Column(db.DateTime)
+    message_type = db.Column(db.String(20))
+    ticket_id = db.Column(db.Integer, db.ForeignKey('ticket_archive.id'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    
+    author = db.relationship('User')
+
+class AttachmentArchive(db.Model):
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    filename = db.Column(db.String(255), nullable=False)
+    original_filename = db.Column(db.String(255), nullable=False)
+    file_size = db.Column(db.Integer, nullable=False)
+    mime_type = db.Column(db.String(100), nullable=False)
+    uploaded_at = db.Column(db.DateTime)
+    ticket_id = db.Column(db.Integer, db.ForeignKey('ticket_archive.id'), nullable=False, index=True)
+    uploaded_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    
+    uploader = db.relationship('User')
+
+class ReplicaHeartbeat(db.Model):
+    """One row, stamped on the primary by replicas.py; how far behind a
+    replica's copy is tells its replication lag"""
+    id = db.Column(db.Integer, primary_key=True)
+    beat_at = db.Column(db.Float, nullable=False)  # Unix time
+
+class ReportPeriod(db.Model):
+    """Report figures of one month, stored by reporting.py; final ones are
+    never recomputed"""
+    period = db.Column(db.String(6), primary_key=True)  # YYYYMM
+    data = db.Column(db.Text, nullable=False)  # JSON
+    final = db.Column(db.Boolean, nullable=False, default=False)
+    computed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
 # Event listeners for SLA calculation
 @event.listens_for(Ticket, 'before_insert')
 def calculate_sla_on_insert(mapper, connection, target):
     """Calculate SLA due date when ticket is created"""
+    # Column defaults are applied after this hook, so set created_at here
+    if target.created_at is None:
+        target.created_at = datetime.utcnow()
+    if target.last_activity_at is None:
+        target.last_activity_at = target.created_at
     if target.priority == 'Alta':
         target.sla_due = target.created_at + timedelta(hours=4)
     elif target.priority == 'Média':
@@ -91,3 +204,33 @@ def update_timestamps_on_update(mapper, connection, target):
     # Check SLA violation
     if target.status not in ['Resolvido', 'Fechado'] and target.sla_due:
         target.sla_violated = datetime.utcnow() > target.sla_due
+
+# Event listeners for the ticket counters. Statements on the connection join
+# the flush's transaction; they go around the ORM, so a ticket loaded in the
+# session shows its old counts until the commit expires it.
+def _count(connection, ticket_id, column, delta, at=None):
+    ticket = Ticket.__table__
+    # A message is activity, not an edit: updated_at stays as it is
+    values = {column: ticket.c[column] + delta, 'updated_at': ticket.c.updated_at}
+    if at is not None:
+        values['last_activity_at'] = case(
+            (or_(ticket.c.last_activity_at.is_(None), ticket.c.last_activity_at < at), at),
+            else_=ticket.c.last_activity_at
+        )
+    connection.execute(update(ticket).where(ticket.c.id == ticket_id).values(**values))
+
+@event.listens_for(Message, 'after_insert')
+def count_new_message(mapper, connection, target):
+    _count(connection, target.ticket_id, 'message_count', 1, target.timestamp)
+
+@event.listens_for(Message, 'after_delete')
+def count_deleted_message(mapper, connection, target):
+    _count(connection, target.ticket_id, 'message_count', -1)
+
+@event.listens_for(Attachment, 'after_insert')
+def count_new_attachment(mapper, connection, target):
+    _count(connection, target.ticket_id, 'attachment_count', 1, target.uploaded_at)
+
+@event.listens_for(Attachment, 'after_delete')
+def count_deleted_attachment(mapper, connection, target):
+    _count(connection, target.ticket_id, 'attachment_count', -1)
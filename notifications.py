@@ -0,0 +1,388 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+import click
+from sqlalchemy import event, inspect, insert, select, update
+
+# models and the SMTP/HTTP clients are imported where they are used: the
+# listeners are registered at startup by both apps, and simple_app doesn't
+# otherwise load them at import
+
+# Where notifications go. Webhooks get every ticket event; emails go to the
+# assignee of a newly assigned ticket and to the creator when the status
+# changes, and only if an SMTP host is configured.
+WEBHOOK_URLS = [u.strip() for u in os.environ.get("NOTIFY_WEBHOOK_URLS", "").split(",") if u.strip()]
+SMTP_HOST = os.environ.get("NOTIFY_SMTP_HOST", "")
+SMTP_PORT = int(os.environ.get("NOTIFY_SMTP_PORT", 25))
+SMTP_USER = os.environ.get("NOTIFY_SMTP_USER", "")
+SMTP_PASSWORD = os.environ.get("NOTIFY_SMTP_PASSWORD", "")
+SMTP_STARTTLS = os.environ.get("NOTIFY_SMTP_STARTTLS", "0") == "1"
+MAIL_FROM = os.environ.get("NOTIFY_MAIL_FROM", "helpdesk@localhost")
+
+# Dispatcher: events due are fetched BATCH_SIZE at a time and delivered with
+# at most ENDPOINT_CONCURRENCY deliveries in flight per host. Up to
+# DELIVERY_BATCH_SIZE events share one webhook request or SMTP connection.
+BATCH_SIZE = int(os.environ.get("NOTIFY_BATCH_SIZE", 100))
+DELIVERY_BATCH_SIZE = int(os.environ.get("NOTIFY_DELIVERY_BATCH_SIZE", 20))
+ENDPOINT_CONCURRENCY = int(os.environ.get("NOTIFY_ENDPOINT_CONCURRENCY", 2))
+WORKERS = int(os.environ.get("NOTIFY_WORKERS", 8))
+TIMEOUT = float(os.environ.get("NOTIFY_TIMEOUT", 5))
+POLL_INTERVAL = float(os.environ.get("NOTIFY_POLL_INTERVAL", 1))
+
+# Failed deliveries are retried with exponential backoff and jitter, and
+# given up after MAX_ATTEMPTS. A claimed event is hidden from other
+# dispatchers for LEASE_SECONDS. A delivery waits up to ADMIT_TIMEOUT
+# seconds for a slot of its endpoint; events that don't get one are handed
+# back as they were, with no attempt counted.
+MAX_ATTEMPTS = int(os.environ.get("NOTIFY_MAX_ATTEMPTS", 8))
+BACKOFF_BASE = float(os.environ.get("NOTIFY_BACKOFF_BASE", 5))
+BACKOFF_MAX = float(os.environ.get("NOTIFY_BACKOFF_MAX", 3600))
+LEASE_SECONDS = 60
+ADMIT_TIMEOUT = LEASE_SECONDS / 2
+
+_available = {}
+
+def backoff(attempts):
+    """Seconds to wait before the next attempt after `attempts` failures"""
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+def _outbox_available(connection):
+    """Check (and remember per engine) whether the outbox table exists,
+    re-checking a missing one every 30s"""
+    key = connection.engine.url
+    cached = _available.get(key)
+    if cached is True or (cached is not None and cached > time.monotonic()):
+        return cached is True
+    from models import OutboxEvent
+    exists = inspect(connection).has_table(OutboxEvent.__tablename__)
+    _available[key] = True if exists else time.monotonic() + 30
+    return exists
+
+def _ticket_payload(change):
+    return {
+        'id': change.ticket_id,
+        'title': change.title,
+        'department': change.department,
+        'status': change.status,
+        'priority': change.priority,
+        'assigned_to': change.assigned_to,
+        'creator_id': change.creator_id,
+        'sla_due': change.sla_due.isoformat() if change.sla_due else None,
+    }
+
+def _jsonable(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def build_events(changes, emails):
+    """Outbox rows for committed ticket changes. emails maps user id to
+    address for the users that may be mailed."""
+    rows = []
+    now = datetime.utcnow()
+
+    def add(event_type, channel, endpoint, change):
+        rows.append({
+            'event_type': event_type, 'channel': channel, 'endpoint': endpoint,
+            'payload': json.dumps({
+                'event': event_type,
+                'ticket': _ticket_payload(change),
+                'previous': {k: _jsonable(v) for k, v in change.previous.items()},
+                'occurred_at': now.isoformat(),
+            }),
+            'status': 'pending', 'attempts': 0, 'next_attempt_at': now, 'created_at': now,
+        })
+
+    for change in changes:
+        for url in WEBHOOK_URLS:
+            add(f'ticket.{change.action}', 'webhook', url, change)
+        if not SMTP_HOST or change.action == 'deleted':
+            continue
+        newly_assigned = change.assigned_to and (change.action == 'created' or 'assigned_to' in change.previous)
+        if newly_assigned and emails.get(change.assigned_to):
+            add('ticket.assigned', 'email', emails[change.assigned_to], change)
+        if 'status' in change.previous and emails.get(change.creator_id):
+            add('ticket.status_changed', 'email', emails[change.creator_id], change)
+    return rows
+
+# Outbox rows are inserted right before the commit, in the same transaction
+# as the ticket changes they describe
+def _before_commit(session):
+    session.flush()
+    changes = session.info.get('ticket_changes') or []
+    seen = session.info.get('outbox_seen', 0)
+    if len(changes) <= seen:
+        return
+    session.info['outbox_seen'] = len(changes)
+    if not (WEBHOOK_URLS or SMTP_HOST):
+        return
+    connection = session.connection()
+    if not _outbox_available(connection):
+        return
+
+    from models import OutboxEvent, User
+    emails = {}
+    if SMTP_HOST:
+        user_ids = {c.assigned_to for c in changes[seen:]} | {c.creator_id for c in changes[seen:]}
+        user_ids.discard(None)
+        if user_ids:
+            emails = dict(connection.execute(
+                select(User.id, User.email).where(User.id.in_(user_ids), User.active.is_(True))
+            ).all())
+
+    rows = build_events(changes[seen:], emails)
+    if rows:
+        connection.execute(insert(OutboxEvent), rows)
+
+def _reset(session):
+    session.info.pop('outbox_seen', None)
+
+def register_listeners(scoped_session):
+    """Write notifications for ticket changes committed through this session.
+    Must be registered after ticket_events.register_listeners()."""
+    for name, listener in (('before_commit', _before_commit), ('after_commit', _reset),
+                           ('after_rollback', _reset)):
+        if not event.contains(scoped_session, name, listener):
+            event.listen(scoped_session, name, listener)
+
+# Delivery
+
+class DeliveryError(Exception):
+    """A notification could not be delivered"""
+
+def _render_email(payload):
+    from email.message import EmailMessage
+    ticket = payload['ticket']
+    message = EmailMessage()
+    message['From'] = MAIL_FROM
+    if payload['event'] == 'ticket.assigned':
+        message['Subject'] = f"[Chamado #{ticket['id']}] Atribuído a você: {ticket['title']}"
+        body = f"O chamado #{ticket['id']} ({ticket['priority']}) foi atribuído a você."
+    else:
+        message['Subject'] = f"[Chamado #{ticket['id']}] Status: {ticket['status']}"
+        body = (f"O status do seu chamado #{ticket['id']} mudou de "
+                f"'{payload['previous'].get('status')}' para '{ticket['status']}'.")
+    message.set_content(f"{body}\n\n{ticket['title']}\nDepartamento: {ticket['department']}\n")
+    return message
+
+def send_emails(events, results):
+    """Send emails over one SMTP connection, recording {event id: error or
+    None} in results as each one goes out, so a connection lost halfway
+    leaves the ones already sent marked as such"""
+    import smtplib
+    with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=TIMEOUT) as smtp:
+        if SMTP_STARTTLS:
+            smtp.starttls()
+        if SMTP_USER:
+            smtp.login(SMTP_USER, SMTP_PASSWORD)
+        for outbox_event in events:
+            message = _render_email(json.loads(outbox_event.payload))
+            message['To'] = outbox_event.endpoint
+            try:
+                smtp.send_message(message)
+                results[outbox_event.id] = None
+            except smtplib.SMTPException as e:
+                results[outbox_event.id] = str(e)
+
+def post_webhook(url, events):
+    """POST a batch of events to one webhook URL"""
+    import urllib.error
+    import urllib.request
+    body = json.dumps({'events': [json.loads(e.payload) for e in events]}).encode()
+    request = urllib.request.Request(url, data=body, method='POST', headers={
+        'Content-Type': 'application/json', 'User-Agent': 'helpdesk-notifications'
+    })
+    try:
+        with urllib.request.urlopen(request, timeout=TIMEOUT) as response:
+            if not 200 <= response.status < 300:
+                raise DeliveryError(f"HTTP {response.status}")
+    except urllib.error.HTTPError as e:
+        raise DeliveryError(f"HTTP {e.code}")
+    except (urllib.error.URLError, OSError) as e:
+        raise DeliveryError(str(getattr(e, 'reason', e)))
+
+class Dispatcher:
+    """Drains the outbox: claims due events, delivers them grouped by
+    endpoint and records the outcome"""
+
+    def __init__(self, app, db):
+        self.app = app
+        self.db = db
+        self._executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='notify')
+        self._limits = {}  # endpoint key -> semaphore, see _limit()
+        self._lock = threading.Lock()
+        self._run_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _limit(self, key):
+        # The delivery threads look endpoints up at the same time; two
+        # semaphores for one endpoint would double its concurrency
+        with self._lock:
+            if key not in self._limits:
+                self._limits[key] = threading.BoundedSemaphore(ENDPOINT_CONCURRENCY)
+            return self._limits[key]
+
+    def _claim(self):
+        """Take up to BATCH_SIZE due events and lease them to this dispatcher"""
+        now = datetime.utcnow()
+        return self._lease(self._due(now), now)
+
+    def _due(self, now):
+        from models import OutboxEvent
+        # Plain rows, so the delivery threads never touch the session
+        return self.db.session.query(
+            OutboxEvent.id, OutboxEvent.channel, OutboxEvent.endpoint, OutboxEvent.payload, OutboxEvent.attempts
+        ).filter(
+            OutboxEvent.status == 'pending', OutboxEvent.next_attempt_at <= now
+        ).order_by(OutboxEvent.next_attempt_at).limit(BATCH_SIZE).with_for_update(skip_locked=True).all()
+
+    def _lease(self, events, now):
+        """Lease the events that are still due. SKIP LOCKED keeps PostgreSQL
+        dispatchers off each other's rows; SQLite ignores it, so each event
+        is taken with an UPDATE that only matches while it is due, and one
+        another dispatcher got first is dropped."""
+        from models import OutboxEvent
+        session = self.db.session
+        claimed = []
+        for e in events:
+            result = session.execute(
+                update(OutboxEvent).where(
+                    OutboxEvent.id == e.id, OutboxEvent.status == 'pending', OutboxEvent.next_attempt_at <= now
+                ).values(next_attempt_at=now + timedelta(seconds=LEASE_SECONDS)),
+                execution_options={'synchronize_session': False}
+            )
+            if result.rowcount == 1:
+                claimed.append(e)
+        session.commit()
+        return claimed
+
+    def _deliver(self, key, channel, endpoint, events):
+        """{event id: error or None} of the events sent, or {} when the
+        endpoint had no free slot and nothing was attempted"""
+        import smtplib
+        limit = self._limit(key)
+        if not limit.acquire(timeout=ADMIT_TIMEOUT):
+            logging.warning(f"Notifications to {key} not admitted; {len(events)} handed back")
+            return {}
+        results = {}
+        try:
+            try:
+                if channel == 'email':
+                    send_emails(events, results)
+                else:
+                    post_webhook(endpoint, events)
+                    results.update((e.id, None) for e in events)
+            except (DeliveryError, smtplib.SMTPException, OSError) as e:
+                # Only what didn't go out is retried
+                results.update((ev.id, str(e)) for ev in events if ev.id not in results)
+        finally:
+            limit.release()
+        return results
+
+    def run_once(self):
+        """Deliver one batch. Returns (sent, failed) counts."""
+        # One batch at a time, so a direct call doesn't record over the
+        # dispatcher thread's batch
+        with self._run_lock, self.app.app_context():
+            events = self._claim()
+            if not events:
+                return 0, 0
+
+            jobs = []
+            for channel, endpoint, group in self._group(events):
+                key = f"smtp://{SMTP_HOST}:{SMTP_PORT}" if channel == 'email' else urlsplit(endpoint).netloc
+                jobs.append(self._executor.submit(self._deliver, key, channel, endpoint, group))
+            results = {}
+            for job in jobs:
+                results.update(job.result())
+            return self._record(events, results)
+
+    def _group(self, events):
+        """(channel, endpoint, events) jobs: emails to any recipient share
+        an SMTP connection, webhook events are batched per URL"""
+        by_endpoint = defaultdict(list)
+        for e in events:
+            by_endpoint[('email', None) if e.channel == 'email' else (e.channel, e.endpoint)].append(e)
+        for (channel, endpoint), group in by_endpoint.items():
+            for start in range(0, len(group), DELIVERY_BATCH_SIZE):
+                yield channel, endpoint, group[start:start + DELIVERY_BATCH_SIZE]
+
+    def _record(self, events, results):
+        """Mark delivered events sent and reschedule (or give up) the others,
+        with one executemany UPDATE. Events that weren't admitted have no
+        result: their lease is released and nothing else changes."""
+        from models import OutboxEvent
+        now = datetime.utcnow()
+        values = []
+        handed_back = []
+        for e in events:
+            if e.id not in results:
+                handed_back.append(e.id)
+                continue
+            error = results[e.id]
+            attempts = e.attempts + 1
+            if error is None:
+                values.append({'id': e.id, 'status': 'sent', 'attempts': attempts, 'sent_at': now,
+                               'last_error': None, 'next_attempt_at': now})
+            elif attempts >= MAX_ATTEMPTS:
+                logging.error(f"Notification {e.id} to {e.endpoint} given up after {attempts} attempts: {error}")
+                values.append({'id': e.id, 'status': 'failed', 'attempts': attempts, 'sent_at': None,
+                               'last_error': error[:1000], 'next_attempt_at': now})
+            else:
+                values.append({'id': e.id, 'status': 'pending', 'attempts': attempts, 'sent_at': None,
+                               'last_error': error[:1000],
+                               'next_attempt_at': now + timedelta(seconds=backoff(attempts))})
+        session = self.db.session
+        if values:
+            session.execute(update(OutboxEvent), values)
+        if handed_back:
+            session.execute(update(OutboxEvent).where(OutboxEvent.id.in_(handed_back)).values(next_attempt_at=now),
+                            execution_options={'synchronize_session': False})
+        session.commit()
+        sent = sum(1 for v in values if v['status'] == 'sent')
+        return sent, len(values) - sent
+
+    def run_forever(self):
+        while not self._stop.is_set():
+            try:
+                sent, failed = self.run_once()
+            except Exception as e:
+                logging.error(f"Notification dispatcher error: {e}")
+                sent = failed = 0
+            if not sent and not failed:
+                self._stop.wait(POLL_INTERVAL)
+
+    def stop(self):
+        self._stop.set()
+
+def start_dispatcher(app, db):
+    """Run a dispatcher on a daemon thread of this process"""
+    dispatcher = Dispatcher(app, db)
+    threading.Thread(target=dispatcher.run_forever, name='notify-dispatcher', daemon=True).start()
+    return dispatcher
+
+def register_commands(app, db):
+
+    @app.cli.command('dispatch-notifications')
+    @click.option('--once', is_flag=True, help='Deliver what is due and exit.')
+    def dispatch_notifications_command(once):
+        """Deliver pending notifications from the outbox."""
+        dispatcher = Dispatcher(app, db)
+        if not once:
+            click.echo("Dispatching notifications, Ctrl+C to stop")
+            dispatcher.run_forever()
+            return
+        total_sent = total_failed = 0
+        while True:
+            sent, failed = dispatcher.run_once()
+            if not sent and not failed:
+                break
+            total_sent += sent
+            total_failed += failed
+        click.echo(f"{total_sent} sent, {total_failed} failed")
@@ -0,0 +1,266 @@
+import logging
+import os
+import re
+from datetime import datetime
+import click
+from flask import g, has_request_context
+from sqlalchemy import Column, Index, MetaData, Table, create_engine, delete, func, insert, inspect, select, text, \
+    union_all
+
+# Chat messages by month. `message` holds the hot months: the current one and
+# the MESSAGE_HOT_MONTHS - 1 before it. `flask rotate-messages` moves older
+# months out into one table per month, message_YYYYMM:
+#   - PostgreSQL: `message` is partitioned by range of timestamp, with a
+#     partition per month (created MESSAGE_PARTITIONS_AHEAD months ahead) and
+#     a default one. Old partitions are detached, a catalog change, not a copy.
+#   - SQLite: `message` is one table; old rows are copied to their month's
+#     table in batches and deleted.
+# Recent history only reads `message`. A ticket's full history adds the
+# month tables from its creation month on (ticket_messages()). Month tables
+# are write-once, so they can be moved to another file or dropped whole
+# (`flask retire-message-period`) instead of deleting rows from a big table.
+MESSAGE_HOT_MONTHS = int(os.environ.get("MESSAGE_HOT_MONTHS", 3))
+MESSAGE_PARTITIONS_AHEAD = int(os.environ.get("MESSAGE_PARTITIONS_AHEAD", 2))
+ROTATE_BATCH_SIZE = int(os.environ.get("MESSAGE_ROTATE_BATCH_SIZE", 5000))
+ROTATE_LOCK_TIMEOUT_MS = int(os.environ.get("MESSAGE_ROTATE_LOCK_TIMEOUT_MS", 5000))
+
+PERIOD_TABLE = re.compile(r'^message_(\d{6})$')
+DEFAULT_PARTITION = 'message_default'
+
+_metadata = MetaData()
+
+def _message_table():
+    import models
+    return models.Message.__table__
+
+def period_of(moment):
+    return f"{moment.year:04d}{moment.month:02d}"
+
+def period_start(period):
+    return datetime(int(period[:4]), int(period[4:]), 1)
+
+def add_months(moment, months):
+    """First day of the month months after moment's"""
+    index = moment.year * 12 + moment.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+def hot_since(now=None):
+    """Start of the oldest month kept in `message`"""
+    return add_months(now or datetime.utcnow(), -(MESSAGE_HOT_MONTHS - 1))
+
+def period_table(period):
+    """The month table of a period, with the message columns and no foreign
+    keys (its ticket may be archived)"""
+    name = f'message_{period}'
+    if name in _metadata.tables:
+        return _metadata.tables[name]
+    columns = [Column(c.name, c.type, primary_key=c.primary_key, autoincrement=False, nullable=c.nullable)
+               for c in _message_table().columns]
+    return Table(name, _metadata, *columns, Index(f'ix_{name}_ticket_timestamp', 'ticket_id', 'timestamp'))
+
+def _is_postgresql(connection):
+    return connection.engine.dialect.name == 'postgresql'
+
+def _attached_partitions(connection):
+    return set(connection.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = 'message'"
+    )).scalars())
+
+def _find_periods(connection):
+    names = inspect(connection).get_table_names()
+    if _is_postgresql(connection):
+        attached = _attached_partitions(connection)
+        names = [name for name in names if name not in attached]
+    return sorted(m.group(1) for m in map(PERIOD_TABLE.match, names) if m)
+
+def periods(connection):
+    """Months moved out of `message`, oldest first. Looked up once per request."""
+    if not has_request_context():
+        return _find_periods(connection)
+    if '_message_periods' not in g:
+        g._message_periods = _find_periods(connection)
+    return g._message_periods
+
+def message_tables(connection, since=None):
+    """`message` and the month tables that can hold messages from since on"""
+    tables = [_message_table()]
+    first = period_of(since) if since else None
+    tables += [period_table(p) for p in periods(connection) if first is None or p >= first]
+    return tables
+
+def ticket_messages(session, ticket_id, since=None):
+    """Rows (the message columns) of a ticket's messages, oldest first. since
+    is the ticket's creation: older month tables can't hold its messages."""
+    tables = message_tables(session.connection(), since)
+    selects = [select(*t.columns).where(t.c.ticket_id == ticket_id) for t in tables]
+    if len(selects) == 1:
+        return session.execute(selects[0].order_by(tables[0].c.timestamp)).all()
+    query = union_all(*selects).subquery()
+    return session.execute(select(query).order_by(query.c.timestamp, query.c.id)).all()
+
+def _create_partition(connection, period):
+    """Attach the month's partition on PostgreSQL, taking its rows out of the
+    default partition first (attaching fails while the default holds any)"""
+    name = f'message_{period}'
+    start, end = period_start(period), add_months(period_start(period), 1)
+    connection.execute(text(f"CREATE TABLE IF NOT EXISTS {name} (LIKE message INCLUDING DEFAULTS)"))
+    bounds = {'start': start, 'end': end}
+    connection.execute(text(
+        f"INSERT INTO {name} SELECT * FROM {DEFAULT_PARTITION} WHERE timestamp >= :start AND timestamp < :end"
+    ), bounds)
+    connection.execute(text(f"DELETE FROM {DEFAULT_PARTITION} WHERE timestamp >= :start AND timestamp < :end"), bounds)
+    connection.execute(text(
+        f"ALTER TABLE message ATTACH PARTITION {name} FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+    ))
+
+def partition_table(db):
+    """Migration: turn `message` into a table partitioned by month on
+    PostgreSQL (a copy, so run it during a quiet period); nothing to do on
+    SQLite. Adds the (ticket_id, timestamp) index either way."""
+    index = next(i for i in _message_table().indexes if i.name == 'ix_message_ticket_timestamp')
+    with db.engine.begin() as connection:
+        if not _is_postgresql(connection) or connection.execute(text(
+                "SELECT relkind FROM pg_class WHERE relname = 'message'")).scalar() == 'p':
+            index.create(connection, checkfirst=True)
+            return
+
+        # The partition key has to be part of the primary key, so not null
+        connection.execute(text(
+            "UPDATE message SET timestamp = coalesce((SELECT created_at FROM ticket WHERE ticket.id = message.ticket_id), "
+            "now() AT TIME ZONE 'utc') WHERE timestamp IS NULL"
+        ))
+        sequence = connection.execute(text("SELECT pg_get_serial_sequence('message', 'id')")).scalar()
+        connection.execute(text("ALTER TABLE message RENAME TO message_unpartitioned"))
+        connection.execute(text("ALTER TABLE message_unpartitioned RENAME CONSTRAINT message_pkey TO message_unpartitioned_pkey"))
+        connection.execute(text(
+            "CREATE TABLE message (LIKE message_unpartitioned INCLUDING DEFAULTS) PARTITION BY RANGE (timestamp)"
+        ))
+        connection.execute(text("ALTER TABLE message ALTER COLUMN timestamp SET NOT NULL"))
+        connection.execute(text("ALTER TABLE message ADD CONSTRAINT message_pkey PRIMARY KEY (id, timestamp)"))
+        connection.execute(text("ALTER TABLE message ADD FOREIGN KEY (ticket_id) REFERENCES ticket (id)"))
+        connection.execute(text('ALTER TABLE message ADD FOREIGN KEY (user_id) REFERENCES "user" (id)'))
+        connection.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF message DEFAULT"))
+
+        oldest = connection.execute(text("SELECT min(timestamp) FROM message_unpartitioned")).scalar()
+        month = add_months(oldest or datetime.utcnow(), 0)
+        last = add_months(datetime.utcnow(), MESSAGE_PARTITIONS_AHEAD)
+        while month <= last:
+            _create_partition(connection, period_of(month))
+            month = add_months(month, 1)
+
+        connection.execute(text("INSERT INTO message SELECT * FROM message_unpartitioned"))
+        if sequence:
+            connection.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY message.id"))
+        connection.execute(text("DROP TABLE message_unpartitioned"))
+        index.create(connection)
+
+def _move_rows(engine, source, before, batch_size):
+    """Copy the rows of source older than before into their month tables and
+    delete them, batch_size rows per transaction. The newest message is
+    never moved: SQLite would hand its id out again. Yields (period, rows)."""
+    while True:
+        with engine.begin() as connection:
+            newest = connection.execute(select(func.max(_message_table().c.id))).scalar()
+            oldest = connection.execute(select(func.min(source.c.timestamp)).where(source.c.timestamp < before)).scalar()
+            if oldest is None:
+                return
+            period = period_of(oldest)
+            start, end = period_start(period), add_months(oldest, 1)
+            target = period_table(period)
+            target.create(connection, checkfirst=True)
+            ids = select(source.c.id).where(source.c.timestamp >= start, source.c.timestamp < min(end, before))
+            if newest is not None:
+                ids = ids.where(source.c.id != newest)
+            ids = [row[0] for row in connection.execute(ids.order_by(source.c.id).limit(batch_size))]
+            if not ids:
+                return
+            connection.execute(insert(target).from_select(
+                [c.name for c in source.columns], select(*source.columns).where(source.c.id.in_(ids))
+            ))
+            connection.execute(delete(source).where(source.c.id.in_(ids)))
+        yield period, len(ids)
+
+def _lock_timeout(connection):
+    # Attaching and detaching wait for the readers of `message`; while they
+    # wait, new messages queue behind them. Give up instead and retry later.
+    connection.execute(text(f"SET LOCAL lock_timeout = {ROTATE_LOCK_TIMEOUT_MS}"))
+
+def rotate(engine, now=None, batch_size=ROTATE_BATCH_SIZE):
+    """Move the months before the hot ones out of `message`; on PostgreSQL
+    also create the coming months' partitions. Yields (period, rows) as
+    it goes (rows is None for a detached partition)."""
+    now = now or datetime.utcnow()
+    since = hot_since(now)
+    if engine.dialect.name == 'postgresql':
+        with engine.begin() as connection:
+            _lock_timeout(connection)
+            attached = _attached_partitions(connection)
+            month = since
+            while month <= add_months(now, MESSAGE_PARTITIONS_AHEAD):
+                if f'message_{period_of(month)}' not in attached:
+                    _create_partition(connection, period_of(month))
+                month = add_months(month, 1)
+        for name in sorted(attached):
+            match = PERIOD_TABLE.match(name)
+            if match and match.group(1) < period_of(since):
+                with engine.begin() as connection:
+                    _lock_timeout(connection)
+                    connection.execute(text(f"ALTER TABLE message DETACH PARTITION {name}"))
+                yield match.group(1), None
+        # Rows that landed in the default partition before their month existed
+        source = Table(DEFAULT_PARTITION, MetaData(), *(Column(c.name, c.type) for c in _message_table().columns))
+    else:
+        source = _message_table()
+    yield from _move_rows(engine, source, since, batch_size)
+
+def retire(engine, period, into=None):
+    """Drop a month table and its search documents, after copying it into
+    the SQLite file into when given. Returns the number of messages."""
+    import search
+    import ticket_counters
+    table = period_table(period)
+    with engine.connect() as connection:
+        if period not in _find_periods(connection):
+            raise click.ClickException(f"No message table for {period}")
+        count = connection.execute(select(func.count()).select_from(table)).scalar()
+        if into:
+            cold = create_engine(f"sqlite:///{os.path.abspath(into)}")
+            with cold.begin() as cold_connection:
+                table.create(cold_connection, checkfirst=True)
+                result = connection.execution_options(yield_per=ROTATE_BATCH_SIZE).execute(select(*table.columns))
+                for rows in result.mappings().partitions():
+                    # OR REPLACE: a retry after a failed drop copies the rows again
+                    cold_connection.execute(insert(table).prefix_with('OR REPLACE'), [dict(row) for row in rows])
+            cold.dispose()
+
+    with engine.begin() as connection:
+        if search.index_available(connection):
+            search.remove_messages_in(connection, table.name)
+        ticket_counters.forget_messages(connection, table)
+        table.drop(connection)
+    return count
+
+def register_commands(app, db):
+
+    @app.cli.command('rotate-messages')
+    @click.option('--batch-size', default=ROTATE_BATCH_SIZE, show_default=True, help='Messages per transaction.')
+    def rotate_messages_command(batch_size):
+        """Move messages older than the hot months to their month tables."""
+        moved = {}
+        for period, rows in rotate(db.engine, batch_size=batch_size):
+            if rows is None:
+                click.echo(f"Detached partition {period}")
+            else:
+                moved[period] = moved.get(period, 0) + rows
+                click.echo(f"{period}: {moved[period]} message(s) moved")
+        logging.info(f"Message rotation done: {sum(moved.values())} message(s) moved")
+        click.echo(f"Hot months start at {hot_since():%Y-%m}")
+
+    @app.cli.command('retire-message-period')
+    @click.argument('period')
+    @click.option('--into', help='SQLite file to copy the messages to before dropping them.')
+    def retire_message_period_command(period, into):
+        """Drop the month table PERIOD (YYYYMM), optionally keeping a copy."""
+        count = retire(db.engine, period, into)
+        click.echo(f"{count} message(s) of {period} retired" + (f" to {into}" if into else ""))
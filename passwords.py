@@ -0,0 +1,123 @@
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.security import generate_password_hash, check_password_hash
+import concurrency
+
+# Hash method for new and upgraded hashes, in werkzeug's format,
+# e.g. "scrypt:32768:8:1" or "pbkdf2:sha256:600000"
+HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD", "scrypt")
+
+# Hashing runs on a dedicated pool so a login storm can't take over the
+# request threads. hashlib releases the GIL while hashing, so the workers
+# use real cores.
+HASH_WORKERS = int(os.environ.get("LOGIN_HASH_WORKERS", os.cpu_count() or 2))
+QUEUE_LIMIT = int(os.environ.get("LOGIN_QUEUE_LIMIT", HASH_WORKERS * 8))
+QUEUE_TIMEOUT = float(os.environ.get("LOGIN_QUEUE_TIMEOUT", 5))
+
+# Successful verifications are remembered for a short time, keyed by an HMAC
+# of (stored hash, password), so repeated logins skip the slow hash. A
+# password change alters the stored hash and therefore the key. 0 disables.
+CACHE_TTL = float(os.environ.get("LOGIN_CACHE_TTL", 300))
+CACHE_SIZE = int(os.environ.get("LOGIN_CACHE_SIZE", 4096))
+
+class LoginBusy(Exception):
+    """Raised when too many password checks are already queued"""
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(QUEUE_LIMIT)
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_cache_key = os.urandom(32)
+
+_method_prefix = None
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix='password-hash')
+    return _executor
+
+def _run_bounded(fn, *args):
+    """Run fn on the hashing pool, waiting at most QUEUE_TIMEOUT for a slot"""
+    if not _slots.acquire(timeout=QUEUE_TIMEOUT):
+        raise LoginBusy("Too many concurrent logins")
+    try:
+        # Pool threads are green threads once the stdlib is patched
+        if concurrency.patched():
+            return concurrency.run_in_thread(fn, *args)
+        return _get_executor().submit(fn, *args).result()
+    finally:
+        _slots.release()
+
+def _verification_key(password_hash, password):
+    message = password_hash.encode() + b'\0' + password.encode()
+    return hmac.new(_cache_key, message, hashlib.sha256).digest()
+
+def _cache_hit(key):
+    with _cache_lock:
+        expires = _cache.get(key)
+        if expires is None:
+            return False
+        if expires < time.monotonic():
+            del _cache[key]
+            return False
+        _cache.move_to_end(key)
+        return True
+
+def _cache_store(key):
+    with _cache_lock:
+        _cache[key] = time.monotonic() + CACHE_TTL
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+
+def clear_cache():
+    """Forget all remembered verifications"""
+    with _cache_lock:
+        _cache.clear()
+
+def hash_password(password):
+    """Hash a password with the configured method"""
+    return generate_password_hash(password, method=HASH_METHOD)
+
+def method_prefix():
+    """Get the fully expanded method of the configured hash (e.g. "scrypt:32768:8:1")"""
+    global _method_prefix
+    if _method_prefix is None:
+        _method_prefix = hash_password('').split('$', 1)[0]
+    return _method_prefix
+
+def needs_rehash(password_hash):
+    """Check whether a stored hash was made with a different method or cost"""
+    return password_hash.split('$', 1)[0] != method_prefix()
+
+def verify_password(password_hash, password):
+    """Check a password against a stored hash on the bounded hashing pool"""
+    key = None
+    if CACHE_TTL > 0:
+        key = _verification_key(password_hash, password)
+        if _cache_hit(key):
+            return True
+
+    valid = _run_bounded(check_password_hash, password_hash, password)
+    if valid and key is not None:
+        _cache_store(key)
+    return valid
+
+def check_user_password(user, password):
+    """Verify a login and transparently upgrade an outdated hash on success.
+    The new hash is set on the user; the caller commits the session."""
+    if not verify_password(user.password_hash, password):
+        return False
+    if needs_rehash(user.password_hash):
+        user.password_hash = _run_bounded(hash_password, password)
+    return True
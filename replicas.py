@@ -0,0 +1,206 @@
+import functools
+import logging
+import os
+import random
+import threading
+import time
+import click
+from flask import g, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import insert, select, update
+import db_tuning
+import metrics
+
+# Views marked @read_only (reports, exports, dashboard stats) read from one of
+# DATABASE_REPLICA_URLS (comma-separated) instead of the primary, as long as:
+#   - the replica is at most REPLICA_MAX_LAG_SECONDS behind. Lag is measured
+#     every REPLICA_CHECK_INTERVAL_SECONDS from a heartbeat row the primary
+#     stamps, so it is only known to about that resolution; keep the max lag
+#     above the interval.
+#   - the browser hasn't written anything in the last READ_YOUR_WRITES_SECONDS
+#     (a cookie set after any request that wrote), so users see their own
+#     changes.
+#   - nothing was written earlier in the same session.
+# Everything else, and all writes, go to the primary. Replicas are also
+# Flask-SQLAlchemy binds (replica_1, replica_2, ...), so db_tuning sees them.
+# Two SQLite files work for trying it out: "replicate" with
+# `sqlite3 primary.db ".backup replica.db"` (a plain copy misses the WAL),
+# and the replica falls behind until the next backup.
+REPLICA_URLS = [url.strip() for url in os.environ.get("DATABASE_REPLICA_URLS", "").split(',') if url.strip()]
+REPLICA_MAX_LAG = float(os.environ.get("REPLICA_MAX_LAG_SECONDS", 5))
+REPLICA_CHECK_INTERVAL = float(os.environ.get("REPLICA_CHECK_INTERVAL_SECONDS", 2))
+READ_YOUR_WRITES_SECONDS = float(os.environ.get("READ_YOUR_WRITES_SECONDS", 10))
+
+BIND_PREFIX = 'replica_'
+WRITE_COOKIE = 'db_last_write'
+
+READS = metrics.counter('db_read_routing_total', 'Read-only sessions, by the database they read from and why.',
+                        ('target', 'reason'))
+
+class ReplicaState:
+    """Last lag measurement of one replica (lag is None when it failed)"""
+    __slots__ = ('name', 'lag', 'error', 'checked_at')
+
+    def __init__(self, name, lag, error, checked_at):
+        self.name = name
+        self.lag = lag
+        self.error = error
+        self.checked_at = checked_at
+
+    @property
+    def fresh(self):
+        return self.lag is not None and self.lag <= REPLICA_MAX_LAG
+
+_states = {}  # replica engine -> ReplicaState
+_check_lock = threading.Lock()
+
+metrics.gauge('db_replica_lag_seconds', 'Replication lag at the last check.', ('replica',),
+              callback=lambda: {(state.name,): state.lag for state in list(_states.values())
+                                if state.lag is not None})
+
+def replica_engines(db):
+    """[(bind key, engine)] of the configured replicas"""
+    return [(key, engine) for key, engine in db.engines.items() if key and key.startswith(BIND_PREFIX)]
+
+def _heartbeat(connection):
+    from models import ReplicaHeartbeat
+    table = ReplicaHeartbeat.__table__
+    return connection.execute(select(table.c.beat_at).where(table.c.id == 1)).scalar()
+
+def check_lag(primary, replicas):
+    """Measure each replica's lag against the primary's heartbeat, then stamp
+    a new beat on the primary. A replica that has the primary's latest beat
+    is current; otherwise it is behind by at least the age of its own beat."""
+    beats = {}
+    for name, engine in replicas:
+        try:
+            with engine.connect() as connection:
+                beats[engine] = _heartbeat(connection)
+        except Exception as e:
+            logging.warning(f"Replica {name} unavailable: {e}")
+            beats[engine] = e
+
+    from models import ReplicaHeartbeat
+    table = ReplicaHeartbeat.__table__
+    now = time.time()
+    with primary.begin() as connection:
+        primary_beat = _heartbeat(connection)
+        if primary_beat is None:
+            connection.execute(insert(table).values(id=1, beat_at=now))
+        elif now - primary_beat >= REPLICA_CHECK_INTERVAL / 2:
+            # Several workers check; one stamp per half interval is enough
+            connection.execute(update(table).where(table.c.id == 1).values(beat_at=now))
+
+    for name, engine in replicas:
+        beat = beats[engine]
+        if isinstance(beat, Exception):
+            _states[engine] = ReplicaState(name, None, str(beat), now)
+        elif primary_beat is None:
+            _states[engine] = ReplicaState(name, None, 'no heartbeat on the primary yet', now)
+        elif beat is None:
+            _states[engine] = ReplicaState(name, None, 'no heartbeat on the replica yet', now)
+        else:
+            _states[engine] = ReplicaState(name, 0.0 if beat >= primary_beat else now - beat, None, now)
+    return [_states[engine] for _, engine in replicas]
+
+def _refresh(db, replicas):
+    """Re-check the lag when it is older than the interval. One thread checks
+    at a time; the others carry on with the previous measurement."""
+    now = time.time()
+    stale = any(engine not in _states or now - _states[engine].checked_at >= REPLICA_CHECK_INTERVAL
+                for _, engine in replicas)
+    if stale and _check_lock.acquire(blocking=False):
+        try:
+            check_lag(db.engines[None], replicas)
+        except Exception as e:
+            logging.error(f"Replica lag check failed: {e}")
+        finally:
+            _check_lock.release()
+
+def _wrote_recently():
+    try:
+        return time.time() - float(request.cookies.get(WRITE_COOKIE, 0)) < READ_YOUR_WRITES_SECONDS
+    except ValueError:
+        return False
+
+class RoutingSession(Session):
+    """Session that sends the SELECTs of @read_only views to a fresh replica"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and REPLICA_URLS:
+            if self._flushing or (clause is not None and not getattr(clause, 'is_select', False)):
+                self._mark_written()
+            elif clause is not None and has_request_context() and g.get('_read_replica'):
+                engine = self._read_engine()
+                if engine is not None:
+                    return engine
+        return super().get_bind(mapper, clause=clause, bind=bind, **kwargs)
+
+    def _mark_written(self):
+        self.info['wrote'] = True
+        if has_request_context():
+            g._db_wrote = True
+
+    def _read_engine(self):
+        """The replica this session reads from, chosen once; None for the primary"""
+        if self.info.get('wrote'):
+            return None
+        if 'read_engine' in self.info:
+            return self.info['read_engine']
+
+        engine = None
+        if _wrote_recently():
+            READS.inc(target='primary', reason='recent_write')
+        else:
+            replicas = replica_engines(self._db)
+            _refresh(self._db, replicas)
+            fresh = [engine for _, engine in replicas if engine in _states and _states[engine].fresh]
+            if fresh:
+                engine = random.choice(fresh)
+                READS.inc(target='replica', reason='read_only')
+            elif any(engine in _states and _states[engine].lag is not None for _, engine in replicas):
+                READS.inc(target='primary', reason='replica_lag')
+            else:
+                READS.inc(target='primary', reason='replica_unavailable')
+        self.info['read_engine'] = engine
+        return engine
+
+def read_only(view):
+    """Let a view's queries run on a replica (see the top of this module)"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        g._read_replica = True
+        return view(*args, **kwargs)
+    return wrapper
+
+def _remember_write(response):
+    if g.get('_db_wrote'):
+        response.set_cookie(WRITE_COOKIE, f"{time.time():.3f}", max_age=int(READ_YOUR_WRITES_SECONDS) + 1,
+                            httponly=True, samesite='Lax')
+    return response
+
+def configure(app):
+    """Add the replicas to SQLALCHEMY_BINDS. Call before db.init_app(app)."""
+    binds = app.config.setdefault("SQLALCHEMY_BINDS", {})
+    for number, url in enumerate(REPLICA_URLS, 1):
+        binds[f'{BIND_PREFIX}{number}'] = dict(db_tuning.engine_options(url), url=url)
+
+def init_app(app, db):
+    """Set the read-your-writes cookie and add `flask replica-status`. The
+    app's db must use RoutingSession."""
+    if REPLICA_URLS:
+        app.after_request(_remember_write)
+
+    @app.cli.command('replica-status')
+    def replica_status_command():
+        """Measure and show the lag of each read replica."""
+        replicas = replica_engines(db)
+        if not replicas:
+            click.echo("No replicas configured (DATABASE_REPLICA_URLS)")
+            return
+        for state in check_lag(db.engines[None], replicas):
+            if state.lag is None:
+                click.echo(f"{state.name}: unavailable ({state.error})")
+            else:
+                usable = 'in use' if state.fresh else f'over the {REPLICA_MAX_LAG:g}s limit'
+                click.echo(f"{state.name}: {state.lag:.1f}s behind, {usable}")
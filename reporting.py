@@ -0,0 +1,267 @@
+import json
+import logging
+import os
+import re
+import threading
+from datetime import datetime
+import click
+from sqlalchemy import DateTime, Float, and_, case, cast, func, insert, literal, or_, select, union_all, update
+from sqlalchemy.exc import IntegrityError
+
+# Monthly report figures: resolution-time percentiles, SLA compliance and
+# backlog aging, overall and per department, priority and technician. A
+# month's tickets (hot and archived, see archive.py) are aggregated in SQL
+# and the figures stored in report_period, which is all the views read.
+# Figures are computed by `flask compute-reports` or the refresher thread
+# (REPORT_REFRESHER=1), never in a request: a month that is over is
+# computed once and never again, the current month on every run, which is
+# every REPORT_CACHE_SECONDS for the refresher.
+REPORT_CACHE_SECONDS = int(os.environ.get("REPORT_CACHE_SECONDS", 300))
+
+PERCENTILES = (50, 90, 95)
+# Backlog age buckets: (key, upper bound in days)
+AGE_BUCKETS = (('0-1d', 1), ('1-3d', 3), ('3-7d', 7), ('7-30d', 30), ('30d+', None))
+DIMENSIONS = ('department', 'priority', 'technician')
+NO_TECHNICIAN = 'none'
+
+PERIOD = re.compile(r'^\d{4}(0[1-9]|1[0-2])$')
+
+def _ticket_tables():
+    import models
+    return (models.Ticket.__table__, models.TicketArchive.__table__)
+
+def period_of(moment):
+    return f"{moment.year:04d}{moment.month:02d}"
+
+def is_period(value):
+    return bool(value and PERIOD.match(value))
+
+def period_bounds(period):
+    """[start, end) of a YYYYMM period"""
+    import partitions
+    start = partitions.period_start(period)
+    return start, partitions.add_months(start, 1)
+
+def _done_at(table):
+    # Closed without passing through 'Resolvido' (bulk close, imports)
+    return func.coalesce(table.c.resolved_at, table.c.closed_at)
+
+def _hours(connection, later, earlier):
+    """Hours from earlier to later, as a SQL expression"""
+    if connection.dialect.name == 'postgresql':
+        # Float, not numeric, so averages don't come back as Decimal
+        return cast(func.extract('epoch', later - earlier), Float) / 3600
+    return (func.julianday(later) - func.julianday(earlier)) * 24
+
+def _resolved(connection, start, end):
+    """(department, priority, technician, hours, met, violated) of the
+    tickets resolved in [start, end); met and violated are 1 or 0 by SLA
+    outcome, both 0 without an SLA"""
+    selects = []
+    for table in _ticket_tables():
+        done_at = _done_at(table)
+        selects.append(select(
+            table.c.department, table.c.priority, table.c.assigned_to.label('technician'),
+            case((done_at < table.c.created_at, 0.0),
+                 else_=_hours(connection, done_at, table.c.created_at)).label('hours'),
+            case((done_at <= table.c.sla_due, 1), else_=0).label('met'),
+            case((done_at > table.c.sla_due, 1), else_=0).label('violated'),
+        ).where(or_(
+            # Spelled out so both the resolved_at and closed_at indexes apply
+            and_(table.c.resolved_at >= start, table.c.resolved_at < end),
+            and_(table.c.resolved_at.is_(None), table.c.closed_at >= start, table.c.closed_at < end),
+        )))
+    return union_all(*selects).subquery()
+
+def _backlog(connection, as_of):
+    """(department, priority, technician, bucket) of the tickets open at
+    as_of. Archived tickets are closed, but may have been open then."""
+    as_of = literal(as_of, DateTime())
+    selects = []
+    for table in _ticket_tables():
+        done_at = _done_at(table)
+        days = _hours(connection, as_of, table.c.created_at) / 24
+        bucket = case(*[(days < limit, key) for key, limit in AGE_BUCKETS if limit is not None],
+                      else_=AGE_BUCKETS[-1][0])
+        selects.append(select(
+            table.c.department, table.c.priority, table.c.assigned_to.label('technician'), bucket.label('bucket')
+        ).where(table.c.created_at < as_of, or_(done_at.is_(None), done_at >= as_of)))
+    return union_all(*selects).subquery()
+
+def _resolution_query(resolved, dimension):
+    """Counts, average and nearest-rank percentiles of the resolution hours
+    and SLA outcomes, per value of dimension (or overall for None)"""
+    keys = [resolved.c[dimension]] if dimension else []
+    ranked = select(
+        *keys, resolved.c.hours, resolved.c.met, resolved.c.violated,
+        func.row_number().over(partition_by=keys or None, order_by=resolved.c.hours.nulls_last()).label('rank'),
+        func.count(resolved.c.hours).over(partition_by=keys or None).label('n'),
+    ).subquery()
+    keys = [ranked.c[dimension]] if dimension else []
+    # The rank of the pct percentile is ceil(pct / 100 * n), in integers
+    percentiles = [func.max(case((ranked.c.rank == (pct * ranked.c.n + 99) // 100, ranked.c.hours)))
+                   for pct in PERCENTILES]
+    return select(*keys, func.count(ranked.c.hours), func.avg(ranked.c.hours), *percentiles,
+                  func.sum(ranked.c.met), func.sum(ranked.c.violated)).group_by(*keys)
+
+def _blank():
+    return {
+        'resolved': 0,
+        'resolution_hours': None,
+        'sla_met': 0,
+        'sla_violations': 0,
+        'sla_compliance': None,
+        'backlog': 0,
+        'backlog_aging': dict.fromkeys((key for key, _ in AGE_BUCKETS), 0),
+    }
+
+def blank(period):
+    """Figures of a period with nothing in it, for one not computed yet"""
+    start, end = period_bounds(period)
+    return {
+        'period': period,
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'as_of': None,
+        **_blank(),
+        **{f'by_{dimension}': {} for dimension in DIMENSIONS},
+    }
+
+def compute(connection, period, now=None):
+    """Figures of a YYYYMM period. The backlog is the one at the end of the
+    period, or now for the current one."""
+    now = now or datetime.utcnow()
+    start, end = period_bounds(period)
+    as_of = min(end, now)
+    resolved, backlog = _resolved(connection, start, end), _backlog(connection, as_of)
+    data = blank(period)
+    data['as_of'] = as_of.isoformat()
+    groups = {dimension: {} for dimension in DIMENSIONS}
+
+    def figures_of(dimension, key):
+        if dimension is None:
+            return data
+        if dimension == 'technician':
+            key = str(key) if key else NO_TECHNICIAN
+        return groups[dimension].setdefault(key, _blank())
+
+    for dimension in (None, *DIMENSIONS):
+        for row in connection.execute(_resolution_query(resolved, dimension)):
+            key, (count, avg, *percentiles, met, violated) = (row[0], row[1:]) if dimension else (None, row)
+            figures = figures_of(dimension, key)
+            met, violated = met or 0, violated or 0
+            figures.update({
+                'resolved': count,
+                'resolution_hours': {
+                    'avg': round(avg, 1),
+                    **{f'p{pct}': round(value, 1) for pct, value in zip(PERCENTILES, percentiles)},
+                } if count else None,
+                'sla_met': met,
+                'sla_violations': violated,
+                'sla_compliance': round(met / (met + violated) * 100, 1) if met + violated else None,
+            })
+
+        keys = [backlog.c[dimension]] if dimension else []
+        query = select(*keys, backlog.c.bucket, func.count()).group_by(*keys, backlog.c.bucket)
+        for row in connection.execute(query):
+            key, (bucket, count) = (row[0], row[1:]) if dimension else (None, row)
+            figures = figures_of(dimension, key)
+            figures['backlog'] += count
+            figures['backlog_aging'][bucket] = count
+
+    for dimension in DIMENSIONS:
+        data[f'by_{dimension}'] = dict(sorted(groups[dimension].items()))
+    return data
+
+def _store(engine, period, data, final, now):
+    import models
+    table = models.ReportPeriod.__table__
+    values = {'data': json.dumps(data), 'final': final, 'computed_at': now}
+    try:
+        with engine.begin() as connection:
+            connection.execute(insert(table).values(period=period, **values))
+    except IntegrityError:
+        # Stored by another worker, or an earlier run of the current month
+        with engine.begin() as connection:
+            connection.execute(update(table).where(table.c.period == period, table.c.final.is_(False))
+                               .values(**values))
+
+def stored(session, periods):
+    """{period: figures} of the given periods from report_period; periods
+    not computed yet are left out. Only reads, so views can use a replica."""
+    import models
+    table = models.ReportPeriod.__table__
+    rows = session.execute(select(table.c.period, table.c.data).where(table.c.period.in_(periods)))
+    return {period: json.loads(data) for period, data in rows}
+
+def first_period(connection):
+    """Period of the oldest ticket, hot or archived (None without tickets)"""
+    oldest = [connection.execute(select(func.min(table.c.created_at))).scalar() for table in _ticket_tables()]
+    oldest = [moment for moment in oldest if moment is not None]
+    return period_of(min(oldest)) if oldest else None
+
+def recent_periods(count, now=None):
+    """The last count periods, newest first"""
+    import partitions
+    now = now or datetime.utcnow()
+    return [period_of(partitions.add_months(now, -n)) for n in range(count)]
+
+def refresh(engine, since=None, now=None):
+    """Compute and store the figures of every period from since (default:
+    the oldest ticket's) that isn't final: the missing months and the
+    current one. Returns {period: figures} of those computed."""
+    import models
+    import partitions
+    now = now or datetime.utcnow()
+    table = models.ReportPeriod.__table__
+    with engine.connect() as connection:
+        since = since or first_period(connection)
+        final = set(connection.execute(select(table.c.period).where(table.c.final.is_(True))).scalars())
+    computed = {}
+    if since is None:
+        return computed
+    month = period_bounds(since)[0]
+    while period_of(month) <= period_of(now):
+        period = period_of(month)
+        if period not in final:
+            with engine.connect() as connection:
+                data = compute(connection, period, now)
+            # Final once the period is over: later changes to its tickets
+            # don't rewrite its history
+            _store(engine, period, data, period_bounds(period)[1] <= now, now)
+            computed[period] = data
+        month = partitions.add_months(month, 1)
+    return computed
+
+def start_refresher(app, db):
+    """Refresh the figures every REPORT_CACHE_SECONDS on a daemon thread of
+    this process"""
+    def run():
+        while True:
+            try:
+                with app.app_context():
+                    refresh(db.engine)
+            except Exception as e:
+                logging.error(f"Report refresher error: {e}")
+            stop.wait(REPORT_CACHE_SECONDS)
+
+    stop = threading.Event()
+    threading.Thread(target=run, name='report-refresher', daemon=True).start()
+    return stop
+
+def register_commands(app, db):
+
+    @app.cli.command('compute-reports')
+    @click.option('--since', help='First period (YYYYMM); default: the oldest ticket\'s.')
+    def compute_reports_command(since):
+        """Compute and store the report figures of every month not final yet."""
+        if since is None:
+            with db.engine.connect() as connection:
+                if first_period(connection) is None:
+                    click.echo("No tickets yet")
+                    return
+        computed = refresh(db.engine, since)
+        for period, data in computed.items():
+            click.echo(f"{period}: {data['resolved']} resolved, backlog {data['backlog']}")
+        logging.info(f"Report figures computed for {len(computed)} period(s)")
+        click.echo(f"Done: {len(computed)} period(s) computed")
@@ -1,16 +1,37 @@
-from flask import request, jsonify, render_template, send_file, current_app
-from flask_jwt_extended import jwt_required, get_jwt_identity, create_access_token
-from werkzeug.security import check_password_hash
+from flask import request, jsonify, render_template, send_file, current_app, Response, stream_with_context
+from flask_jwt_extended import jwt_required, create_access_token
 from werkzeug.utils import secure_filename
-from app import app
+from app import app, socketio
 from database import db
-from models import User, Ticket, Message, Attachment
+from models import User, Ticket, Message, Attachment, TicketArchive, MessageArchive, AttachmentArchive
+import passwords
+import identity
+import search
+import similarity
+import bulk_operations
+import importer
+import alerts
+import assignment
+import archive
+import dashboard_feed
+import partitions
+import replicas
+import reporting
+import heapq
+import itertools
+import json
+from identity import current_identity
 from datetime import datetime, timedelta
 import os
 import uuid
+import tempfile
 import csv
 import io
 from sqlalchemy import func, and_, or_
+from sqlalchemy.orm import selectinload
+
+# Rows per chunk of the streamed CSV export
+EXPORT_BATCH_SIZE = 500
 
 @app.route('/')
 def index():
@@ -36,8 +57,10 @@ def login():
         
         user = User.query.filter_by(username=username, active=True).first()
         
-        if user and check_password_hash(user.password_hash, password):
-            access_token = create_access_token(identity=user.id)
+        if user and passwords.check_user_password(user, password):
+            if db.session.is_modified(user):
+                db.session.commit()  # Password hash was upgraded
+            access_token = create_access_token(identity=str(user.id))
             return jsonify({
                 'access_token': access_token,
                 'user': {
@@ -50,84 +73,202 @@ def login():
             })
         else:
             return jsonify({'error': 'Invalid credentials'}), 401
+    except passwords.LoginBusy:
+        return jsonify({'error': 'Too many login attempts, try again shortly'}), 503, {'Retry-After': '1'}
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+def _visible_tickets(query, user, model=Ticket):
+    """Restrict a ticket (or TicketArchive) query to what the user's role may see"""
+    if user.role == 'Colaborador':
+        query = query.filter(model.creator_id == user.id)
+    elif user.role == 'Técnico':
+        query = query.filter(or_(model.assigned_to == user.id, model.assigned_to.is_(None)))
+    # Admin and Diretoria can see all tickets
+    return query
+
+def _can_see_ticket(user, creator_id, assigned_to):
+    """Same rule as _visible_tickets, for a single ticket"""
+    if user.role == 'Colaborador':
+        return creator_id == user.id
+    if user.role == 'Técnico':
+        return assigned_to in (user.id, None)
+    return True
+
+def _find_ticket(ticket_id):
+    """Get a ticket, from the archive once it was moved there"""
+    return Ticket.query.get(ticket_id) or TicketArchive.query.get(ticket_id)
+
+def _apply_ticket_filters(query, args, model=Ticket):
+    """Apply the status/priority/department/assigned_to query parameters"""
+    status = args.get('status')
+    priority = args.get('priority')
+    department = args.get('department')
+    assigned_to = args.get('assigned_to')
+    
+    if status:
+        query = query.filter(model.status == status)
+    if priority:
+        query = query.filter(model.priority == priority)
+    if department:
+        query = query.filter(model.department == department)
+    if assigned_to:
+        query = query.filter(model.assigned_to == assigned_to)
+    return query
+
+def _ticket_to_dict(ticket):
+    """Serialize a ticket the way the ticket list shows it"""
+    # Check SLA violation
+    sla_status = 'ok'
+    if ticket.status not in ['Resolvido', 'Fechado'] and ticket.sla_due:
+        now = datetime.utcnow()
+        time_left = ticket.sla_due - now
+        if time_left.total_seconds() < 0:
+            sla_status = 'violated'
+        elif time_left.total_seconds() < 3600:  # Less than 1 hour
+            sla_status = 'warning'
+    
+    return {
+        'id': ticket.id,
+        'title': ticket.title,
+        'description': ticket.description,
+        'department': ticket.department,
+        'priority': ticket.priority,
+        'status': ticket.status,
+        'observations': ticket.observations,
+        'created_at': ticket.created_at.isoformat(),
+        'updated_at': ticket.updated_at.isoformat(),
+        'sla_due': ticket.sla_due.isoformat() if ticket.sla_due else None,
+        'sla_status': sla_status,
+        'creator': {
+            'id': ticket.creator.id,
+            'name': ticket.creator.name,
+            'email': ticket.creator.email
+        },
+        'assignee': {
+            'id': ticket.assignee.id,
+            'name': ticket.assignee.name,
+            'email': ticket.assignee.email
+        } if ticket.assignee else None,
+        'message_count': ticket.message_count,
+        'attachment_count': ticket.attachment_count,
+        'last_activity_at': ticket.last_activity_at.isoformat() if ticket.last_activity_at else None,
+        'archived': isinstance(ticket, TicketArchive)
+    }
+
 @app.route('/api/tickets', methods=['GET'])
 @jwt_required()
 def get_tickets():
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_identity()
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
-        query = Ticket.query
+        # Newest first, or most recently active first with sort=activity
+        order = 'last_activity_at' if request.args.get('sort') == 'activity' else 'created_at'
         
-        # Filter based on user role
-        if user.role == 'Colaborador':
-            query = query.filter_by(creator_id=user_id)
-        elif user.role == 'Técnico':
-            query = query.filter(or_(Ticket.assigned_to == user_id, Ticket.assigned_to.is_(None)))
-        # Admin and Diretoria can see all tickets
+        tickets = []
+        if not archive.only(request.args):
+            query = _visible_tickets(Ticket.query, user)
+            query = _apply_ticket_filters(query, request.args)
+            tickets = query.order_by(getattr(Ticket, order).desc()).all()
         
-        # Apply filters from query parameters
-        status = request.args.get('status')
-        priority = request.args.get('priority')
-        department = request.args.get('department')
-        assigned_to = request.args.get('assigned_to')
+        # Closed tickets may have moved to the archive
+        if archive.wanted(request.args):
+            query = _visible_tickets(TicketArchive.query, user, TicketArchive)
+            query = _apply_ticket_filters(query, request.args, TicketArchive)
+            archived = query.order_by(getattr(TicketArchive, order).desc()).all()
+            tickets = list(heapq.merge(tickets, archived, key=lambda t: getattr(t, order), reverse=True))
+        
+        return jsonify([_ticket_to_dict(ticket) for ticket in tickets])
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/search', methods=['GET'])
+@jwt_required()
+def search_tickets():
+    try:
+        user = current_identity()
         
-        if status:
-            query = query.filter_by(status=status)
-        if priority:
-            query = query.filter_by(priority=priority)
-        if department:
-            query = query.filter_by(department=department)
-        if assigned_to:
-            query = query.filter_by(assigned_to=assigned_to)
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
         
-        tickets = query.order_by(Ticket.created_at.desc()).all()
+        q = request.args.get('q', '').strip()
+        page = max(request.args.get('page', 1, type=int), 1)
+        per_page = min(max(request.args.get('per_page', 20, type=int), 1), 100)
         
-        result = []
-        for ticket in tickets:
-            # Check SLA violation
-            sla_status = 'ok'
-            if ticket.status not in ['Resolvido', 'Fechado'] and ticket.sla_due:
-                now = datetime.utcnow()
-                time_left = ticket.sla_due - now
-                if time_left.total_seconds() < 0:
-                    sla_status = 'violated'
-                elif time_left.total_seconds() < 3600:  # Less than 1 hour
-                    sla_status = 'warning'
-            
-            result.append({
-                'id': ticket.id,
-                'title': ticket.title,
-                'description': ticket.description,
-                'department': ticket.department,
-                'priority': ticket.priority,
-                'status': ticket.status,
-                'observations': ticket.observations,
-                'created_at': ticket.created_at.isoformat(),
-                'updated_at': ticket.updated_at.isoformat(),
-                'sla_due': ticket.sla_due.isoformat() if ticket.sla_due else None,
-                'sla_status': sla_status,
-                'creator': {
-                    'id': ticket.creator.id,
-                    'name': ticket.creator.name,
-                    'email': ticket.creator.email
-                },
-                'assignee': {
-                    'id': ticket.assignee.id,
-                    'name': ticket.assignee.name,
-                    'email': ticket.assignee.email
-                } if ticket.assignee else None,
-                'message_count': ticket.messages.count(),
-                'attachment_count': ticket.attachments.count()
-            })
+        if not q:
+            return jsonify({'error': 'q is required'}), 400
         
-        return jsonify(result)
+        matches = search.ranked_matches(db.session.connection(), q)
+        if matches is None:
+            return jsonify({'query': q, 'page': page, 'per_page': per_page, 'total': 0, 'results': []})
+        
+        matches = matches.columns(ticket_id=db.Integer, rank=db.Float).subquery()
+        models = [] if archive.only(request.args) else [Ticket]
+        if archive.wanted(request.args):
+            models.append(TicketArchive)
+        
+        queries = []
+        for model in models:
+            query = db.session.query(model, matches.c.rank).join(matches, matches.c.ticket_id == model.id)
+            query = _visible_tickets(query, user, model)
+            query = _apply_ticket_filters(query, request.args, model)
+            queries.append(query.order_by(matches.c.rank, model.created_at.desc()))
+        
+        total = sum(query.count() for query in queries)
+        if len(queries) == 1:
+            rows = queries[0].offset((page - 1) * per_page).limit(per_page).all()
+        else:
+            # Each table's best page * per_page rows, merged in rank order
+            rows = heapq.merge(*(query.limit(page * per_page).all() for query in queries),
+                               key=lambda row: (row[1], -row[0].created_at.timestamp()))
+            rows = list(itertools.islice(rows, (page - 1) * per_page, page * per_page))
+        
+        results = []
+        for ticket, rank in rows:
+            item = _ticket_to_dict(ticket)
+            item['rank'] = -rank
+            results.append(item)
+        
+        return jsonify({
+            'query': q,
+            'page': page,
+            'per_page': per_page,
+            'total': total,
+            'results': results
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/tickets/similar', methods=['GET'])
+@jwt_required()
+def get_similar_tickets():
+    try:
+        user = current_identity()
+        
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        title = request.args.get('title', request.args.get('q', ''))
+        description = request.args.get('description', '')
+        k = min(max(request.args.get('k', 5, type=int), 1), 20)
+        
+        similarity.ensure_loaded(db.session)
+        matches = similarity.index.query(
+            title, description, k=k,
+            visible=lambda meta: _can_see_ticket(user, meta['creator_id'], meta['assigned_to'])
+        )
+        
+        return jsonify([{
+            'id': ticket_id,
+            'title': meta['title'],
+            'status': meta['status'],
+            'priority': meta['priority'],
+            'score': round(score, 3)
+        } for ticket_id, score, meta in matches])
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -135,7 +276,10 @@ def get_tickets():
 @jwt_required()
 def create_ticket():
     try:
-        user_id = get_jwt_identity()
+        user = current_identity()
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        user_id = user.id
         data = request.get_json()
         
         required_fields = ['title', 'description', 'department', 'priority']
@@ -153,6 +297,9 @@ def create_ticket():
         )
         
         db.session.add(ticket)
+        if assignment.AUTO_ASSIGN:
+            db.session.flush()
+            assignment.auto_assign(db.session, [ticket], user_id)
         db.session.commit()
         
         return jsonify({'message': 'Ticket created successfully', 'ticket_id': ticket.id}), 201
@@ -164,9 +311,11 @@ def create_ticket():
 @jwt_required()
 def get_ticket(ticket_id):
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-        ticket = Ticket.query.get(ticket_id)
+        user = current_identity()
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        user_id = user.id
+        ticket = _find_ticket(ticket_id)
         
         if not ticket:
             return jsonify({'error': 'Ticket not found'}), 404
@@ -206,7 +355,8 @@ def get_ticket(ticket_id):
                 'id': ticket.assignee.id,
                 'name': ticket.assignee.name,
                 'email': ticket.assignee.email
-            } if ticket.assignee else None
+            } if ticket.assignee else None,
+            'archived': isinstance(ticket, TicketArchive)
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -215,8 +365,10 @@ def get_ticket(ticket_id):
 @jwt_required()
 def update_ticket(ticket_id):
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_identity()
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        user_id = user.id
         ticket = Ticket.query.get(ticket_id)
         
         if not ticket:
@@ -249,7 +401,7 @@ def update_ticket(ticket_id):
                 
                 # Create system message for assignment
                 if ticket.assigned_to:
-                    assignee = User.query.get(ticket.assigned_to)
+                    assignee = identity.lookup(ticket.assigned_to)
                     message = Message(
                         content=f"Chamado atribuído para {assignee.name}",
                         ticket_id=ticket.id,
@@ -279,13 +431,152 @@ def update_ticket(ticket_id):
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/tickets/bulk', methods=['POST'])
+@jwt_required()
+def bulk_update_tickets():
+    try:
+        user = current_identity()
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        if user.role not in ['Administrador', 'Técnico']:
+            return jsonify({'error': 'Access denied'}), 403
+        
+        data = request.get_json() or {}
+        operation = data.get('operation')
+        value = data.get('value')
+        
+        # Tickets are selected by explicit ids or by the ticket list filters
+        query = _visible_tickets(Ticket.query, user)
+        if 'ids' in data:
+            if not isinstance(data['ids'], list) or not data['ids']:
+                return jsonify({'error': 'ids must be a non-empty list'}), 400
+            query = query.filter(Ticket.id.in_(data['ids']))
+        elif isinstance(data.get('filter'), dict) and data['filter']:
+            query = _apply_ticket_filters(query, data['filter'])
+        else:
+            return jsonify({'error': 'ids or filter is required'}), 400
+        
+        assignee_name = None
+        if operation == 'assign':
+            value = value or None
+            if value:
+                try:
+                    value = int(value)
+                except (TypeError, ValueError):
+                    return jsonify({'error': 'value must be a user id'}), 400
+                assignee = identity.lookup(value)
+                if not assignee:
+                    return jsonify({'error': 'Assignee not found'}), 404
+                value, assignee_name = assignee.id, assignee.name
+        
+        ticket_ids = bulk_operations.apply(db.session, query, operation, value, user.id, assignee_name)
+        db.session.commit()
+        
+        if ticket_ids:
+            # One aggregated notification instead of one per ticket
+            socketio.emit('tickets_bulk_updated', {
+                'operation': operation,
+                'value': value,
+                'ticket_ids': ticket_ids,
+                'count': len(ticket_ids),
+                'updated_by': {'name': user.name, 'role': user.role}
+            }, to='technicians')
+        
+        return jsonify({'message': 'Tickets updated successfully', 'updated': len(ticket_ids), 'ticket_ids': ticket_ids})
+    except bulk_operations.BulkError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/tickets/import', methods=['POST'])
+@jwt_required()
+def import_tickets():
+    try:
+        user = current_identity()
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        if user.role != 'Administrador':
+            return jsonify({'error': 'Access denied'}), 403
+        
+        # Multipart upload, or the file as the raw request body
+        if 'file' in request.files:
+            upload = request.files['file']
+            fmt = request.args.get('format') or importer.detect_format(upload.filename, upload.content_type)
+            # Werkzeug closes uploads with the request, before a streamed body is sent
+            spool = tempfile.TemporaryFile()
+            upload.save(spool)
+            spool.seek(0)
+            stream = importer.open_text(spool)
+        else:
+            fmt = request.args.get('format') or importer.detect_format(None, request.content_type)
+            stream = importer.open_text(request.stream)
+        
+        chunk_size = min(max(request.args.get('chunk_size', importer.CHUNK_SIZE, type=int), 1), 5000)
+        
+        # Progress is streamed as JSON lines; the last line carries the row errors
+        def generate():
+            report = None
+            try:
+                for report in importer.iter_import(stream, fmt, user.id, chunk_size):
+                    yield json.dumps(report.to_dict(include_errors=False)) + '\n'
+            except Exception as e:
+                db.session.rollback()
+                yield json.dumps({'error': str(e)}) + '\n'
+                return
+            yield json.dumps(dict(report.to_dict(), done=True)) + '\n'
+        
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/alerts', methods=['POST'])
+@jwt_required()
+def ingest_alerts():
+    try:
+        user = current_identity()
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        if user.role not in ['Administrador', 'Técnico']:
+            return jsonify({'error': 'Access denied'}), 403
+        
+        data = request.get_json()
+        batch = data.get('alerts') if isinstance(data, dict) else data
+        if not isinstance(batch, list) or not batch:
+            return jsonify({'error': 'alerts must be a non-empty list'}), 400
+        if len(batch) > alerts.MAX_ALERTS:
+            return jsonify({'error': f'At most {alerts.MAX_ALERTS} alerts per request'}), 400
+        
+        valid, errors = [], []
+        for position, alert in enumerate(batch):
+            try:
+                valid.append(alerts.normalize(alert))
+            except alerts.AlertError as e:
+                errors.append({'index': position, 'error': str(e)})
+        
+        # Tickets and messages are written in the background, in batches
+        new, duplicates, rejected = alerts.submit(app, valid, user.id)
+        result = {'accepted': new + duplicates, 'new': new, 'duplicates': duplicates,
+                  'rejected': rejected, 'errors': errors}
+        if rejected:
+            return jsonify(result), 503, {'Retry-After': '5'}
+        return jsonify(result), 202
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/tickets/<int:ticket_id>/messages', methods=['GET'])
 @jwt_required()
 def get_ticket_messages(ticket_id):
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-        ticket = Ticket.query.get(ticket_id)
+        user = current_identity()
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        user_id = user.id
+        ticket = _find_ticket(ticket_id)
         
         if not ticket:
             return jsonify({'error': 'Ticket not found'}), 404
@@ -294,19 +585,26 @@ def get_ticket_messages(ticket_id):
         if user.role == 'Colaborador' and ticket.creator_id != user_id:
             return jsonify({'error': 'Access denied'}), 403
         
-        messages = Message.query.filter_by(ticket_id=ticket_id).order_by(Message.timestamp.asc()).all()
+        if isinstance(ticket, TicketArchive):
+            messages = MessageArchive.query.filter_by(ticket_id=ticket_id).order_by(MessageArchive.timestamp.asc()).all()
+        else:
+            # Old tickets' messages may be spread over month tables
+            messages = partitions.ticket_messages(db.session, ticket_id, ticket.created_at)
+        author_ids = {message.user_id for message in messages}
+        authors = {u.id: u for u in User.query.filter(User.id.in_(author_ids))} if author_ids else {}
         
         result = []
         for message in messages:
+            author = authors[message.user_id]
             result.append({
                 'id': message.id,
                 'content': message.content,
                 'timestamp': message.timestamp.isoformat(),
                 'message_type': message.message_type,
                 'author': {
-                    'id': message.author.id,
-                    'name': message.author.name,
-                    'role': message.author.role
+                    'id': author.id,
+                    'name': author.name,
+                    'role': author.role
                 }
             })
         
@@ -318,8 +616,10 @@ def get_ticket_messages(ticket_id):
 @jwt_required()
 def create_message(ticket_id):
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_identity()
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        user_id = user.id
         ticket = Ticket.query.get(ticket_id)
         
         if not ticket:
@@ -364,8 +664,10 @@ def create_message(ticket_id):
 @jwt_required()
 def get_users():
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_identity()
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        user_id = user.id
         
         if user.role not in ['Administrador', 'Diretoria']:
             return jsonify({'error': 'Access denied'}), 403
@@ -388,62 +690,37 @@ def get_users():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/dashboard/stats', methods=['GET'])
+@replicas.read_only
 @jwt_required()
 def get_dashboard_stats():
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_identity()
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        user_id = user.id
         
         if user.role not in ['Administrador', 'Diretoria', 'Técnico']:
             return jsonify({'error': 'Access denied'}), 403
         
-        # Basic stats
-        total_tickets = Ticket.query.count()
-        open_tickets = Ticket.query.filter(Ticket.status.in_(['Aberto', 'Em Andamento'])).count()
-        resolved_tickets = Ticket.query.filter_by(status='Resolvido').count()
-        closed_tickets = Ticket.query.filter_by(status='Fechado').count()
+        # Status breakdown, and the totals derived from it. Archived tickets
+        # are closed tickets too, so every count adds them in.
+        by_status = archive.count_by(db.session, lambda table: table.c.status)
+        total_tickets = sum(by_status.values())
+        open_tickets = by_status.get('Aberto', 0) + by_status.get('Em Andamento', 0)
+        resolved_tickets = by_status.get('Resolvido', 0)
+        closed_tickets = by_status.get('Fechado', 0)
         
         # SLA stats
         now = datetime.utcnow()
-        sla_violated = Ticket.query.filter(
-            and_(
-                Ticket.status.in_(['Aberto', 'Em Andamento']),
-                Ticket.sla_due < now
-            )
-        ).count()
+        sla_violated, sla_warning = dashboard_feed.sla_counts(db.session, now)
         
-        sla_warning = Ticket.query.filter(
-            and_(
-                Ticket.status.in_(['Aberto', 'Em Andamento']),
-                Ticket.sla_due > now,
-                Ticket.sla_due < now + timedelta(hours=1)
-            )
-        ).count()
-        
-        # Priority breakdown
-        priority_stats = db.session.query(
-            Ticket.priority,
-            func.count(Ticket.id).label('count')
-        ).group_by(Ticket.priority).all()
-        
-        # Status breakdown
-        status_stats = db.session.query(
-            Ticket.status,
-            func.count(Ticket.id).label('count')
-        ).group_by(Ticket.status).all()
-        
-        # Department breakdown
-        department_stats = db.session.query(
-            Ticket.department,
-            func.count(Ticket.id).label('count')
-        ).group_by(Ticket.department).all()
+        # Priority and department breakdowns
+        by_priority = archive.count_by(db.session, lambda table: table.c.priority)
+        by_department = archive.count_by(db.session, lambda table: table.c.department)
         
         # Recent activity (last 7 days)
         week_ago = now - timedelta(days=7)
-        recent_tickets = db.session.query(
-            func.date(Ticket.created_at).label('date'),
-            func.count(Ticket.id).label('count')
-        ).filter(Ticket.created_at >= week_ago).group_by(func.date(Ticket.created_at)).all()
+        by_date = archive.count_by(db.session, lambda table: func.date(table.c.created_at), since=week_ago)
         
         return jsonify({
             'total_tickets': total_tickets,
@@ -452,20 +729,49 @@ def get_dashboard_stats():
             'closed_tickets': closed_tickets,
             'sla_violated': sla_violated,
             'sla_warning': sla_warning,
-            'priority_breakdown': [{'priority': p[0], 'count': p[1]} for p in priority_stats],
-            'status_breakdown': [{'status': s[0], 'count': s[1]} for s in status_stats],
-            'department_breakdown': [{'department': d[0], 'count': d[1]} for d in department_stats],
-            'recent_activity': [{'date': str(r[0]), 'count': r[1]} for r in recent_tickets]
+            'priority_breakdown': [{'priority': p, 'count': n} for p, n in by_priority.items()],
+            'status_breakdown': [{'status': s, 'count': n} for s, n in by_status.items()],
+            'department_breakdown': [{'department': d, 'count': n} for d, n in by_department.items()],
+            'recent_activity': [{'date': str(d), 'count': n} for d, n in sorted(by_date.items())]
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/reports/summary', methods=['GET'])
+@replicas.read_only
+@jwt_required()
+def get_report_summary():
+    try:
+        user = current_identity()
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        
+        if user.role not in ['Administrador', 'Diretoria']:
+            return jsonify({'error': 'Access denied'}), 403
+        
+        # Resolution percentiles, SLA compliance and backlog aging of a month
+        period = request.args.get('period') or reporting.period_of(datetime.utcnow())
+        if not reporting.is_period(period):
+            return jsonify({'error': 'period must be YYYYMM'}), 400
+        
+        # Stored by `flask compute-reports` or the refresher, see reporting.py
+        figures = reporting.stored(db.session, [period]).get(period)
+        if figures is None:
+            return jsonify({'error': 'Report figures for this period have not been computed yet'}), 404
+        
+        return jsonify(figures)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/reports/export', methods=['GET'])
+@replicas.read_only
 @jwt_required()
 def export_reports():
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_identity()
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        user_id = user.id
         
         if user.role not in ['Administrador', 'Diretoria']:
             return jsonify({'error': 'Access denied'}), 403
@@ -477,63 +783,60 @@ def export_reports():
         priority = request.args.get('priority')
         department = request.args.get('department')
         
-        query = Ticket.query
-        
-        if start_date:
-            query = query.filter(Ticket.created_at >= datetime.fromisoformat(start_date))
-        if end_date:
-            query = query.filter(Ticket.created_at <= datetime.fromisoformat(end_date))
-        if status:
-            query = query.filter_by(status=status)
-        if priority:
-            query = query.filter_by(priority=priority)
-        if department:
-            query = query.filter_by(department=department)
-        
-        tickets = query.order_by(Ticket.created_at.desc()).all()
-        
-        # Create CSV
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Write header
-        writer.writerow([
-            'ID', 'Título', 'Descrição', 'Departamento', 'Prioridade', 'Status',
-            'Criado por', 'Atribuído para', 'Data de Criação', 'Data de Atualização',
-            'SLA Vencimento', 'SLA Violado'
-        ])
-        
-        # Write data
-        for ticket in tickets:
+        def export_query(model):
+            query = model.query
+            if start_date:
+                query = query.filter(model.created_at >= datetime.fromisoformat(start_date))
+            if end_date:
+                query = query.filter(model.created_at <= datetime.fromisoformat(end_date))
+            if status:
+                query = query.filter_by(status=status)
+            if priority:
+                query = query.filter_by(priority=priority)
+            if department:
+                query = query.filter_by(department=department)
+            query = query.options(selectinload(model.creator), selectinload(model.assignee))
+            return query.order_by(model.created_at.desc()).yield_per(EXPORT_BATCH_SIZE)
+        
+        # Closed tickets may have moved to the archive
+        query = export_query(Ticket)
+        if not status or status == 'Fechado':
+            query = heapq.merge(query, export_query(TicketArchive), key=lambda t: t.created_at, reverse=True)
+        
+        # The CSV is streamed in batches of rows, so a large export neither
+        # sits in memory nor waits for the last row before the first byte
+        def generate():
+            output = io.StringIO()
+            writer = csv.writer(output)
             writer.writerow([
-                ticket.id,
-                ticket.title,
-                ticket.description,
-                ticket.department,
-                ticket.priority,
-                ticket.status,
-                ticket.creator.name,
-                ticket.assignee.name if ticket.assignee else '',
-                ticket.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-                ticket.updated_at.strftime('%Y-%m-%d %H:%M:%S'),
-                ticket.sla_due.strftime('%Y-%m-%d %H:%M:%S') if ticket.sla_due else '',
-                'Sim' if ticket.sla_violated else 'Não'
+                'ID', 'Título', 'Descrição', 'Departamento', 'Prioridade', 'Status',
+                'Criado por', 'Atribuído para', 'Data de Criação', 'Data de Atualização',
+                'SLA Vencimento', 'SLA Violado'
             ])
-        
-        # Prepare file for download
-        output.seek(0)
-        
-        # Create a bytes buffer
-        buffer = io.BytesIO()
-        buffer.write(output.getvalue().encode('utf-8'))
-        buffer.seek(0)
-        
-        return send_file(
-            buffer,
-            as_attachment=True,
-            download_name=f'tickets_report_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv',
-            mimetype='text/csv'
-        )
+            for count, ticket in enumerate(query, 1):
+                writer.writerow([
+                    ticket.id,
+                    ticket.title,
+                    ticket.description,
+                    ticket.department,
+                    ticket.priority,
+                    ticket.status,
+                    ticket.creator.name,
+                    ticket.assignee.name if ticket.assignee else '',
+                    ticket.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+                    ticket.updated_at.strftime('%Y-%m-%d %H:%M:%S'),
+                    ticket.sla_due.strftime('%Y-%m-%d %H:%M:%S') if ticket.sla_due else '',
+                    'Sim' if ticket.sla_violated else 'Não'
+                ])
+                if count % EXPORT_BATCH_SIZE == 0:
+                    yield output.getvalue()
+                    output.seek(0)
+                    output.truncate()
+            yield output.getvalue()
+        
+        filename = f'tickets_report_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
+        return Response(stream_with_context(generate()), mimetype='text/csv',
+                        headers={'Content-Disposition': f'attachment; filename={filename}'})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -541,8 +844,10 @@ def export_reports():
 @jwt_required()
 def upload_file(ticket_id):
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
+        user = current_identity()
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        user_id = user.id
         ticket = Ticket.query.get(ticket_id)
         
         if not ticket:
@@ -593,9 +898,11 @@ def upload_file(ticket_id):
 @jwt_required()
 def download_file(attachment_id):
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-        attachment = Attachment.query.get(attachment_id)
+        user = current_identity()
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        user_id = user.id
+        attachment = Attachment.query.get(attachment_id) or AttachmentArchive.query.get(attachment_id)
         
         if not attachment:
             return jsonify({'error': 'Attachment not found'}), 404
@@ -623,9 +930,11 @@ def download_file(attachment_id):
 @jwt_required()
 def get_ticket_attachments(ticket_id):
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-        ticket = Ticket.query.get(ticket_id)
+        user = current_identity()
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        user_id = user.id
+        ticket = _find_ticket(ticket_id)
         
         if not ticket:
             return jsonify({'error': 'Ticket not found'}), 404
@@ -634,7 +943,7 @@ def get_ticket_attachments(ticket_id):
         if user.role == 'Colaborador' and ticket.creator_id != user_id:
             return jsonify({'error': 'Access denied'}), 403
         
-        attachments = Attachment.query.filter_by(ticket_id=ticket_id).all()
+        attachments = ticket.attachments.all()
         
         result = []
         for attachment in attachments:
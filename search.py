@@ -0,0 +1,231 @@
+import os
+import re
+import time
+import click
+from sqlalchemy import event, inspect, text
+
+# One document per ticket (title, description + observations) and one per
+# chat message. On SQLite the index is an FTS5 table whose rowid is -ticket_id
+# for ticket documents and message_id for messages, so updates hit a single
+# row. On PostgreSQL it's a tsvector table with a GIN index.
+INDEX_TABLE = 'search_index'
+LANGUAGE = os.environ.get("SEARCH_LANGUAGE", "portuguese")
+
+# Relative weight of a title match over a body match (SQLite bm25)
+TITLE_WEIGHT = 10.0
+
+_available = {}
+
+def _dialect(connection):
+    return connection.engine.dialect.name
+
+def _ticket_body(description, observations):
+    return '\n'.join(part for part in (description, observations) if part)
+
+def create_index(db):
+    """Create the search index and fill it from existing tickets and messages"""
+    with db.engine.begin() as connection:
+        if _dialect(connection) == 'postgresql':
+            connection.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {INDEX_TABLE} ("
+                "ticket_id INTEGER NOT NULL, message_id INTEGER NOT NULL DEFAULT 0, "
+                "document TSVECTOR NOT NULL, PRIMARY KEY (ticket_id, message_id))"
+            ))
+            connection.execute(text(
+                f"CREATE INDEX IF NOT EXISTS ix_{INDEX_TABLE}_document ON {INDEX_TABLE} USING GIN (document)"
+            ))
+        else:
+            connection.execute(text(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {INDEX_TABLE} USING fts5("
+                "ticket_id UNINDEXED, message_id UNINDEXED, title, body, "
+                "tokenize = 'unicode61 remove_diacritics 2')"
+            ))
+        rebuild_index(connection)
+    _available.clear()
+
+def rebuild_index(connection):
+    """Re-create every index document with set-based INSERT ... SELECT"""
+    # Archived tickets (archive.py) and old months of messages (partitions.py)
+    # stay searchable
+    import partitions
+    existing = inspect(connection).get_table_names()
+    tickets = [t for t in ('ticket', 'ticket_archive') if t in existing]
+    messages = [t for t in ('message', 'message_archive') if t in existing]
+    messages += [partitions.period_table(period).name for period in partitions.periods(connection)]
+    connection.execute(text(f"DELETE FROM {INDEX_TABLE}"))
+    if _dialect(connection) == 'postgresql':
+        for table in tickets:
+            connection.execute(text(
+                f"INSERT INTO {INDEX_TABLE} (ticket_id, message_id, document) "
+                "SELECT id, 0, setweight(to_tsvector(CAST(:lang AS regconfig), title), 'A') || "
+                "setweight(to_tsvector(CAST(:lang AS regconfig), description || ' ' || coalesce(observations, '')), 'B') "
+                f"FROM {table}"
+            ), {'lang': LANGUAGE})
+        for table in messages:
+            connection.execute(text(
+                f"INSERT INTO {INDEX_TABLE} (ticket_id, message_id, document) "
+                f"SELECT ticket_id, id, setweight(to_tsvector(CAST(:lang AS regconfig), content), 'B') FROM {table}"
+            ), {'lang': LANGUAGE})
+    else:
+        for table in tickets:
+            connection.execute(text(
+                f"INSERT INTO {INDEX_TABLE} (rowid, ticket_id, message_id, title, body) "
+                f"SELECT -id, id, 0, title, description || char(10) || coalesce(observations, '') FROM {table}"
+            ))
+        for table in messages:
+            connection.execute(text(
+                f"INSERT INTO {INDEX_TABLE} (rowid, ticket_id, message_id, title, body) "
+                f"SELECT id, ticket_id, id, '', content FROM {table}"
+            ))
+
+def index_available(connection):
+    """Check (and remember per engine) whether the index table exists. A
+    missing index is re-checked every 30s so a later `flask init-db` is seen."""
+    key = connection.engine.url
+    cached = _available.get(key)
+    if cached is True or (cached is not None and cached > time.monotonic()):
+        return cached is True
+    exists = inspect(connection).has_table(INDEX_TABLE)
+    _available[key] = True if exists else time.monotonic() + 30
+    return exists
+
+def index_ticket(connection, ticket_id, title, description, observations):
+    """Insert or replace the document of a ticket"""
+    index_tickets(connection, [{
+        'id': ticket_id, 'title': title, 'description': description, 'observations': observations
+    }])
+
+def index_tickets(connection, tickets):
+    """Insert or replace ticket documents from dicts with id, title, description and observations"""
+    if not tickets:
+        return
+    params = [{
+        'ticket_id': t['id'], 'rowid': -t['id'], 'title': t['title'],
+        'body': _ticket_body(t['description'], t.get('observations')), 'lang': LANGUAGE
+    } for t in tickets]
+    if _dialect(connection) == 'postgresql':
+        connection.execute(text(
+            f"INSERT INTO {INDEX_TABLE} (ticket_id, message_id, document) VALUES (:ticket_id, 0, "
+            "setweight(to_tsvector(CAST(:lang AS regconfig), :title), 'A') || "
+            "setweight(to_tsvector(CAST(:lang AS regconfig), :body), 'B')) "
+            "ON CONFLICT (ticket_id, message_id) DO UPDATE SET document = EXCLUDED.document"
+        ), params)
+    else:
+        connection.execute(text(f"DELETE FROM {INDEX_TABLE} WHERE rowid = :rowid"), params)
+        connection.execute(text(
+            f"INSERT INTO {INDEX_TABLE} (rowid, ticket_id, message_id, title, body) "
+            "VALUES (:rowid, :ticket_id, 0, :title, :body)"
+        ), params)
+
+def index_messages(connection, messages):
+    """Add message documents from dicts with id, ticket_id and content"""
+    if not messages:
+        return
+    if _dialect(connection) == 'postgresql':
+        connection.execute(text(
+            f"INSERT INTO {INDEX_TABLE} (ticket_id, message_id, document) VALUES (:ticket_id, :id, "
+            "setweight(to_tsvector(CAST(:lang AS regconfig), :content), 'B')) "
+            "ON CONFLICT (ticket_id, message_id) DO UPDATE SET document = EXCLUDED.document"
+        ), [dict(m, lang=LANGUAGE) for m in messages])
+    else:
+        connection.execute(
+            text(f"DELETE FROM {INDEX_TABLE} WHERE rowid = :id"),
+            [{'id': m['id']} for m in messages]
+        )
+        connection.execute(text(
+            f"INSERT INTO {INDEX_TABLE} (rowid, ticket_id, message_id, title, body) "
+            "VALUES (:id, :ticket_id, :id, '', :content)"
+        ), messages)
+
+def remove_ticket(connection, ticket_id):
+    """Remove a ticket and all of its message documents"""
+    connection.execute(text(f"DELETE FROM {INDEX_TABLE} WHERE ticket_id = :ticket_id"), {'ticket_id': ticket_id})
+
+def remove_message(connection, message_id):
+    if _dialect(connection) == 'postgresql':
+        connection.execute(text(f"DELETE FROM {INDEX_TABLE} WHERE message_id = :id"), {'id': message_id})
+    else:
+        connection.execute(text(f"DELETE FROM {INDEX_TABLE} WHERE rowid = :id"), {'id': message_id})
+
+def remove_messages_in(connection, table):
+    """Remove the documents of every message in table"""
+    if _dialect(connection) == 'postgresql':
+        connection.execute(text(f"DELETE FROM {INDEX_TABLE} WHERE message_id IN (SELECT id FROM {table})"))
+    else:
+        connection.execute(text(f"DELETE FROM {INDEX_TABLE} WHERE rowid IN (SELECT id FROM {table})"))
+
+def _fts5_query(query):
+    """Turn free text into a safe FTS5 expression: every word must match,
+    the last one as a prefix so results follow the user's typing"""
+    words = re.findall(r'\w+', query)
+    if not words:
+        return None
+    terms = [f'"{w}"' for w in words[:-1]] + [f'"{words[-1]}"*']
+    return ' '.join(terms)
+
+def ranked_matches(connection, query):
+    """Get a text clause with (ticket_id, rank) for tickets matching the query,
+    best match first when ordered by rank ascending. None for an empty query."""
+    if _dialect(connection) == 'postgresql':
+        if not query.strip():
+            return None
+        return text(
+            f"SELECT ticket_id, -MAX(ts_rank(document, q)) AS rank "
+            f"FROM {INDEX_TABLE}, websearch_to_tsquery(CAST(:lang AS regconfig), :query) AS q "
+            "WHERE document @@ q GROUP BY ticket_id"
+        ).bindparams(lang=LANGUAGE, query=query)
+
+    expression = _fts5_query(query)
+    if expression is None:
+        return None
+    return text(
+        # bm25() can't be called inside an aggregate, the hidden rank column can
+        f"SELECT ticket_id, MIN(rank) AS rank FROM {INDEX_TABLE} "
+        f"WHERE {INDEX_TABLE} MATCH :query AND rank MATCH 'bm25(0, 0, {TITLE_WEIGHT}, 1.0)' "
+        "GROUP BY ticket_id"
+    ).bindparams(query=expression)
+
+# Keep the index in sync with ORM writes, inside the same transaction
+def _after_flush(session, flush_context):
+    connection = session.connection()
+    if not index_available(connection):
+        return
+
+    messages = []
+    for obj in session.new:
+        table = getattr(obj, '__tablename__', None)
+        if table == 'ticket':
+            index_ticket(connection, obj.id, obj.title, obj.description, obj.observations)
+        elif table == 'message':
+            messages.append({'id': obj.id, 'ticket_id': obj.ticket_id, 'content': obj.content})
+
+    for obj in session.dirty:
+        table = getattr(obj, '__tablename__', None)
+        state = inspect(obj)
+        if table == 'ticket':
+            if any(state.attrs[f].history.has_changes() for f in ('title', 'description', 'observations')):
+                index_ticket(connection, obj.id, obj.title, obj.description, obj.observations)
+        elif table == 'message' and state.attrs.content.history.has_changes():
+            messages.append({'id': obj.id, 'ticket_id': obj.ticket_id, 'content': obj.content})
+
+    index_messages(connection, messages)
+
+    for obj in session.deleted:
+        table = getattr(obj, '__tablename__', None)
+        if table == 'ticket':
+            remove_ticket(connection, obj.id)
+        elif table == 'message':
+            remove_message(connection, obj.id)
+
+def register_listeners(scoped_session):
+    """Index tickets and messages written through this session"""
+    if not event.contains(scoped_session, 'after_flush', _after_flush):
+        event.listen(scoped_session, 'after_flush', _after_flush)
+
+def register_commands(app, db):
+
+    @app.cli.command('rebuild-search-index')
+    def rebuild_search_index_command():
+        """Rebuild the full-text search index from tickets and messages."""
+        create_index(db)
+        click.echo("Search index rebuilt")
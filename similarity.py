@@ -0,0 +1,173 @@
+import heapq
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+import ticket_events
+
+OPEN_STATUSES = ('Aberto', 'Em Andamento')
+
+# Common Portuguese words that say nothing about the problem
+STOPWORDS = {
+    'a', 'ao', 'aos', 'as', 'com', 'da', 'das', 'de', 'do', 'dos', 'e', 'em',
+    'esta', 'estou', 'eu', 'foi', 'ha', 'mais', 'mas', 'me', 'meu',
+    'minha', 'na', 'nao', 'nas', 'no', 'nos', 'o', 'os', 'ou', 'para', 'pela',
+    'pelo', 'por', 'que', 'se', 'sem', 'ser', 'so', 'um', 'uma', 'uns', 'umas',
+}
+
+TITLE_BOOST = 2  # Title words count as much as two description words
+
+# The index lives in each worker process and only sees the ticket events
+# committed there, so it is rebuilt from the database every REFRESH_INTERVAL
+# seconds to pick up the other workers' changes
+REFRESH_INTERVAL = float(os.environ.get("SIMILARITY_REFRESH_INTERVAL", 300))
+
+def tokenize(text):
+    """Lowercase, accent-free words of two or more letters, minus stopwords"""
+    text = unicodedata.normalize('NFKD', text or '').encode('ascii', 'ignore').decode().lower()
+    return [w for w in re.findall(r'[a-z0-9]{2,}', text) if w not in STOPWORDS]
+
+def _term_counts(title, description):
+    counts = Counter(tokenize(description))
+    for term in tokenize(title):
+        counts[term] += TITLE_BOOST
+    return counts
+
+class SimilarityIndex:
+    """TF-IDF index over open tickets with an inverted list per term.
+
+    Documents keep raw term counts, and idf is applied at query time, so a
+    create or close only touches that ticket's postings. A query only reads
+    the postings of its own terms."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._docs = {}      # ticket_id -> (term counts, length)
+        self._meta = {}      # ticket_id -> dict(title, status, priority, creator_id, assigned_to)
+        self._postings = {}  # term -> set of ticket ids
+        self._pending = None  # changes committed while a load is running
+        self.loaded_at = None
+
+    def __len__(self):
+        return len(self._docs)
+
+    def _remove(self, ticket_id):
+        doc = self._docs.pop(ticket_id, None)
+        self._meta.pop(ticket_id, None)
+        if doc is None:
+            return
+        for term in doc[0]:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.discard(ticket_id)
+                if not postings:
+                    del self._postings[term]
+
+    def _add(self, ticket_id, title, description, meta):
+        self._remove(ticket_id)
+        counts = _term_counts(title, description)
+        if not counts:
+            return
+        length = math.sqrt(sum(c * c for c in counts.values()))
+        self._docs[ticket_id] = (counts, length)
+        self._meta[ticket_id] = dict(meta, title=title)
+        for term in counts:
+            self._postings.setdefault(term, set()).add(ticket_id)
+
+    def begin_load(self):
+        """Start buffering changes; call before reading the rows for load()"""
+        with self._lock:
+            if self._pending is None:
+                self._pending = []
+
+    def load(self, rows):
+        """Replace the contents with (id, title, description, status, priority, creator_id, assigned_to)
+        rows, then replay the changes committed since begin_load()"""
+        with self._lock:
+            self._docs.clear()
+            self._meta.clear()
+            self._postings.clear()
+            for ticket_id, title, description, status, priority, creator_id, assigned_to in rows:
+                self._add(ticket_id, title, description, {
+                    'status': status, 'priority': priority,
+                    'creator_id': creator_id, 'assigned_to': assigned_to
+                })
+            self._apply(self._pending or [])
+            self._pending = None
+            self.loaded_at = time.monotonic()
+
+    def _apply(self, changes):
+        for change in changes:
+            if change.action == 'deleted' or change.status not in OPEN_STATUSES:
+                self._remove(change.ticket_id)
+            else:
+                self._add(change.ticket_id, change.title, change.description, {
+                    'status': change.status, 'priority': change.priority,
+                    'creator_id': change.creator_id, 'assigned_to': change.assigned_to
+                })
+
+    def apply(self, changes):
+        """Apply committed TicketChange events"""
+        with self._lock:
+            if self._pending is not None:
+                self._pending.extend(changes)
+            elif self.loaded_at is not None:
+                self._apply(changes)
+            # Otherwise the first query loads the current state
+
+    def needs_refresh(self):
+        return self.loaded_at is None or time.monotonic() - self.loaded_at > REFRESH_INTERVAL
+
+    def query(self, title, description='', k=5, visible=None, min_score=0.1):
+        """Get up to k (ticket_id, score, meta) most similar to the text, best first.
+        visible(meta) can hide tickets the caller may not see."""
+        counts = _term_counts(title, description)
+        if not counts:
+            return []
+
+        with self._lock:
+            total = len(self._docs)
+            scores = {}
+            query_norm = 0.0
+            for term, count in counts.items():
+                postings = self._postings.get(term)
+                idf = math.log((total + 1) / ((len(postings) if postings else 0) + 1)) + 1
+                weight = count * idf
+                query_norm += weight * weight
+                if not postings:
+                    continue
+                for ticket_id in postings:
+                    scores[ticket_id] = scores.get(ticket_id, 0.0) + weight * self._docs[ticket_id][0][term] * idf
+
+            query_norm = math.sqrt(query_norm)
+            results = []
+            for ticket_id, score in scores.items():
+                length = self._docs[ticket_id][1]
+                # Cosine with idf-weighted query and tf-normalized document
+                normalized = score / (query_norm * length * (math.log(total + 1) + 1))
+                if normalized >= min_score and (visible is None or visible(self._meta[ticket_id])):
+                    results.append((ticket_id, normalized, dict(self._meta[ticket_id])))
+
+        return heapq.nlargest(k, results, key=lambda r: r[1])
+
+index = SimilarityIndex()
+
+def ensure_loaded(session):
+    """Build the index from the open tickets on first use, and rebuild it
+    when it is older than REFRESH_INTERVAL"""
+    if not index.needs_refresh():
+        return
+    from models import Ticket
+    index.begin_load()
+    rows = session.query(
+        Ticket.id, Ticket.title, Ticket.description, Ticket.status,
+        Ticket.priority, Ticket.creator_id, Ticket.assigned_to
+    ).filter(Ticket.status.in_(OPEN_STATUSES)).all()
+    index.load(rows)
+
+@ticket_events.subscribe
+def _on_ticket_changes(changes):
+    index.apply(changes)
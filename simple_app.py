@@ -2,12 +2,15 @@ import os
 import logging
 from flask import Flask, render_template, request, jsonify, session, redirect, url_for
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.orm import DeclarativeBase, joinedload
 from werkzeug.middleware.proxy_fix import ProxyFix
-from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta
-from sqlalchemy import event
-import traceback
+import replicas
+from fragment_cache import FragmentCache
+
+# Feature modules are imported by create_app(), register_commands() and the
+# views that use them, so that importing this module only costs Flask,
+# SQLAlchemy and the models below
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -15,60 +18,53 @@ logging.basicConfig(level=logging.DEBUG)
 class Base(DeclarativeBase):
     pass
 
-db = SQLAlchemy(model_class=Base)
-
-# Create the app
-app = Flask(__name__)
-app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-change-in-production")
-app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
+db = SQLAlchemy(model_class=Base, session_options={'class_': replicas.RoutingSession})
 
-# Configure database with fallback
-def configure_database():
+# Configure database
+def configure_database(app):
+    """Point the app at PostgreSQL when DATABASE_URL is set, SQLite otherwise.
+    No connection is opened here; reachability is reported by /healthz/ready."""
+    import db_tuning
     database_url = os.environ.get("DATABASE_URL")
     if database_url:
-        try:
-            # Test PostgreSQL connection
-            import psycopg2
-            # Extract connection parameters for testing
-            from urllib.parse import urlparse
-            parsed = urlparse(database_url)
-            test_conn = psycopg2.connect(
-                host=parsed.hostname,
-                port=parsed.port,
-                database=parsed.path[1:],
-                user=parsed.username,
-                password=parsed.password
-            )
-            test_conn.close()
-            
-            # PostgreSQL configuration
-            app.config["SQLALCHEMY_DATABASE_URI"] = database_url
-            app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-                "pool_recycle": 300,
-                "pool_pre_ping": True,
-                "pool_timeout": 20,
-                "pool_size": 5,
-                "max_overflow": 10
-            }
-            print("Using PostgreSQL database")
-            return "postgresql"
-        except Exception as e:
-            print(f"PostgreSQL connection failed: {e}")
-            print("Falling back to SQLite")
-    
-    # SQLite fallback configuration
+        # PostgreSQL configuration
+        app.config["SQLALCHEMY_DATABASE_URI"] = database_url
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = db_tuning.engine_options(database_url)
+        print("Using PostgreSQL database")
+        return "postgresql"
+
+    # SQLite configuration
     app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///helpdesk.db"
-    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-        "pool_pre_ping": True,
-    }
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = db_tuning.engine_options("sqlite:///helpdesk.db")
     print("Using SQLite database")
     return "sqlite"
 
-db_type = configure_database()
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+def create_app():
+    """Create and configure the app without touching the database"""
+    import assets
+    import compression
+    import db_tuning
+    import instrumentation
+    app = Flask(__name__)
+    app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-change-in-production")
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
+
+    app.config["DB_TYPE"] = configure_database(app)
+    app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    replicas.configure(app)
+
+    # Initialize extensions
+    db.init_app(app)
+    db_tuning.init_app(app, db)
+    replicas.init_app(app, db)
+    instrumentation.init_app(app)
+    assets.init_app(app)
+    compression.init_app(app)
 
-# Initialize extensions
-db.init_app(app)
+    return app
+
+app = create_app()
+db_type = app.config["DB_TYPE"]
 
 # Models
 class User(db.Model):
@@ -95,23 +91,93 @@ class Ticket(db.Model):
     closed_at = db.Column(db.DateTime)
     sla_due = db.Column(db.DateTime)
     sla_violated = db.Column(db.Boolean, default=False)
+    # Kept by the listeners in models.py (see ticket_counters.py)
+    message_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    attachment_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    last_activity_at = db.Column(db.DateTime, default=datetime.utcnow)
     creator_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     assigned_to = db.Column(db.Integer, db.ForeignKey('user.id'))
+    creator = db.relationship('User', foreign_keys=[creator_id])
+    assignee = db.relationship('User', foreign_keys=[assigned_to])
+
+def register_commands(app):
+    """CLI commands, and the session listeners that index, publish and
+    notify ticket changes as app.py does"""
+    import archive
+    import bootstrap
+    import notifications
+    import partitions
+    import reporting
+    import search
+    import ticket_counters
+    import ticket_events
+    bootstrap.register_commands(app, db, User)
+    archive.register_commands(app, db)
+    partitions.register_commands(app, db)
+    reporting.register_commands(app, db)
+    ticket_counters.register_commands(app, db)
+    search.register_listeners(db.session)
+    ticket_events.register_listeners(db.session)
+    notifications.register_listeners(db.session)
+
+register_commands(app)
+
+# Rendered rows of the ticket list
+TICKETS_PER_PAGE = 50
+
+# Months in the reports page's history table
+REPORT_TREND_MONTHS = 6
+ticket_rows = FragmentCache()
+
+# Opt-in for single-process setups; deployments run `flask init-db` once
+if os.environ.get("AUTO_MIGRATE") == "1":
+    import bootstrap
+    with app.app_context():
+        bootstrap.upgrade_schema(db)
+
+# Compute report figures from this process; otherwise run
+# `flask compute-reports` periodically next to the web workers
+if os.environ.get("REPORT_REFRESHER") == "1":
+    import reporting
+    reporting.start_refresher(app, db)
+
+# Health checks
+@app.route('/healthz/live')
+def liveness():
+    return jsonify({'status': 'ok'})
+
+@app.route('/healthz/ready')
+def readiness():
+    """Report whether the database is reachable and its schema is up to date"""
+    import bootstrap
+    try:
+        with db.engine.connect() as connection:
+            connection.execute(db.text("SELECT 1"))
+        if not bootstrap.schema_is_current(db):
+            return jsonify({'status': 'not ready', 'reason': 'schema out of date', 'database': db_type}), 503
+    except Exception as e:
+        return jsonify({'status': 'not ready', 'reason': str(e), 'database': db_type}), 503
+    return jsonify({'status': 'ready', 'database': db_type})
+
+def _status_totals(by_status):
+    """Dashboard totals from ticket counts by status"""
+    return {
+        'total_tickets': sum(by_status.values()),
+        'open_tickets': by_status['Aberto'] + by_status['Em Andamento'],
+        'resolved_tickets': by_status['Resolvido'],
+        'closed_tickets': by_status['Fechado']
+    }
 
 # Routes
 @app.route('/')
 def index():
+    import archive
     if 'user_id' not in session:
         return redirect(url_for('login'))
     
     try:
         # Get dashboard stats
-        stats = {
-            'total_tickets': Ticket.query.count(),
-            'open_tickets': Ticket.query.filter(Ticket.status.in_(['Aberto', 'Em Andamento'])).count(),
-            'resolved_tickets': Ticket.query.filter_by(status='Resolvido').count(),
-            'closed_tickets': Ticket.query.filter_by(status='Fechado').count()
-        }
+        stats = _status_totals(archive.count_by(db.session, lambda table: table.c.status))
         
         # Get recent tickets for current user
         user_role = session.get('user_role')
@@ -132,6 +198,7 @@ def index():
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
+    import passwords
     if request.method == 'POST':
         username = request.form.get('username')
         password = request.form.get('password')
@@ -140,15 +207,11 @@ def login():
             return render_template('simple_login.html', error='Por favor, preencha todos os campos.')
         
         try:
-            # Initialize database if needed
-            try:
-                db.create_all()
-            except:
-                pass
-            
             user = User.query.filter_by(username=username, active=True).first()
             
-            if user and check_password_hash(user.password_hash, password):
+            if user and passwords.check_user_password(user, password):
+                if db.session.is_modified(user):
+                    db.session.commit()  # Password hash was upgraded
                 session['user_id'] = user.id
                 session['user_name'] = user.name
                 session['user_role'] = user.role
@@ -156,41 +219,12 @@ def login():
                 return redirect(url_for('index'))
             else:
                 return render_template('simple_login.html', error='Credenciais inválidas.')
+        except passwords.LoginBusy:
+            return render_template('simple_login.html', error='Muitas tentativas de login simultâneas. Tente novamente.'), 503
         except Exception as e:
-            # Database connection error - try to initialize with emergency data
+            db.session.rollback()
             print(f"Database error during login: {e}")
-            try:
-                # Try to create tables and demo user
-                db.create_all()
-                
-                # Check if we need to create demo users
-                from werkzeug.security import generate_password_hash
-                if not User.query.first():
-                    admin_user = User(
-                        username='admin',
-                        password_hash=generate_password_hash('admin123'),
-                        role='Administrador',
-                        email='admin@company.com',
-                        name='Administrador Sistema'
-                    )
-                    db.session.add(admin_user)
-                    db.session.commit()
-                    print("Emergency admin user created")
-                
-                # Try login again
-                user = User.query.filter_by(username=username, active=True).first()
-                if user and check_password_hash(user.password_hash, password):
-                    session['user_id'] = user.id
-                    session['user_name'] = user.name
-                    session['user_role'] = user.role
-                    session['username'] = user.username
-                    return redirect(url_for('index'))
-                else:
-                    return render_template('simple_login.html', error='Credenciais inválidas.')
-                    
-            except Exception as init_error:
-                print(f"Emergency initialization failed: {init_error}")
-                return render_template('simple_login.html', error='Erro de conexão com banco de dados. Tente novamente.')
+            return render_template('simple_login.html', error='Erro de conexão com banco de dados. Tente novamente.')
     
     return render_template('simple_login.html')
 
@@ -213,21 +247,29 @@ def tickets():
     user_id = session.get('user_id')
     user_role = session.get('user_role')
     
-    # Get tickets based on user role
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', TICKETS_PER_PAGE, type=int), 1), 200)
+    
+    # Get tickets based on user role, with creator and assignee in the same query
+    query = Ticket.query.options(joinedload(Ticket.creator), joinedload(Ticket.assignee))
     if user_role == 'Colaborador':
-        tickets_list = Ticket.query.filter_by(creator_id=user_id).order_by(Ticket.created_at.desc()).all()
-    else:
-        tickets_list = Ticket.query.order_by(Ticket.created_at.desc()).all()
+        query = query.filter_by(creator_id=user_id)
+    pagination = query.order_by(Ticket.created_at.desc(), Ticket.id.desc()).paginate(
+        page=page, per_page=per_page, error_out=False
+    )
     
-    # Enhance tickets with creator and assignee info
-    for ticket in tickets_list:
-        ticket.creator = User.query.get(ticket.creator_id)
-        if ticket.assigned_to:
-            ticket.assignee = User.query.get(ticket.assigned_to)
-        else:
-            ticket.assignee = None
+    # Rows are rendered once per version of the ticket (and of the names shown)
+    row_template = app.jinja_env.get_template('_ticket_row.html')
+    rows = [
+        ticket_rows.get_or_render(
+            (ticket.id, ticket.updated_at,
+             ticket.creator.name if ticket.creator else None,
+             ticket.assignee.name if ticket.assignee else None),
+            lambda ticket=ticket: row_template.render(ticket=ticket)
+        ) for ticket in pagination.items
+    ]
     
-    return render_template('simple_tickets.html', tickets=tickets_list)
+    return render_template('simple_tickets.html', rows=rows, pagination=pagination)
 
 @app.route('/users')
 def users():
@@ -240,31 +282,38 @@ def users():
     return render_template('simple_users.html', users=users_list)
 
 @app.route('/reports')
+@replicas.read_only
 def reports():
+    import archive
+    import reporting
     if 'user_id' not in session:
         return redirect(url_for('login'))
     if session.get('user_role') not in ['Administrador', 'Diretoria']:
         return redirect(url_for('index'))
     
-    # Calculate report statistics
-    total_tickets = Ticket.query.count()
-    open_tickets = Ticket.query.filter(Ticket.status.in_(['Aberto', 'Em Andamento'])).count()
-    resolved_tickets = Ticket.query.filter_by(status='Resolvido').count()
-    closed_tickets = Ticket.query.filter_by(status='Fechado').count()
+    # Calculate report statistics, archived tickets included
+    by_status = archive.count_by(db.session, lambda table: table.c.status)
+    by_priority = archive.count_by(db.session, lambda table: table.c.priority)
+    by_department = archive.count_by(db.session, lambda table: table.c.department)
+    totals = _status_totals(by_status)
+    total_tickets = totals['total_tickets']
+    open_tickets = totals['open_tickets']
+    resolved_tickets = totals['resolved_tickets']
+    closed_tickets = totals['closed_tickets']
     
     resolution_rate = round((resolved_tickets + closed_tickets) / total_tickets * 100, 1) if total_tickets > 0 else 0
     
     # Priority breakdown
     priority_breakdown = [
-        {'priority': 'Alta', 'count': Ticket.query.filter_by(priority='Alta').count()},
-        {'priority': 'Média', 'count': Ticket.query.filter_by(priority='Média').count()},
-        {'priority': 'Baixa', 'count': Ticket.query.filter_by(priority='Baixa').count()}
+        {'priority': 'Alta', 'count': by_priority['Alta']},
+        {'priority': 'Média', 'count': by_priority['Média']},
+        {'priority': 'Baixa', 'count': by_priority['Baixa']}
     ]
     
     # Status breakdown
     status_breakdown = [
-        {'status': 'Aberto', 'count': Ticket.query.filter_by(status='Aberto').count()},
-        {'status': 'Em Andamento', 'count': Ticket.query.filter_by(status='Em Andamento').count()},
+        {'status': 'Aberto', 'count': by_status['Aberto']},
+        {'status': 'Em Andamento', 'count': by_status['Em Andamento']},
         {'status': 'Resolvido', 'count': resolved_tickets},
         {'status': 'Fechado', 'count': closed_tickets}
     ]
@@ -273,29 +322,57 @@ def reports():
     departments = ['TI', 'RH', 'Financeiro', 'Vendas', 'Marketing', 'Operações', 'Suporte']
     department_breakdown = []
     for dept in departments:
-        count = Ticket.query.filter_by(department=dept).count()
+        count = by_department[dept]
         if count > 0:
             department_breakdown.append({'department': dept, 'count': count})
     
+    # Resolution time, SLA and backlog of one month (current by default)
+    period = request.args.get('period')
+    if not reporting.is_period(period):
+        period = reporting.period_of(datetime.utcnow())
+    # Stored by `flask compute-reports` or the refresher, see reporting.py
+    trend_periods = reporting.recent_periods(REPORT_TREND_MONTHS)
+    figures = reporting.stored(db.session, [period, *trend_periods])
+    trend = [figures[p] for p in trend_periods if p in figures]
+    computed = period in figures
+    figures = figures.get(period) or reporting.blank(period)
+    
+    technician_ids = [int(key) for key in figures['by_technician'] if key != reporting.NO_TECHNICIAN]
+    names = dict(db.session.query(User.id, User.name).filter(User.id.in_(technician_ids))) if technician_ids else {}
+    technician_breakdown = [
+        dict(values, name=names.get(int(key), f'#{key}') if key != reporting.NO_TECHNICIAN else 'Não atribuído')
+        for key, values in figures['by_technician'].items()
+    ]
+    technician_breakdown.sort(key=lambda t: (-t['resolved'], t['name']))
+    
     stats = {
         'total_tickets': total_tickets,
         'open_tickets': open_tickets,
         'resolved_tickets': resolved_tickets,
         'closed_tickets': closed_tickets,
         'resolution_rate': resolution_rate,
-        'avg_resolution_time': 24,  # Mock data for average resolution time
+        'period': period,
+        'computed': computed,
+        'avg_resolution_time': figures['resolution_hours']['avg'] if figures['resolution_hours'] else 0,
+        'resolution_hours': figures['resolution_hours'],
         'priority_breakdown': priority_breakdown,
         'status_breakdown': status_breakdown,
         'department_breakdown': department_breakdown,
-        'sla_compliance': 85,  # Mock SLA compliance percentage
-        'sla_violations': 0    # Mock SLA violations count
+        'sla_compliance': figures['sla_compliance'],
+        'sla_violations': figures['sla_violations'],
+        'backlog': figures['backlog'],
+        'backlog_aging': figures['backlog_aging'],
+        'technician_breakdown': technician_breakdown,
+        'trend': trend
     }
     
     return render_template('simple_reports.html', stats=stats)
 
 # API Routes
 @app.route('/api/dashboard/stats')
+@replicas.read_only
 def get_dashboard_stats():
+    import archive
     if 'user_id' not in session:
         return jsonify({'error': 'Unauthorized'}), 401
     
@@ -303,11 +380,12 @@ def get_dashboard_stats():
     if user_role not in ['Administrador', 'Diretoria', 'Técnico']:
         return jsonify({'error': 'Access denied'}), 403
     
-    # Basic stats
-    total_tickets = Ticket.query.count()
-    open_tickets = Ticket.query.filter(Ticket.status.in_(['Aberto', 'Em Andamento'])).count()
-    resolved_tickets = Ticket.query.filter_by(status='Resolvido').count()
-    closed_tickets = Ticket.query.filter_by(status='Fechado').count()
+    # Basic stats, archived tickets included
+    totals = _status_totals(archive.count_by(db.session, lambda table: table.c.status))
+    total_tickets = totals['total_tickets']
+    open_tickets = totals['open_tickets']
+    resolved_tickets = totals['resolved_tickets']
+    closed_tickets = totals['closed_tickets']
     
     return jsonify({
         'total_tickets': total_tickets,
@@ -346,12 +424,14 @@ def get_tickets():
     if user_role == 'Colaborador':
         query = query.filter_by(creator_id=user_id)
     
-    tickets = query.order_by(Ticket.created_at.desc()).all()
+    # Newest first, or most recently active first with sort=activity
+    order = Ticket.last_activity_at if request.args.get('sort') == 'activity' else Ticket.created_at
+    tickets = query.options(joinedload(Ticket.creator), joinedload(Ticket.assignee)).order_by(order.desc()).all()
     
     result = []
     for ticket in tickets:
-        creator = User.query.get(ticket.creator_id)
-        assignee = User.query.get(ticket.assigned_to) if ticket.assigned_to else None
+        creator = ticket.creator
+        assignee = ticket.assignee
         
         result.append({
             'id': ticket.id,
@@ -375,8 +455,9 @@ def get_tickets():
                 'name': assignee.name,
                 'email': assignee.email
             } if assignee else None,
-            'message_count': 0,
-            'attachment_count': 0
+            'message_count': ticket.message_count,
+            'attachment_count': ticket.attachment_count,
+            'last_activity_at': ticket.last_activity_at.isoformat() if ticket.last_activity_at else None
         })
     
     return jsonify(result)
@@ -417,65 +498,5 @@ def create_ticket():
     
     return jsonify({'message': 'Ticket created successfully', 'ticket_id': ticket.id}), 201
 
-def init_database():
-    """Initialize database with tables and demo data"""
-    max_retries = 3
-    retry_delay = 1
-    
-    for attempt in range(max_retries):
-        try:
-            with app.app_context():
-                # Test database connection first
-                with db.engine.connect() as connection:
-                    connection.execute(db.text("SELECT 1"))
-                
-                # Create all tables
-                db.create_all()
-                
-                # Check if admin user already exists
-                admin_exists = User.query.filter_by(username='admin').first()
-                if not admin_exists:
-                    # Create demo users only if they don't exist
-                    demo_users = [
-                        {"username": "admin", "password": "admin123", "role": "Administrador", "email": "admin@company.com", "name": "Administrador Sistema"},
-                        {"username": "tecnico1", "password": "tecnico123", "role": "Técnico", "email": "tecnico1@company.com", "name": "João Silva"},
-                        {"username": "colaborador1", "password": "colab123", "role": "Colaborador", "email": "colaborador1@company.com", "name": "Maria Santos"},
-                        {"username": "diretor", "password": "diretor123", "role": "Diretoria", "email": "diretor@company.com", "name": "Carlos Diretor"}
-                    ]
-                    
-                    for user_data in demo_users:
-                        user = User(
-                            username=user_data["username"],
-                            password_hash=generate_password_hash(user_data["password"]),
-                            role=user_data["role"],
-                            email=user_data["email"],
-                            name=user_data["name"]
-                        )
-                        db.session.add(user)
-                    
-                    db.session.commit()
-                    print("Database initialized with demo users")
-                else:
-                    print("Database already initialized")
-                break  # Success, exit retry loop
-                
-        except Exception as e:
-            print(f"Database initialization error (attempt {attempt + 1}/{max_retries}): {e}")
-            if attempt < max_retries - 1:
-                print(f"Retrying in {retry_delay} seconds...")
-                import time
-                time.sleep(retry_delay)
-                retry_delay *= 2  # Exponential backoff
-            else:
-                print("Database initialization failed after all retries. App will continue with limited functionality.")
-                # Force SQLite as fallback
-                app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///helpdesk_emergency.db"
-                try:
-                    with app.app_context():
-                        db.create_all()
-                        print("Emergency SQLite database created")
-                except Exception as emergency_error:
-                    print(f"Emergency database creation failed: {emergency_error}")
-
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
@@ -0,0 +1,111 @@
+import functools
+import threading
+import time
+import metrics
+
+# Sockets and rooms are tracked per worker: with several workers behind a
+# message queue, each one reports the connections it holds
+
+class ConnectionRegistry:
+    """Authenticated sockets (sid -> user info) and the rooms they joined"""
+
+    def __init__(self):
+        self._connections = {}
+        self._rooms = {}  # room -> set of sids
+        self._joined = {}  # sid -> set of rooms
+        self._lock = threading.Lock()
+
+    def __contains__(self, sid):
+        return sid in self._connections
+
+    def __len__(self):
+        return len(self._connections)
+
+    def add(self, sid, info):
+        with self._lock:
+            self._connections[sid] = info
+            self._joined.setdefault(sid, set())
+
+    def get(self, sid):
+        return self._connections.get(sid)
+
+    def remove(self, sid):
+        """Forget a socket and its room memberships. Returns its info, if any."""
+        with self._lock:
+            for room in self._joined.pop(sid, ()):
+                self._discard(room, sid)
+            return self._connections.pop(sid, None)
+
+    def join(self, sid, room):
+        with self._lock:
+            self._rooms.setdefault(room, set()).add(sid)
+            self._joined.setdefault(sid, set()).add(room)
+
+    def leave(self, sid, room):
+        with self._lock:
+            self._discard(room, sid)
+            joined = self._joined.get(sid)
+            if joined is not None:
+                joined.discard(room)
+
+    def _discard(self, room, sid):
+        members = self._rooms.get(room)
+        if members is not None:
+            members.discard(sid)
+            if not members:
+                del self._rooms[room]
+
+    def room_size(self, room, exclude=None):
+        members = self._rooms.get(room, ())
+        return len(members) - (exclude in members)
+
+    def users(self):
+        with self._lock:
+            return len({info['user_id'] for info in self._connections.values()})
+
+    def occupancy(self):
+        """{room kind: (rooms, members)}, where the kind is the room name up to
+        the first '_' (ticket_42 -> ticket)"""
+        with self._lock:
+            sizes = [(room.split('_', 1)[0], len(members)) for room, members in self._rooms.items()]
+        occupancy = {}
+        for kind, size in sizes:
+            rooms, members = occupancy.get(kind, (0, 0))
+            occupancy[kind] = (rooms + 1, members + size)
+        return occupancy
+
+connections = ConnectionRegistry()
+
+EVENTS = metrics.counter('socketio_events_total', 'Socket.IO events handled.', ('event',))
+EVENT_ERRORS = metrics.counter('socketio_event_errors_total', 'Socket.IO handlers that failed.', ('event',))
+EVENT_DURATION = metrics.histogram('socketio_event_duration_seconds', 'Socket.IO handler time.', ('event',))
+FANOUT = metrics.histogram('socketio_emit_fanout', 'Sockets reached by a room emit.', ('event',),
+                           buckets=(0, 1, 2, 5, 10, 25, 50, 100, 250, 1000))
+metrics.gauge('socketio_connections', 'Authenticated Socket.IO connections.', callback=lambda: len(connections))
+metrics.gauge('socketio_users', 'Distinct users with a Socket.IO connection.', callback=connections.users)
+metrics.gauge('socketio_rooms', 'Rooms with at least one socket, by kind.', ('kind',),
+              callback=lambda: {(kind,): rooms for kind, (rooms, _) in connections.occupancy().items()})
+metrics.gauge('socketio_room_members', 'Sockets in rooms, by room kind.', ('kind',),
+              callback=lambda: {(kind,): members for kind, (_, members) in connections.occupancy().items()})
+
+def instrumented(event):
+    """Count a Socket.IO handler's calls and time them"""
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return handler(*args, **kwargs)
+            except Exception:
+                EVENT_ERRORS.inc(event=event)
+                raise
+            finally:
+                EVENTS.inc(event=event)
+                EVENT_DURATION.observe(time.perf_counter() - start, event=event)
+        return wrapper
+    return decorator
+
+def fanout(event, room, exclude=None):
+    """Record how many sockets an emit to room reaches (leaving out the
+    sender's sid when it is passed as exclude)"""
+    FANOUT.observe(connections.room_size(room, exclude), event=event)
@@ -3,60 +3,103 @@ from flask import request
 from flask_jwt_extended import decode_token
 from app import socketio
 from database import db
-from models import User, Ticket, Message
+from models import Ticket, Message
+import identity
+import dashboard_feed
+import socket_registry
 import logging
 
-# Store active connections
-active_connections = {}
+connections = socket_registry.connections
+instrumented = socket_registry.instrumented
 
 @socketio.on('connect')
+@instrumented('connect')
 def handle_connect(auth):
     try:
         if auth and 'token' in auth:
             # Verify JWT token
             try:
                 decoded_token = decode_token(auth['token'])
-                user_id = decoded_token['sub']
-                user = User.query.get(user_id)
+                user_id = int(decoded_token['sub'])
+                # Cached, so a reconnect storm doesn't turn into a query per socket
+                user = identity.lookup(user_id)
                 
-                if user:
-                    active_connections[request.sid] = {
+                if user and user.active:
+                    connections.add(request.sid, {
                         'user_id': user_id,
-                        'username': user.username,
                         'name': user.name,
                         'role': user.role
-                    }
+                    })
+                    # Staff receive ticket-wide notifications (e.g. bulk updates)
+                    if user.role in ['Técnico', 'Administrador']:
+                        join_room('technicians')
+                        connections.join(request.sid, 'technicians')
                     emit('connected', {'message': 'Connected successfully'})
-                    logging.info(f"User {user.username} connected via WebSocket")
+                    logging.info(f"User {user.name} connected via WebSocket")
                 else:
                     emit('error', {'message': 'Invalid user'})
                     return False
             except Exception as e:
                 emit('error', {'message': 'Invalid token'})
+                socket_registry.EVENT_ERRORS.inc(event='connect')
                 logging.error(f"WebSocket connection error: {str(e)}")
                 return False
         else:
             emit('error', {'message': 'Authentication required'})
             return False
     except Exception as e:
+        socket_registry.EVENT_ERRORS.inc(event='connect')
         logging.error(f"WebSocket connection error: {str(e)}")
         return False
 
 @socketio.on('disconnect')
+@instrumented('disconnect')
 def handle_disconnect():
-    if request.sid in active_connections:
-        user_info = active_connections[request.sid]
-        logging.info(f"User {user_info['username']} disconnected from WebSocket")
-        del active_connections[request.sid]
+    user_info = connections.remove(request.sid)
+    if user_info:
+        logging.info(f"User {user_info['name']} disconnected from WebSocket")
+    dashboard_feed.feed.leave(request.sid)
+
+@socketio.on('join_dashboard')
+@instrumented('join_dashboard')
+def handle_join_dashboard(data=None):
+    try:
+        if request.sid not in connections:
+            emit('error', {'message': 'Not authenticated'})
+            return
+        
+        user = identity.lookup(connections.get(request.sid)['user_id'])
+        if user.role not in ['Administrador', 'Diretoria', 'Técnico']:
+            emit('error', {'message': 'Access denied'})
+            return
+        
+        # Stat deltas for clients that loaded /api/dashboard/stats
+        join_room(dashboard_feed.ROOM)
+        connections.join(request.sid, dashboard_feed.ROOM)
+        dashboard_feed.feed.join(request.sid)
+        emit('joined_dashboard', {'frame_interval': dashboard_feed.FRAME_INTERVAL})
+        
+    except Exception as e:
+        emit('error', {'message': str(e)})
+        socket_registry.EVENT_ERRORS.inc(event='join_dashboard')
+        logging.error(f"Error joining dashboard: {str(e)}")
+
+@socketio.on('leave_dashboard')
+@instrumented('leave_dashboard')
+def handle_leave_dashboard(data=None):
+    leave_room(dashboard_feed.ROOM)
+    connections.leave(request.sid, dashboard_feed.ROOM)
+    dashboard_feed.feed.leave(request.sid)
 
 @socketio.on('join_ticket')
+@instrumented('join_ticket')
 def handle_join_ticket(data):
     try:
-        if request.sid not in active_connections:
+        if request.sid not in connections:
             emit('error', {'message': 'Not authenticated'})
             return
         
-        user_info = active_connections[request.sid]
+        user_info = connections.get(request.sid)
         ticket_id = data.get('ticket_id')
         
         if not ticket_id:
@@ -64,12 +107,12 @@ def handle_join_ticket(data):
             return
         
         # Verify user has access to this ticket
-        ticket = Ticket.query.get(ticket_id)
+        ticket = db.session.query(Ticket.creator_id).filter(Ticket.id == ticket_id).first()
         if not ticket:
             emit('error', {'message': 'Ticket not found'})
             return
         
-        user = User.query.get(user_info['user_id'])
+        user = identity.lookup(user_info['user_id'])
         if user.role == 'Colaborador' and ticket.creator_id != user.id:
             emit('error', {'message': 'Access denied'})
             return
@@ -77,6 +120,7 @@ def handle_join_ticket(data):
         # Join the room for this ticket
         room = f"ticket_{ticket_id}"
         join_room(room)
+        connections.join(request.sid, room)
         
         emit('joined_ticket', {
             'ticket_id': ticket_id,
@@ -84,6 +128,7 @@ def handle_join_ticket(data):
         })
         
         # Notify others in the room
+        socket_registry.fanout('user_joined', room, exclude=request.sid)
         emit('user_joined', {
             'user': {
                 'name': user_info['name'],
@@ -92,26 +137,30 @@ def handle_join_ticket(data):
             'ticket_id': ticket_id
         }, room=room, include_self=False)
         
-        logging.info(f"User {user_info['username']} joined ticket #{ticket_id} chat")
+        logging.info(f"User {user_info['name']} joined ticket #{ticket_id} chat")
         
     except Exception as e:
         emit('error', {'message': str(e)})
+        socket_registry.EVENT_ERRORS.inc(event='join_ticket')
         logging.error(f"Error joining ticket chat: {str(e)}")
 
 @socketio.on('leave_ticket')
+@instrumented('leave_ticket')
 def handle_leave_ticket(data):
     try:
-        if request.sid not in active_connections:
+        if request.sid not in connections:
             return
         
-        user_info = active_connections[request.sid]
+        user_info = connections.get(request.sid)
         ticket_id = data.get('ticket_id')
         
         if ticket_id:
             room = f"ticket_{ticket_id}"
             leave_room(room)
+            connections.leave(request.sid, room)
             
             # Notify others in the room
+            socket_registry.fanout('user_left', room)
             emit('user_left', {
                 'user': {
                     'name': user_info['name'],
@@ -120,19 +169,21 @@ def handle_leave_ticket(data):
                 'ticket_id': ticket_id
             }, room=room)
             
-            logging.info(f"User {user_info['username']} left ticket #{ticket_id} chat")
+            logging.info(f"User {user_info['name']} left ticket #{ticket_id} chat")
             
     except Exception as e:
+        socket_registry.EVENT_ERRORS.inc(event='leave_ticket')
         logging.error(f"Error leaving ticket chat: {str(e)}")
 
 @socketio.on('send_message')
+@instrumented('send_message')
 def handle_send_message(data):
     try:
-        if request.sid not in active_connections:
+        if request.sid not in connections:
             emit('error', {'message': 'Not authenticated'})
             return
         
-        user_info = active_connections[request.sid]
+        user_info = connections.get(request.sid)
         ticket_id = data.get('ticket_id')
         content = data.get('content')
         
@@ -141,12 +192,12 @@ def handle_send_message(data):
             return
         
         # Verify user has access to this ticket
-        ticket = Ticket.query.get(ticket_id)
+        ticket = db.session.query(Ticket.creator_id).filter(Ticket.id == ticket_id).first()
         if not ticket:
             emit('error', {'message': 'Ticket not found'})
             return
         
-        user = User.query.get(user_info['user_id'])
+        user = identity.lookup(user_info['user_id'])
         if user.role == 'Colaborador' and ticket.creator_id != user.id:
             emit('error', {'message': 'Access denied'})
             return
@@ -164,6 +215,7 @@ def handle_send_message(data):
         
         # Broadcast message to all users in the ticket room
         room = f"ticket_{ticket_id}"
+        socket_registry.fanout('new_message', room)
         emit('new_message', {
             'id': message.id,
             'content': message.content,
@@ -177,25 +229,28 @@ def handle_send_message(data):
             'ticket_id': ticket_id
         }, room=room)
         
-        logging.info(f"Message sent by {user_info['username']} in ticket #{ticket_id}")
+        logging.info(f"Message sent by {user_info['name']} in ticket #{ticket_id}")
         
     except Exception as e:
         db.session.rollback()
         emit('error', {'message': str(e)})
+        socket_registry.EVENT_ERRORS.inc(event='send_message')
         logging.error(f"Error sending message: {str(e)}")
 
 @socketio.on('typing')
+@instrumented('typing')
 def handle_typing(data):
     try:
-        if request.sid not in active_connections:
+        if request.sid not in connections:
             return
         
-        user_info = active_connections[request.sid]
+        user_info = connections.get(request.sid)
         ticket_id = data.get('ticket_id')
         is_typing = data.get('is_typing', False)
         
         if ticket_id:
             room = f"ticket_{ticket_id}"
+            socket_registry.fanout('user_typing', room, exclude=request.sid)
             emit('user_typing', {
                 'user': {
                     'name': user_info['name'],
@@ -206,19 +261,22 @@ def handle_typing(data):
             }, room=room, include_self=False)
             
     except Exception as e:
+        socket_registry.EVENT_ERRORS.inc(event='typing')
         logging.error(f"Error handling typing indicator: {str(e)}")
 
 @socketio.on('ticket_updated')
+@instrumented('ticket_updated')
 def handle_ticket_update(data):
     try:
-        if request.sid not in active_connections:
+        if request.sid not in connections:
             return
         
-        user_info = active_connections[request.sid]
+        user_info = connections.get(request.sid)
         ticket_id = data.get('ticket_id')
         
         if ticket_id:
             room = f"ticket_{ticket_id}"
+            socket_registry.fanout('ticket_status_changed', room, exclude=request.sid)
             emit('ticket_status_changed', {
                 'ticket_id': ticket_id,
                 'updated_by': {
@@ -228,4 +286,5 @@ def handle_ticket_update(data):
             }, room=room, include_self=False)
             
     except Exception as e:
+        socket_registry.EVENT_ERRORS.inc(event='ticket_updated')
         logging.error(f"Error handling ticket update: {str(e)}")
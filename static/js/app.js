@@ -121,6 +121,11 @@ const App = {
     
     // Load a specific view
     loadView(viewName) {
+        // Stop dashboard deltas when navigating away
+        if (this.currentView === 'dashboard' && viewName !== 'dashboard') {
+            Dashboard.unsubscribe();
+        }
+        
         // Update active navigation
         document.querySelectorAll('.nav-item').forEach(item => {
             item.classList.remove('active');
@@ -187,6 +192,11 @@ const App = {
             
             this.socket.on('connect', () => {
                 console.log('Connected to WebSocket server');
+                
+                // Rooms are lost with the connection: reload the snapshot and rejoin
+                if (this.currentView === 'dashboard') {
+                    Dashboard.loadDashboard();
+                }
             });
             
             this.socket.on('disconnect', () => {
@@ -1,14 +1,21 @@
 // Dashboard module
 const Dashboard = {
     charts: {},
+    stats: null,
+    listening: false,
     
-    // Load dashboard data
+    // Load dashboard data once; later changes arrive as socket deltas
     async loadDashboard() {
         try {
             App.showLoading('dashboardContent');
             
+            // Join before the snapshot so no change falls in between
+            this.stats = null;
+            this.subscribe();
+            
             const response = await axios.get('/api/dashboard/stats');
             const stats = response.data;
+            this.stats = stats;
             
             this.renderStats(stats);
             this.renderCharts(stats);
@@ -296,5 +303,96 @@ const Dashboard = {
     // Refresh dashboard data
     refresh() {
         this.loadDashboard();
+    },
+    
+    // Receive stat deltas pushed to the dashboard room
+    subscribe() {
+        const socket = App.socket;
+        if (!socket) {
+            return;
+        }
+        
+        if (!this.listening) {
+            socket.on('dashboard_delta', (frame) => this.applyDelta(frame));
+            this.listening = true;
+        }
+        
+        if (socket.connected) {
+            socket.emit('join_dashboard');
+        }
+    },
+    
+    // Stop receiving deltas when leaving the dashboard
+    unsubscribe() {
+        if (App.socket && App.socket.connected) {
+            App.socket.emit('leave_dashboard');
+        }
+        this.stats = null;
+    },
+    
+    // Apply a delta frame to the loaded snapshot
+    applyDelta(frame) {
+        const stats = this.stats;
+        if (!stats) {
+            return;
+        }
+        
+        Object.entries(frame.totals || {}).forEach(([key, delta]) => {
+            stats[key] = (stats[key] || 0) + delta;
+        });
+        if (frame.sla) {
+            Object.assign(stats, frame.sla);
+        }
+        
+        this.mergeBreakdown(stats.priority_breakdown, 'priority', frame.priority);
+        this.mergeBreakdown(stats.status_breakdown, 'status', frame.status);
+        this.mergeBreakdown(stats.department_breakdown, 'department', frame.department);
+        this.mergeBreakdown(stats.recent_activity, 'date', frame.activity);
+        
+        this.renderStats(stats);
+        if (frame.priority) {
+            this.updateChart(this.charts.priority, stats.priority_breakdown, 'priority');
+        }
+        if (frame.status) {
+            this.updateChart(this.charts.status, stats.status_breakdown, 'status');
+        }
+        if (frame.department) {
+            this.updateChart(this.charts.department, stats.department_breakdown, 'department');
+        }
+        if (frame.activity) {
+            this.renderActivityChart(stats.recent_activity);
+        }
+    },
+    
+    // Add {name: delta} counts to a [{key: name, count}] breakdown
+    mergeBreakdown(items, key, deltas) {
+        if (!items || !deltas) {
+            return;
+        }
+        
+        Object.entries(deltas).forEach(([name, delta]) => {
+            const item = items.find(i => i[key] === name);
+            if (item) {
+                item.count += delta;
+            } else if (delta > 0) {
+                items.push({ [key]: name, count: delta });
+            }
+        });
+        
+        for (let i = items.length - 1; i >= 0; i--) {
+            if (items[i].count <= 0) {
+                items.splice(i, 1);
+            }
+        }
+    },
+    
+    // Update a chart's data in place, without recreating it
+    updateChart(chart, items, key) {
+        if (!chart) {
+            return;
+        }
+        chart.data.labels = items.map(item => item[key]);
+        chart.data.datasets[0].data = items.map(item => item.count);
+        chart.update('none');
     }
 };
@@ -7,6 +7,7 @@ const Tickets = {
         department: '',
         assigned_to: ''
     },
+    searchQuery: '',
     
     // Load tickets
     async loadTickets() {
@@ -21,8 +22,16 @@ const Tickets = {
                 }
             });
             
-            const response = await axios.get(`/api/tickets?${queryParams}`);
-            this.currentTickets = response.data;
+            // Text search goes through the server-side index
+            if (this.searchQuery) {
+                queryParams.append('q', this.searchQuery);
+                queryParams.append('per_page', 100);
+                const response = await axios.get(`/api/search?${queryParams}`);
+                this.currentTickets = response.data.results;
+            } else {
+                const response = await axios.get(`/api/tickets?${queryParams}`);
+                this.currentTickets = response.data;
+            }
             
             this.renderTickets();
             this.renderFilters();
@@ -134,7 +143,11 @@ const Tickets = {
         const priorities = ['Alta', 'Média', 'Baixa'];
         
         filtersContainer.innerHTML = `
-            <div class="grid grid-cols-1 md:grid-cols-4 gap-4 mb-6">
+            <div class="grid grid-cols-1 md:grid-cols-5 gap-4 mb-6">
+                <div>
+                    <label class="block text-sm font-medium text-gray-700 mb-1">Buscar</label>
+                    <input id="searchFilter" type="search" class="helpdesk-input" placeholder="Título, descrição, mensagens..." value="${this.searchQuery.replace(/"/g, '&quot;')}">
+                </div>
                 <div>
                     <label class="block text-sm font-medium text-gray-700 mb-1">Status</label>
                     <select id="statusFilter" class="helpdesk-select">
@@ -171,6 +184,11 @@ const Tickets = {
         `;
         
         // Add event listeners to filters
+        document.getElementById('searchFilter').addEventListener('change', (e) => {
+            this.searchQuery = e.target.value.trim();
+            this.loadTickets();
+        });
+        
         document.getElementById('statusFilter').addEventListener('change', (e) => {
             this.filters.status = e.target.value;
             this.loadTickets();
@@ -195,6 +213,7 @@ const Tickets = {
             department: '',
             assigned_to: ''
         };
+        this.searchQuery = '';
         this.loadTickets();
     },
     
@@ -468,6 +487,58 @@ const Tickets = {
             App.showNotification('Erro ao criar chamado', 'error');
             throw error;
         }
+    },
+    
+    // Suggest open tickets similar to the one being written
+    async suggestSimilar(title, description) {
+        const container = document.getElementById('similarTickets');
+        if (!container) return;
+        
+        if (title.trim().length < 4) {
+            container.innerHTML = '';
+            return;
+        }
+        
+        try {
+            const params = new URLSearchParams({ title, description, k: 5 });
+            const response = await axios.get(`/api/tickets/similar?${params}`);
+            
+            if (response.data.length === 0) {
+                container.innerHTML = '';
+                return;
+            }
+            
+            // Titles are user input: build the list with textContent, not innerHTML
+            const box = document.createElement('div');
+            box.className = 'bg-yellow-50 border border-yellow-200 rounded-md p-3 text-sm';
+            const heading = document.createElement('p');
+            heading.className = 'font-medium text-yellow-800 mb-1';
+            heading.textContent = 'Chamados parecidos em aberto:';
+            const list = document.createElement('ul');
+            list.className = 'space-y-1';
+            
+            response.data.forEach(ticket => {
+                const item = document.createElement('li');
+                const link = document.createElement('a');
+                link.href = '#';
+                link.className = 'text-blue-600 hover:underline';
+                link.textContent = `#${ticket.id} - ${ticket.title}`;
+                link.addEventListener('click', (e) => {
+                    e.preventDefault();
+                    Tickets.viewTicket(ticket.id);
+                });
+                const status = document.createElement('span');
+                status.className = 'text-gray-500';
+                status.textContent = ` (${ticket.status})`;
+                item.append(link, status);
+                list.appendChild(item);
+            });
+            
+            box.append(heading, list);
+            container.replaceChildren(box);
+        } catch (error) {
+            console.error('Error loading similar tickets:', error);
+        }
     }
 };
 
@@ -475,6 +546,19 @@ const Tickets = {
 document.addEventListener('DOMContentLoaded', () => {
     const createTicketForm = document.getElementById('createTicketForm');
     if (createTicketForm) {
+        let similarTimer = null;
+        const suggest = () => {
+            clearTimeout(similarTimer);
+            similarTimer = setTimeout(() => {
+                Tickets.suggestSimilar(
+                    createTicketForm.elements.title.value,
+                    createTicketForm.elements.description.value
+                );
+            }, 300);
+        };
+        createTicketForm.elements.title.addEventListener('input', suggest);
+        createTicketForm.elements.description.addEventListener('input', suggest);
+        
         createTicketForm.addEventListener('submit', async (e) => {
             e.preventDefault();
             
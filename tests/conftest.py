@@ -0,0 +1,125 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TMP = tempfile.mkdtemp(prefix='helpdesk-tests-')
+
+# The apps read their configuration at import, so set it up before any test
+# module imports them: a throwaway SQLite file, cheap hashes, no background
+# threads
+sys.path.insert(0, ROOT)
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(TMP, 'helpdesk.db')}"
+os.environ['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:1000'
+os.environ['TEMPLATE_CACHE_DIR'] = os.path.join(TMP, 'jinja_cache')
+os.environ['DASHBOARD_FEED'] = '0'
+for name in ('AUTO_MIGRATE', 'NOTIFY_DISPATCHER', 'SOCKETIO_ASYNC_MODE', 'DATABASE_REPLICA_URLS',
+             'SOCKETIO_MESSAGE_QUEUE', 'REPORT_REFRESHER', 'METRICS_ENABLED', 'METRICS_TOKEN'):
+    os.environ.pop(name, None)
+
+PASSWORD = 'secret123'
+
+@pytest.fixture(scope='session')
+def helpdesk():
+    """The JWT app module, with the schema at the latest version"""
+    import app as helpdesk
+    import bootstrap
+    with helpdesk.app.app_context():
+        bootstrap.upgrade_schema(helpdesk.db)
+    return helpdesk
+
+def _wipe(engine):
+    """Empty every table (dropping month tables) but keep the schema"""
+    from sqlalchemy import inspect, text
+    import partitions
+    import search
+    with engine.begin() as connection:
+        for name in inspect(connection).get_table_names():
+            if name == 'schema_version' or name.startswith(f'{search.INDEX_TABLE}_'):
+                continue  # FTS5 keeps its own shadow tables
+            if partitions.PERIOD_TABLE.match(name):
+                connection.execute(text(f'DROP TABLE {name}'))
+            else:
+                connection.execute(text(f'DELETE FROM "{name}"'))
+
+@pytest.fixture
+def db(helpdesk):
+    """The app's db inside an app context; tables and caches are emptied
+    after each test"""
+    import identity
+    import passwords
+    with helpdesk.app.app_context():
+        yield helpdesk.db
+        helpdesk.db.session.remove()
+        _wipe(helpdesk.db.engine)
+    identity.invalidate()
+    passwords.clear_cache()
+
+@pytest.fixture
+def client(helpdesk, db):
+    from flask import g
+    from flask.testing import FlaskClient
+
+    class Client(FlaskClient):
+        def open(self, *args, **kwargs):
+            # Requests reuse the test's app context and so its g; start each
+            # with an empty one, as a real request does
+            for name in list(g):
+                g.pop(name)
+            return super().open(*args, **kwargs)
+
+    return Client(helpdesk.app, helpdesk.app.response_class, use_cookies=True)
+
+@pytest.fixture
+def make_user(db):
+    import passwords
+    from models import User
+
+    def make_user(username='admin', role='Administrador', password=PASSWORD):
+        user = User(username=username, password_hash=passwords.hash_password(password), role=role,
+                    email=f'{username}@company.com', name=username.title())
+        db.session.add(user)
+        db.session.commit()
+        return user
+    return make_user
+
+@pytest.fixture
+def login(client):
+    """Authorization headers of an existing user"""
+    def login(username):
+        response = client.post('/api/login', json={'username': username, 'password': PASSWORD})
+        return {'Authorization': f"Bearer {response.get_json()['access_token']}"}
+    return login
+
+@pytest.fixture
+def auth(login, make_user):
+    """Authorization headers of a new user: auth() for an admin, or
+    auth('tecnico1', 'Técnico')"""
+    def auth(username='admin', role='Administrador'):
+        make_user(username, role)
+        return login(username)
+    return auth
+
+@pytest.fixture
+def make_ticket(db):
+    from models import Ticket
+
+    def make_ticket(creator, **values):
+        values = {'title': 'Impressora sem conexão', 'description': 'Não imprime desde ontem',
+                  'department': 'TI', 'priority': 'Média', **values}
+        ticket = Ticket(creator_id=creator.id, **values)
+        db.session.add(ticket)
+        db.session.commit()
+        return ticket
+    return make_ticket
+
+@pytest.fixture
+def simple_client(db, make_user):
+    """A client of the session-based simple_app, logged in as an admin"""
+    import simple_app
+    make_user()
+    client = simple_app.app.test_client()
+    client.post('/login', data={'username': 'admin', 'password': PASSWORD})
+    return client
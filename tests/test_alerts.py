@@ -0,0 +1,52 @@
+import pytest
+
+@pytest.fixture
+def post_alerts(client, auth, monkeypatch):
+    """POST alerts as a technician and wait for the writer thread"""
+    import alerts
+    monkeypatch.setattr(alerts, 'FLUSH_INTERVAL', 0.05)
+    alerts.cache.clear()
+    headers = auth('tecnico1', 'Técnico')
+
+    def post_alerts(batch):
+        response = client.post('/api/alerts', headers=headers, json={'alerts': batch})
+        assert alerts.flush(5)
+        return response
+    yield post_alerts
+    alerts.flush(5)
+    alerts.cache.clear()
+
+def test_repeats_become_messages(post_alerts, db):
+    from models import Message, Ticket
+    disk = {'title': 'Disco cheio em srv01', 'source': 'zabbix', 'severity': 'critical'}
+    response = post_alerts([disk, {'title': 'CPU alta em srv02', 'source': 'zabbix'}, disk, {'severity': 'low'}])
+    assert response.status_code == 202
+    result = response.get_json()
+    assert (result['new'], result['duplicates'], result['rejected']) == (2, 1, 0)
+    assert result['errors'] == [{'index': 3, 'error': 'title is required'}]
+
+    db.session.expire_all()
+    ticket = Ticket.query.filter_by(title=disk['title']).one()
+    assert (ticket.priority, ticket.department, ticket.message_count) == ('Alta', 'TI', 1)
+    assert Ticket.query.count() == 2
+    assert Message.query.one().content.startswith('Alerta recebido novamente')
+
+def test_resolved_ticket_opens_a_new_one(post_alerts, db):
+    from models import Ticket
+    disk = {'title': 'Disco cheio em srv01', 'fingerprint': 'srv01-disk'}
+    post_alerts([disk])
+    ticket = Ticket.query.one()
+    ticket.status = 'Resolvido'
+    db.session.commit()
+
+    assert post_alerts([disk]).get_json()['new'] == 1
+    db.session.expire_all()
+    assert sorted(t.status for t in Ticket.query) == ['Aberto', 'Resolvido']
+
+def test_invalid_batches(client, auth):
+    headers = auth('tecnico1', 'Técnico')
+    assert client.post('/api/alerts', headers=headers, json={'alerts': []}).status_code == 400
+    assert client.post('/api/alerts', headers=headers, json=[{'title': 'x', 'priority': 'Urgente'}]).get_json()[
+        'errors'] == [{'index': 0, 'error': 'priority must be one of Alta, Média, Baixa'}]
+    colaborador = auth('colab1', 'Colaborador')
+    assert client.post('/api/alerts', headers=colaborador, json=[{'title': 'x'}]).status_code == 403
@@ -0,0 +1,52 @@
+import csv
+import io
+from datetime import datetime, timedelta
+
+import pytest
+
+@pytest.fixture
+def archived(db, make_user, make_ticket):
+    """A ticket closed a year ago with two messages, moved to the archive,
+    and an open one; returns (archived, open) ids"""
+    import archive
+    from models import Message
+    admin = make_user()
+    year_ago = datetime.utcnow() - timedelta(days=365)
+    old = make_ticket(admin, title='Antigo', status='Fechado', created_at=year_ago, closed_at=year_ago)
+    for content in ('Bom dia', 'Resolvido'):
+        db.session.add(Message(content=content, ticket_id=old.id, user_id=admin.id, timestamp=year_ago))
+    db.session.commit()
+    # Owners of the newest ticket and message stay hot (archive._pinned_tickets)
+    new = make_ticket(admin, title='Novo', priority='Alta')
+    db.session.add(Message(content='Olá', ticket_id=new.id, user_id=admin.id))
+    db.session.commit()
+    old_id, new_id = old.id, new.id
+    db.session.expire_all()
+    assert list(archive.archive_closed(db.engine, days=30)) == [1]
+    return old_id, new_id
+
+def test_archive_moves_rows_and_counters(db, archived):
+    from models import Message, MessageArchive, Ticket, TicketArchive
+    old_id, new_id = archived
+    assert [t.id for t in Ticket.query] == [new_id]
+    ticket = db.session.get(TicketArchive, old_id)
+    assert ticket.message_count == 2 and ticket.archived_at is not None
+    assert MessageArchive.query.filter_by(ticket_id=old_id).count() == 2
+    assert [m.ticket_id for m in Message.query] == [new_id]
+
+def test_dashboard_counts_archived_tickets(client, auth, archived):
+    stats = client.get('/api/dashboard/stats', headers=auth('diretor', 'Diretoria')).get_json()
+    assert (stats['total_tickets'], stats['open_tickets'], stats['closed_tickets']) == (2, 1, 1)
+    assert {s['status']: s['count'] for s in stats['status_breakdown']} == {'Aberto': 1, 'Fechado': 1}
+    assert {p['priority']: p['count'] for p in stats['priority_breakdown']} == {'Alta': 1, 'Média': 1}
+
+def test_export_includes_archived_tickets(client, auth, archived):
+    headers = auth('diretor', 'Diretoria')
+
+    def titles(query=''):
+        response = client.get(f'/api/reports/export{query}', headers=headers)
+        return [row[1] for row in list(csv.reader(io.StringIO(response.get_data(as_text=True))))[1:]]
+
+    assert titles() == ['Novo', 'Antigo']
+    assert titles('?status=Fechado') == ['Antigo']
+    assert titles('?status=Aberto') == ['Novo']
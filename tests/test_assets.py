@@ -0,0 +1,28 @@
+import hashlib
+import os
+
+from conftest import ROOT, TMP
+
+def test_static_urls_carry_the_content_hash(helpdesk):
+    app = helpdesk.app
+    with open(os.path.join(ROOT, 'static', 'js', 'app.js'), 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()[:12]
+    with app.test_request_context():
+        from flask import url_for
+        assert url_for('static', filename='js/app.js') == f'/static/js/app.js?v={digest}'
+        # Only js/ and css/ are fingerprinted
+        assert url_for('static', filename='img/logo.png') == '/static/img/logo.png'
+
+    client = app.test_client()
+    response = client.get(f'/static/js/app.js?v={digest}')
+    assert response.cache_control.immutable and response.cache_control.max_age == 365 * 24 * 3600
+    response.close()
+    response = client.get('/static/js/app.js?v=outdated')
+    assert not response.cache_control.immutable
+    response.close()
+
+def test_prewarm_fills_the_bytecode_cache(helpdesk):
+    import assets
+    count = assets.prewarm_templates(helpdesk.app)
+    assert count == len(helpdesk.app.jinja_env.list_templates(extensions=('html',))) > 0
+    assert len(os.listdir(os.path.join(TMP, 'jinja_cache'))) >= count
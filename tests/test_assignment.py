@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+@pytest.fixture
+def index(monkeypatch):
+    """A fresh process-wide load index with auto-assignment on"""
+    import assignment
+    index = assignment.LoadIndex()
+    monkeypatch.setattr(assignment, 'index', index)
+    monkeypatch.setattr(assignment, 'AUTO_ASSIGN', True)
+    return index
+
+def test_ticket_weight():
+    import assignment
+    now = datetime.utcnow()
+    assert assignment.ticket_weight('Alta', now - timedelta(minutes=1), now) == 6.0
+    assert assignment.ticket_weight('Média', now + timedelta(minutes=30), now) == 3.0
+    assert assignment.ticket_weight('Baixa', now + timedelta(hours=5), now) == 1.0
+    assert assignment.ticket_weight('Baixa', None, now) == 1.0
+
+def test_least_loaded_technician_is_picked(index):
+    import ticket_events
+    index.load([1, 2], [(10, 1, 'Alta', None), (11, 2, 'Baixa', None)])
+    assert index.pick(12, 1.0) == 2
+    assert index.pick(13, 2.0) == 2
+    assert (index.load_of(1), index.load_of(2)) == (3.0, 4.0)
+    assert index.pick(14, 1.0) == 1
+
+    # Closing a ticket takes its weight off
+    closed = ticket_events.TicketChange('updated', 13, 't', 'd', 'TI', 'Fechado', 'Média', 2, 5, None,
+                                        {'status': 'Aberto'})
+    index.apply([closed])
+    assert index.load_of(2) == 2.0
+
+def test_new_tickets_are_assigned(client, auth, make_user, make_ticket, db, index):
+    from models import Message, Ticket
+    headers = auth('colab1', 'Colaborador')
+    busy, free = make_user('tecnico1', 'Técnico'), make_user('tecnico2', 'Técnico')
+    make_ticket(busy, assigned_to=busy.id, priority='Alta')
+
+    ticket_ids = []
+    for title in ('Mouse quebrado', 'Teclado sem teclas'):
+        response = client.post('/api/tickets', headers=headers, json={
+            'title': title, 'description': 'Precisa trocar', 'department': 'TI', 'priority': 'Baixa'})
+        ticket_ids.append(response.get_json()['ticket_id'])
+
+    db.session.expire_all()
+    # Alta (3) on one, so both Baixa (1) tickets go to the other
+    assert [db.session.get(Ticket, i).assigned_to for i in ticket_ids] == [free.id, free.id]
+    assert Message.query.filter_by(ticket_id=ticket_ids[0]).one().content == \
+        'Chamado atribuído automaticamente para Tecnico2'
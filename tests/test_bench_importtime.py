@@ -0,0 +1,30 @@
+import os
+import subprocess
+import sys
+
+from conftest import ROOT
+
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+def test_repo_modules_are_not_third_party():
+    import bench_importtime
+    timings = {name: (1, 1) for name in (
+        'app', 'models', 'routes', 'flask', 'flask.app', 'sqlalchemy.orm', 'json', '_io', 'sitecustomize')}
+    assert bench_importtime.third_party_packages(timings) == ['flask', 'sqlalchemy']
+
+def test_new_package_is_a_regression():
+    import bench_importtime
+    baseline = {'total_ms': 100.0, 'packages': ['flask']}
+    report = {'total_ms': 110.0, 'packages': ['flask', 'redis']}
+    assert bench_importtime.check(report, baseline, 0.25) == ['new packages imported at startup: redis']
+    report['total_ms'] = 130.0
+    assert len(bench_importtime.check(report, baseline, 0.25)) == 2
+
+def test_simple_app_defers_feature_modules(tmp_path):
+    """Importing simple_app loads Flask, SQLAlchemy and its own models, not
+    the JWT app's models or the notification clients"""
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{tmp_path / 'import.db'}")
+    script = "import sys, simple_app; print(sorted({'models', 'smtplib', 'urllib.request'} & set(sys.modules)))"
+    result = subprocess.run([sys.executable, '-c', script], cwd=ROOT, env=env, capture_output=True, text=True,
+                            check=True)
+    assert result.stdout.splitlines()[-1] == '[]'
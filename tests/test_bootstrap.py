@@ -0,0 +1,88 @@
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+
+from conftest import ROOT
+
+BASELINE_DB = os.path.join(ROOT, 'instance', 'helpdesk.db')
+
+@pytest.fixture
+def fresh_db(tmp_path):
+    """A bare app's db on an empty SQLite file, inside its app context"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'helpdesk.db'}"
+    db = SQLAlchemy()
+    db.init_app(app)
+    with app.app_context():
+        yield db
+        db.engine.dispose()
+
+def test_migrations_run_once_and_in_order(fresh_db):
+    import bootstrap
+    applied = []
+    migrations = [(1, 'One', lambda db: applied.append(1)), (2, 'Two', lambda db: applied.append(2))]
+    assert not bootstrap.schema_is_current(fresh_db, migrations)
+    assert bootstrap.upgrade_schema(fresh_db, migrations) == 2
+    assert bootstrap.upgrade_schema(fresh_db, migrations) == 2
+    migrations.append((3, 'Three', lambda db: applied.append(3)))
+    assert bootstrap.upgrade_schema(fresh_db, migrations) == 3
+    assert applied == [1, 2, 3]
+    assert bootstrap.schema_is_current(fresh_db, migrations)
+
+def test_demo_users_are_seeded_once(db):
+    import bootstrap
+    from models import User
+    assert bootstrap.seed_demo_users(db, User) == 4
+    assert bootstrap.seed_demo_users(db, User) == 0
+    assert User.query.filter_by(username='tecnico1').one().role == 'Técnico'
+
+def _init_db(database):
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{database}')
+    return subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'init-db'],
+                          cwd=ROOT, env=env, capture_output=True, text=True, timeout=120)
+
+def test_upgrade_from_baseline_schema(tmp_path):
+    """A database made before the versioned migrations reaches the latest
+    version with its rows and with the counters backfilled"""
+    import bootstrap
+    database = str(tmp_path / 'baseline.db')
+    shutil.copy(BASELINE_DB, database)
+    with sqlite3.connect(database) as connection:
+        tickets = connection.execute('SELECT count(*) FROM ticket').fetchone()[0]
+        ticket_id, creator_id = connection.execute('SELECT id, creator_id FROM ticket LIMIT 1').fetchone()
+        connection.executemany(
+            'INSERT INTO message (content, timestamp, message_type, ticket_id, user_id) '
+            "VALUES (?, '2024-01-01 10:00:00', 'message', ?, ?)",
+            [('Bom dia', ticket_id, creator_id), ('Resolvido?', ticket_id, creator_id)]
+        )
+
+    result = _init_db(database)
+    assert result.returncode == 0, result.stderr
+    assert f"-> {bootstrap.latest_version()}" in result.stdout
+
+    with sqlite3.connect(database) as connection:
+        assert connection.execute('SELECT max(version) FROM schema_version').fetchone()[0] == bootstrap.latest_version()
+        assert connection.execute('SELECT count(*) FROM ticket').fetchone()[0] == tickets
+        assert connection.execute('SELECT message_count FROM ticket WHERE id = ?', (ticket_id,)).fetchone()[0] == 2
+        indexes = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {'ix_ticket_created_at', 'ix_ticket_last_activity', 'ix_ticket_resolved_at',
+            'ix_message_ticket_timestamp'} <= indexes
+
+    # Nothing left to apply
+    result = _init_db(database)
+    assert result.returncode == 0, result.stderr
+    assert f"{bootstrap.latest_version()} -> {bootstrap.latest_version()}" in result.stdout
+
+def test_migrations_rerun_on_current_schema(helpdesk):
+    """Every migration is idempotent"""
+    import bootstrap
+    with helpdesk.app.app_context():
+        for _, _, migrate in bootstrap.MIGRATIONS:
+            migrate(helpdesk.db)
+        assert bootstrap.schema_is_current(helpdesk.db)
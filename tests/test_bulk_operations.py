@@ -0,0 +1,30 @@
+def test_assign_needs_a_user_id(client, auth, make_user, make_ticket, db):
+    headers = auth()
+    technician = make_user('tecnico1', 'Técnico')
+    ticket = make_ticket(technician)
+    for value in ('abc', ['1'], {'id': 1}):
+        response = client.post('/api/tickets/bulk', headers=headers,
+                               json={'ids': [ticket.id], 'operation': 'assign', 'value': value})
+        assert response.status_code == 400
+        assert response.get_json()['error'] == 'value must be a user id'
+    response = client.post('/api/tickets/bulk', headers=headers,
+                           json={'ids': [ticket.id], 'operation': 'assign', 'value': 999})
+    assert response.status_code == 404
+
+def test_assign_and_close(client, auth, make_user, make_ticket, db):
+    from models import Message, Ticket
+    headers = auth()
+    technician = make_user('tecnico1', 'Técnico')
+    ids = [make_ticket(technician).id for _ in range(3)]
+    response = client.post('/api/tickets/bulk', headers=headers,
+                           json={'ids': ids, 'operation': 'assign', 'value': str(technician.id)})
+    assert response.get_json()['updated'] == 3
+    response = client.post('/api/tickets/bulk', headers=headers,
+                           json={'filter': {'status': 'Aberto'}, 'operation': 'close'})
+    assert response.get_json()['updated'] == 3
+    db.session.expire_all()
+    tickets = Ticket.query.all()
+    assert {(t.status, t.assigned_to) for t in tickets} == {('Fechado', technician.id)}
+    assert all(t.closed_at is not None for t in tickets)
+    # One system message per change, counted on the ticket
+    assert Message.query.count() == 6 and {t.message_count for t in tickets} == {2}
@@ -0,0 +1,70 @@
+import gzip
+import json
+import os
+import zlib
+
+import pytest
+from flask import Flask, Response, jsonify
+
+@pytest.fixture
+def app(tmp_path):
+    """A bare app with compression and its own static folder"""
+    import compression
+    static = tmp_path / 'static'
+    static.mkdir()
+    (static / 'big.js').write_text('console.log("helpdesk");\n' * 200)
+    app = Flask(__name__, static_folder=str(static))
+    compression.init_app(app)
+
+    @app.route('/big')
+    def big():
+        return jsonify([{'id': i, 'title': 'Impressora sem toner'} for i in range(200)])
+
+    @app.route('/small')
+    def small():
+        return jsonify({'ok': True})
+
+    @app.route('/stream')
+    def stream():
+        return Response((json.dumps({'line': i}) + '\n' for i in range(3)), mimetype='application/x-ndjson')
+
+    return app
+
+def test_large_responses_are_gzipped(app):
+    client = app.test_client()
+    response = client.get('/big', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.vary
+    assert len(json.loads(gzip.decompress(response.data))) == 200
+
+    assert 'Content-Encoding' not in client.get('/small', headers={'Accept-Encoding': 'gzip'}).headers
+    assert 'Content-Encoding' not in client.get('/big').headers
+
+def test_streams_are_flushed_chunk_by_chunk(app):
+    response = app.test_client().get('/stream', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    chunks = list(response.response)
+    decompressor = zlib.decompressobj(31)
+    # Each line can be decompressed as soon as its chunk arrives
+    assert decompressor.decompress(chunks[0]) == b'{"line": 0}\n'
+    assert b''.join(decompressor.decompress(c) for c in chunks[1:]) == b'{"line": 1}\n{"line": 2}\n'
+
+def test_precompressed_static_files(app):
+    import compression
+    path = os.path.join(app.static_folder, 'big.js')
+    assert 'gzip' in compression.precompress_file(path)
+    assert compression.precompress_file(path) == {}  # Up to date
+
+    client = app.test_client()
+    response = client.get('/static/big.js', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.mimetype.endswith('javascript')
+    assert gzip.decompress(response.data) == open(path, 'rb').read()
+    response.close()
+
+    # An edited file is never shadowed by its stale copy
+    os.utime(path, (os.path.getmtime(path) + 10,) * 2)
+    assert compression.precompressed_encodings(app.static_folder, 'big.js') == []
+    response = client.get('/static/big.js', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+    response.close()
@@ -0,0 +1,20 @@
+import pytest
+
+def test_threading_mode_is_left_alone(monkeypatch):
+    import concurrency
+    assert concurrency.ASYNC_MODE == 'threading' and not concurrency.GREEN
+    concurrency.monkey_patch()
+    assert not concurrency.patched()
+    assert concurrency.server_options() == {}
+    assert concurrency.run_in_thread(pow, 2, 10) == 1024
+
+def test_unknown_mode_is_refused(monkeypatch):
+    import concurrency
+    monkeypatch.setattr(concurrency, 'ASYNC_MODE', 'asyncio')
+    with pytest.raises(ValueError, match='SOCKETIO_ASYNC_MODE must be one of'):
+        concurrency.monkey_patch()
+
+def test_eventlet_server_options(monkeypatch):
+    import concurrency
+    monkeypatch.setattr(concurrency, 'ASYNC_MODE', 'eventlet')
+    assert concurrency.server_options() == {'max_size': concurrency.MAX_CONNECTIONS}
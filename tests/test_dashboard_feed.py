@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+class LoopDone(Exception):
+    pass
+
+class FakeSocketIO:
+    """Records the background task and emits; sleep() ends the loop after
+    one frame"""
+
+    def __init__(self):
+        self.task = None
+        self.emitted = []
+        self.sleeps = 0
+
+    def start_background_task(self, target, *args):
+        self.task = (target, args)
+
+    def sleep(self, seconds):
+        self.sleeps += 1
+        if self.sleeps > 1:
+            raise LoopDone
+
+    def emit(self, event, data, to=None):
+        self.emitted.append((event, data, to))
+
+@pytest.fixture
+def feed(monkeypatch, helpdesk, db):
+    import dashboard_feed
+    feed = dashboard_feed.DashboardFeed()
+    monkeypatch.setattr(dashboard_feed, 'feed', feed)
+    socketio = FakeSocketIO()
+    feed.start(helpdesk.app, socketio, db)
+    return feed, socketio
+
+def test_changes_are_dropped_until_started(db, make_user, make_ticket, monkeypatch):
+    import dashboard_feed
+    feed = dashboard_feed.DashboardFeed()
+    monkeypatch.setattr(dashboard_feed, 'feed', feed)
+    make_ticket(make_user())
+    assert feed.next_frame(db.session) is None
+
+def test_worker_without_viewers_publishes_its_changes(db, make_user, make_ticket, feed):
+    from models import Ticket
+    feed, socketio = feed
+    assert feed.viewers == 0
+    admin = make_user()
+    make_ticket(admin, status='Aberto', created_at=datetime.utcnow() - timedelta(days=2))
+    make_ticket(admin, priority='Alta')
+    # Loaded, as the routes do, so the old status is known
+    ticket = Ticket.query.filter_by(priority='Alta').one()
+    ticket.status = 'Fechado'
+    db.session.commit()
+
+    target, args = socketio.task
+    with pytest.raises(LoopDone):
+        target(*args)
+    [(event, frame, room)] = socketio.emitted
+    assert (event, room) == ('dashboard_delta', 'dashboard')
+    assert frame['totals'] == {'total_tickets': 2, 'open_tickets': 1, 'closed_tickets': 1}
+    assert frame['priority'] == {'Média': 1, 'Alta': 1}
+    # Re-counted by the worker that made the change, for viewers elsewhere
+    assert frame['sla'] == {'sla_violated': 1, 'sla_warning': 0}
@@ -0,0 +1,24 @@
+from sqlalchemy import create_engine, text
+
+def test_engine_options():
+    import db_tuning
+    assert db_tuning.engine_options('sqlite:///helpdesk.db') == {}
+    options = db_tuning.engine_options('postgresql://localhost/helpdesk')
+    assert (options['pool_size'], options['max_overflow'], options['pool_pre_ping']) == (5, 10, True)
+    assert options['connect_args'] == {'options': '-c statement_timeout=30000'}
+
+def test_sqlite_connections_get_the_pragmas(tmp_path):
+    import db_tuning
+    engine = create_engine(f"sqlite:///{tmp_path / 'tuned.db'}")
+    db_tuning.tune_engine(engine, 'test')
+    db_tuning.tune_engine(engine, 'test')  # Only listens once
+    with engine.connect() as connection:
+        assert connection.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+        assert connection.execute(text('PRAGMA synchronous')).scalar() == 1  # NORMAL
+        assert connection.execute(text('PRAGMA busy_timeout')).scalar() == db_tuning.SQLITE_BUSY_TIMEOUT_MS
+        assert db_tuning.pool_connections()[('test', 'checked_out')] == 1
+    assert db_tuning.pool_capacity()[('test',)] == 15
+    engine.dispose()
+
+def test_app_engine_is_tuned(db):
+    assert db.session.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
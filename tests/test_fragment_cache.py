@@ -0,0 +1,35 @@
+def test_fragments_are_kept_per_key_and_evicted_lru():
+    from fragment_cache import FragmentCache
+    cache = FragmentCache(size=2)
+    renders = []
+
+    def render(key):
+        return cache.get_or_render(key, lambda: renders.append(key) or f'<li>{key}</li>')
+
+    assert render('a') == '<li>a</li>'
+    render('b')
+    render('a')
+    render('c')  # evicts b, the least recently used
+    render('a')
+    render('b')
+    assert renders == ['a', 'b', 'c', 'b']
+    assert (cache.hits, cache.misses, len(cache)) == (2, 4, 2)
+
+def test_ticket_list_renders_changed_rows_only(simple_client, db, make_ticket):
+    import simple_app
+    from models import Ticket, User
+    simple_app.ticket_rows.clear()
+    admin = User.query.one()
+    for title in ('Impressora parada', 'Sem rede'):
+        make_ticket(admin, title=title)
+
+    assert simple_client.get('/tickets').status_code == 200
+    misses = simple_app.ticket_rows.misses
+    page = simple_client.get('/tickets').get_data(as_text=True)
+    assert simple_app.ticket_rows.misses == misses and 'Sem rede' in page
+
+    Ticket.query.filter_by(title='Sem rede').one().title = 'Rede voltou'
+    db.session.commit()
+    page = simple_client.get('/tickets').get_data(as_text=True)
+    assert simple_app.ticket_rows.misses == misses + 1
+    assert 'Rede voltou' in page and 'Sem rede' not in page
@@ -0,0 +1,40 @@
+def test_lookup_is_cached(db, make_user):
+    import identity
+    from models import User
+    user = make_user('tecnico1', 'Técnico')
+    assert identity.lookup(user.id).role == 'Técnico'
+    # A plain statement bypasses the ORM events, so the cached row stays
+    db.session.execute(User.__table__.update().values(role='Colaborador'))
+    db.session.commit()
+    assert identity.lookup(str(user.id)).role == 'Técnico'
+    identity.invalidate(user.id)
+    assert identity.lookup(user.id).role == 'Colaborador'
+
+def test_user_changes_invalidate(db, make_user):
+    import identity
+    user = make_user('tecnico1', 'Técnico')
+    assert identity.lookup(user.id).active
+    user.role = 'Administrador'
+    db.session.commit()
+    assert identity.lookup(user.id).role == 'Administrador'
+
+    user_id = user.id
+    db.session.delete(user)
+    db.session.commit()
+    assert identity.lookup(user_id) is None
+
+def test_rolled_back_change_is_not_cached(db, make_user):
+    import identity
+    user = make_user('tecnico1', 'Técnico')
+    user.role = 'Administrador'
+    db.session.flush()
+    db.session.rollback()
+    assert identity.lookup(user.id).role == 'Técnico'
+
+def test_deactivated_user_is_locked_out(client, auth, db):
+    from models import User
+    headers = auth('tecnico1', 'Técnico')
+    assert client.get('/api/tickets', headers=headers).status_code == 200
+    User.query.filter_by(username='tecnico1').one().active = False
+    db.session.commit()
+    assert client.get('/api/tickets', headers=headers).status_code == 404
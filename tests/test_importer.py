@@ -0,0 +1,64 @@
+import io
+import json
+
+LINES = [
+    {'title': 'Sem acesso ao email', 'description': 'Senha expirada', 'department': 'TI', 'priority': 'Alta'},
+    {'title': 123, 'description': 'Título numérico', 'department': 'TI', 'priority': 'Alta'},
+    {'title': 'Monitor piscando', 'description': ['lista'], 'department': 'TI', 'priority': 'Baixa'},
+    {'title': 'Teclado', 'description': 'Teclas falhando', 'department': 'TI', 'priority': 'Baixa',
+     'assigned_to': {'id': 1}},
+    {'title': 'Impressora', 'description': 'Sem toner', 'department': 'RH', 'priority': 'Urgente'},
+    {'title': 'VPN', 'description': 'Não conecta', 'department': 'TI', 'priority': 'Média', 'creator': 'admin'},
+]
+
+def _jsonl(records):
+    return ''.join(json.dumps(record) + '\n' for record in records) + 'not json\n'
+
+def test_bad_rows_are_reported_and_skipped(db, make_user):
+    import importer
+    from models import Ticket
+    admin = make_user()
+    report = importer.import_tickets(io.StringIO(_jsonl(LINES)), 'jsonl', admin.id, chunk_size=2)
+    assert (report.processed, report.imported, report.failed) == (7, 2, 5)
+    assert [error['line'] for error in report.errors] == [2, 3, 4, 5, 7]
+    assert report.errors[0]['error'] == 'title must be text'
+    assert sorted(t.title for t in Ticket.query) == ['Sem acesso ao email', 'VPN']
+
+def test_csv_import(db, make_user):
+    import importer
+    from models import Ticket
+    admin = make_user()
+    data = ('title,description,department,priority,status,creator\n'
+            'Rede lenta,Setor 3,TI,Alta,Aberto,admin\n'
+            'Sem cadeira,,RH,Baixa,Aberto,admin\n')
+    report = importer.import_tickets(io.StringIO(data), 'csv')
+    assert (report.imported, report.failed) == (1, 1)
+    assert report.errors == [{'line': 3, 'error': 'description is required'}]
+    ticket = Ticket.query.one()
+    assert (ticket.creator_id, ticket.last_activity_at) == (admin.id, ticket.created_at)
+
+def test_streamed_import_keeps_going_after_a_bad_row(client, auth):
+    headers = dict(auth(), **{'Content-Type': 'application/x-ndjson'})
+    response = client.post('/api/tickets/import?chunk_size=2', headers=headers, data=_jsonl(LINES))
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert not any('error' in line for line in lines)
+    assert lines[-1]['done'] and (lines[-1]['imported'], lines[-1]['failed']) == (2, 5)
+
+def test_indexed_documents_belong_to_their_tickets(db, make_user, monkeypatch):
+    import importer
+    import search
+    import ticket_events
+    from sqlalchemy import text
+    from models import Ticket
+    admin = make_user()
+    changes = []
+    monkeypatch.setattr(ticket_events, 'record', lambda session, batch: changes.extend(batch))
+    titles = [f'Chamado importado {n}' for n in range(20)]
+    records = [{'title': title, 'description': 'Lote', 'department': 'TI', 'priority': 'Baixa'} for title in titles]
+    report = importer.import_tickets(io.StringIO(_jsonl(records)), 'jsonl', admin.id, chunk_size=50)
+    assert report.imported == 20
+
+    by_id = {t.id: t.title for t in Ticket.query}
+    indexed = db.session.execute(text(f'SELECT ticket_id, title FROM {search.INDEX_TABLE} WHERE message_id = 0'))
+    assert dict(indexed.all()) == by_id
+    assert {change.ticket_id: change.title for change in changes} == by_id
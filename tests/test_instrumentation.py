@@ -0,0 +1,53 @@
+def test_statement_shape():
+    import instrumentation
+    assert instrumentation.statement_shape('SELECT *\n  FROM ticket WHERE id IN (?, ?, ?)') == \
+        'SELECT * FROM ticket WHERE id IN (?)'
+    assert instrumentation.statement_shape('SELECT 1 WHERE id IN (%(a)s, %(b)s)') == 'SELECT 1 WHERE id IN (?)'
+    assert instrumentation.statement_verb('  update ticket SET x = 1') == 'UPDATE'
+    assert instrumentation.statement_verb('PRAGMA journal_mode') == 'OTHER'
+
+def test_metric_rendering():
+    import metrics
+    counter = metrics.Counter('jobs_total', 'Jobs.', ('kind',))
+    counter.inc(kind='import')
+    counter.inc(2, kind='import')
+    assert counter.render().splitlines()[-1] == 'jobs_total{kind="import"} 3'
+
+    histogram = metrics.Histogram('job_seconds', 'Job time.', buckets=(0.1, 1.0))
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    assert histogram.render().splitlines()[2:] == [
+        'job_seconds_bucket{le="0.1"} 1', 'job_seconds_bucket{le="1"} 2', 'job_seconds_bucket{le="+Inf"} 2',
+        'job_seconds_sum 0.55', 'job_seconds_count 2',
+    ]
+
+def test_requests_and_their_sql_are_counted(client, auth, monkeypatch):
+    import instrumentation
+    monkeypatch.setattr(instrumentation, 'METRICS_ENABLED', True)
+    headers = auth()
+    before = instrumentation.REQUEST_QUERIES.count(route='/api/tickets')
+    assert client.get('/api/tickets', headers=headers).status_code == 200
+    assert instrumentation.REQUEST_QUERIES.count(route='/api/tickets') == before + 1
+
+    text = client.get('/metrics').get_data(as_text=True)
+    assert 'http_requests_total{method="GET",route="/api/tickets",status="200"}' in text
+    assert 'sql_query_duration_seconds_count{verb="SELECT"}' in text
+
+def test_metrics_endpoint_is_off_by_default(client, monkeypatch):
+    import instrumentation
+    assert client.get('/metrics').status_code == 404
+
+    monkeypatch.setattr(instrumentation, 'METRICS_ENABLED', True)
+    monkeypatch.setattr(instrumentation, 'METRICS_TOKEN', 'scrape')
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={'Authorization': 'Bearer scrape'}).status_code == 200
+
+def test_repeated_statement_shapes():
+    import instrumentation
+    stats = instrumentation.RequestStats()
+    for statement in ('SELECT * FROM user WHERE id = ?', 'SELECT * FROM user WHERE id = ?',
+                      'SELECT * FROM user WHERE id IN (?, ?)', 'SELECT * FROM user WHERE id IN (?, ?, ?)',
+                      'SELECT * FROM ticket'):
+        stats.statements[statement] += 1
+    assert stats.repeated(1) == [('SELECT * FROM user WHERE id = ?', 2), ('SELECT * FROM user WHERE id IN (?)', 2)]
+    assert stats.repeated(2) == []
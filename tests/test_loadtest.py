@@ -0,0 +1,26 @@
+import json
+import os
+import sys
+
+from conftest import ROOT
+
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+def test_summary_percentiles():
+    import loadtest
+    samples = list(range(1, 101))
+    assert [loadtest.percentile(samples, pct) for pct in (50, 95, 99)] == [51, 95, 99]
+    summary = loadtest.summarize(samples, 2, 4.0)
+    assert (summary['requests'], summary['errors'], summary['throughput_per_s']) == (100, 2, 25.0)
+    assert summary['latency_ms']['max'] == 100
+
+def test_slower_p95_is_a_regression(tmp_path, capsys):
+    import loadtest
+    baseline = tmp_path / 'before.json'
+
+    def result(p95):
+        return {'throughput_per_s': 100.0, 'latency_ms': {'p95': p95}}
+    baseline.write_text(json.dumps({'scenarios': {'login': result(10.0), 'tickets': result(10.0)}}))
+    report = {'scenarios': {'login': result(10.5), 'tickets': result(13.0), 'chat': result(5.0)}}
+    assert loadtest.compare(report, str(baseline), 10) == ['tickets']
+    assert '+30.0%' in capsys.readouterr().err
@@ -0,0 +1,104 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+class FakeSMTP:
+    """Accepts `fail_after` messages, then the connection drops"""
+    fail_after = 2
+    sent = []
+
+    def __init__(self, host, port, timeout=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def send_message(self, message):
+        if len(FakeSMTP.sent) == FakeSMTP.fail_after:
+            raise ConnectionResetError('Connection reset by peer')
+        FakeSMTP.sent.append(message['To'])
+
+@pytest.fixture
+def outbox(db):
+    """Add n due email events; returns their ids"""
+    from models import OutboxEvent
+
+    def outbox(n):
+        payload = json.dumps({'event': 'ticket.assigned', 'previous': {}, 'ticket': {
+            'id': 1, 'title': 'Impressora', 'priority': 'Alta', 'department': 'TI', 'status': 'Aberto'}})
+        events = [OutboxEvent(event_type='ticket.assigned', channel='email', endpoint=f'user{i}@company.com',
+                              payload=payload, next_attempt_at=datetime.utcnow() - timedelta(seconds=1))
+                  for i in range(n)]
+        db.session.add_all(events)
+        db.session.commit()
+        return [e.id for e in events]
+    return outbox
+
+def test_connection_lost_halfway_only_retries_the_rest(db, helpdesk, outbox, monkeypatch):
+    import smtplib
+    import notifications
+    from models import OutboxEvent
+    monkeypatch.setattr(notifications, 'SMTP_HOST', 'smtp.company.com')
+    monkeypatch.setattr(smtplib, 'SMTP', FakeSMTP)
+    monkeypatch.setattr(FakeSMTP, 'sent', [])
+    ids = outbox(5)
+
+    assert notifications.Dispatcher(helpdesk.app, db).run_once() == (2, 3)
+    db.session.expire_all()
+    events = [db.session.get(OutboxEvent, i) for i in ids]
+    assert [e.status for e in events] == ['sent', 'sent', 'pending', 'pending', 'pending']
+    assert FakeSMTP.sent == ['user0@company.com', 'user1@company.com']
+    assert all(e.last_error == 'Connection reset by peer' for e in events[2:])
+    assert all(e.next_attempt_at > datetime.utcnow() for e in events[2:])
+
+def test_event_leased_by_another_dispatcher_is_dropped(db, helpdesk, outbox):
+    import notifications
+    ids = outbox(3)
+    first, second = notifications.Dispatcher(helpdesk.app, db), notifications.Dispatcher(helpdesk.app, db)
+    now = datetime.utcnow()
+    # Both read the same due events before either leases them, as two
+    # SQLite dispatchers can
+    due_first, due_second = first._due(now), second._due(now)
+    assert [e.id for e in first._lease(due_first, now)] == ids
+    assert second._lease(due_second, now) == []
+    assert second._claim() == []
+
+def test_events_not_admitted_are_handed_back(db, helpdesk, outbox, monkeypatch):
+    import notifications
+    from models import OutboxEvent
+    monkeypatch.setattr(notifications, 'SMTP_HOST', 'smtp.company.com')
+    monkeypatch.setattr(notifications, 'ADMIT_TIMEOUT', 0.01)
+    ids = outbox(3)
+    dispatcher = notifications.Dispatcher(helpdesk.app, db)
+    # Every slot of the SMTP server is taken
+    limit = dispatcher._limit('smtp://smtp.company.com:25')
+    for _ in range(notifications.ENDPOINT_CONCURRENCY):
+        limit.acquire()
+
+    assert dispatcher.run_once() == (0, 0)
+    db.session.expire_all()
+    events = [db.session.get(OutboxEvent, i) for i in ids]
+    assert all(e.status == 'pending' and e.attempts == 0 and e.last_error is None for e in events)
+    assert all(e.next_attempt_at <= datetime.utcnow() for e in events)
+
+def test_one_limit_per_endpoint_across_threads(db, helpdesk):
+    import threading
+    import notifications
+    dispatcher = notifications.Dispatcher(helpdesk.app, db)
+    barrier = threading.Barrier(16)
+    limits = []
+
+    def lookup():
+        barrier.wait()
+        limits.append(dispatcher._limit('hooks.company.com'))
+
+    threads = [threading.Thread(target=lookup) for _ in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({id(limit) for limit in limits}) == 1
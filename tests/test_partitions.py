@@ -0,0 +1,63 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine, func, inspect, select
+
+def test_month_arithmetic():
+    import partitions
+    assert partitions.add_months(datetime(2024, 11, 20), 3) == datetime(2025, 2, 1)
+    assert partitions.add_months(datetime(2024, 1, 5), -1) == datetime(2023, 12, 1)
+    assert partitions.period_of(datetime(2024, 3, 9)) == '202403'
+    assert partitions.hot_since(datetime(2024, 3, 9)) == datetime(2024, 1, 1)
+
+def test_old_months_are_moved_out(db, make_user, make_ticket):
+    import partitions
+    from models import Message
+    admin = make_user()
+    ticket = make_ticket(admin, created_at=datetime(2024, 1, 2))
+    for timestamp in (datetime(2024, 1, 3), datetime(2024, 1, 20), datetime(2024, 2, 1), datetime(2024, 5, 1)):
+        db.session.add(Message(ticket_id=ticket.id, user_id=admin.id, content=f'{timestamp:%d/%m}',
+                               timestamp=timestamp))
+    db.session.commit()
+
+    moved = list(partitions.rotate(db.engine, now=datetime(2024, 6, 15), batch_size=1))
+    assert moved == [('202401', 1), ('202401', 1), ('202402', 1)]
+    assert partitions.periods(db.session.connection()) == ['202401', '202402']
+    assert [m.content for m in Message.query] == ['01/05']
+
+    history = partitions.ticket_messages(db.session, ticket.id, ticket.created_at)
+    assert [row.content for row in history] == ['03/01', '20/01', '01/02', '01/05']
+    assert len(partitions.message_tables(db.session.connection(), datetime(2024, 2, 10))) == 2
+
+def test_newest_message_stays(db, make_user, make_ticket):
+    import partitions
+    from models import Message
+    admin = make_user()
+    ticket = make_ticket(admin)
+    db.session.add(Message(ticket_id=ticket.id, user_id=admin.id, content='antiga', timestamp=datetime(2024, 1, 3)))
+    db.session.commit()
+    assert list(partitions.rotate(db.engine, now=datetime(2024, 6, 15))) == []
+    assert Message.query.count() == 1
+
+def test_retire_copies_then_drops(db, make_user, make_ticket, tmp_path):
+    import click
+    import partitions
+    from models import Message
+    admin = make_user()
+    ticket = make_ticket(admin)
+    for timestamp in (datetime(2024, 1, 3), datetime(2024, 5, 1)):
+        db.session.add(Message(ticket_id=ticket.id, user_id=admin.id, content='oi', timestamp=timestamp))
+    db.session.commit()
+    list(partitions.rotate(db.engine, now=datetime(2024, 6, 15)))
+    db.session.remove()
+
+    cold = tmp_path / 'cold.db'
+    assert partitions.retire(db.engine, '202401', into=str(cold)) == 1
+    assert 'message_202401' not in inspect(db.engine).get_table_names()
+    engine = create_engine(f'sqlite:///{cold}')
+    with engine.connect() as connection:
+        assert connection.execute(select(func.count()).select_from(partitions.period_table('202401'))).scalar() == 1
+    engine.dispose()
+
+    with pytest.raises(click.ClickException):
+        partitions.retire(db.engine, '202401')
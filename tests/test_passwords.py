@@ -0,0 +1,54 @@
+import pytest
+from werkzeug.security import generate_password_hash
+
+from conftest import PASSWORD
+
+@pytest.fixture
+def hashes(monkeypatch):
+    """Count the real hash checks"""
+    import passwords
+    calls = []
+    check_password_hash = passwords.check_password_hash
+
+    def check(password_hash, password):
+        calls.append(password_hash)
+        return check_password_hash(password_hash, password)
+    monkeypatch.setattr(passwords, 'check_password_hash', check)
+    passwords.clear_cache()
+    yield calls
+    passwords.clear_cache()
+
+def test_successful_verification_is_cached(hashes):
+    import passwords
+    password_hash = passwords.hash_password(PASSWORD)
+    assert passwords.verify_password(password_hash, PASSWORD)
+    assert passwords.verify_password(password_hash, PASSWORD)
+    assert len(hashes) == 1
+    passwords.clear_cache()
+    assert passwords.verify_password(password_hash, PASSWORD)
+    assert len(hashes) == 2
+
+def test_failures_and_changed_hashes_are_not_cached(hashes):
+    import passwords
+    password_hash = passwords.hash_password(PASSWORD)
+    assert not passwords.verify_password(password_hash, 'wrong')
+    assert not passwords.verify_password(password_hash, 'wrong')
+    assert passwords.verify_password(password_hash, PASSWORD)
+    # A password change gives a new hash, so the old verification doesn't apply
+    assert not passwords.verify_password(passwords.hash_password('another1'), PASSWORD)
+    assert len(hashes) == 4
+
+def test_login_upgrades_an_outdated_hash(client, make_user, db, hashes):
+    import passwords
+    from models import User
+    user = make_user()
+    user.password_hash = generate_password_hash(PASSWORD, method='pbkdf2:sha256:2000')
+    db.session.commit()
+    assert passwords.needs_rehash(user.password_hash)
+
+    assert client.post('/api/login', json={'username': 'admin', 'password': PASSWORD}).status_code == 200
+    db.session.expire_all()
+    upgraded = User.query.one().password_hash
+    assert not passwords.needs_rehash(upgraded)
+    assert passwords.verify_password(upgraded, PASSWORD)
+    assert client.post('/api/login', json={'username': 'admin', 'password': 'wrong'}).status_code == 401
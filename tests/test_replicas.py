@@ -0,0 +1,84 @@
+import time
+
+import pytest
+from flask import Flask, jsonify
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import Column, Integer, MetaData, String, Table, create_engine, insert, select
+
+note = Table('note', MetaData(), Column('id', Integer, primary_key=True), Column('text', String(50)))
+
+def _database(path, text, beat_at):
+    """A SQLite file with one note and a heartbeat stamped at beat_at"""
+    from models import ReplicaHeartbeat
+    engine = create_engine(f'sqlite:///{path}')
+    note.create(engine)
+    ReplicaHeartbeat.__table__.create(engine)
+    with engine.begin() as connection:
+        connection.execute(insert(note).values(text=text))
+        connection.execute(insert(ReplicaHeartbeat.__table__).values(id=1, beat_at=beat_at))
+    engine.dispose()
+    return f'sqlite:///{path}'
+
+@pytest.fixture
+def reads(tmp_path, monkeypatch):
+    """A client of a bare app with one replica; GET /note reads through
+    @read_only, POST /note writes"""
+    import replicas
+    beat_at = time.time()
+    primary = _database(tmp_path / 'primary.db', 'primary', beat_at)
+    replica = _database(tmp_path / 'replica.db', 'replica', beat_at)
+    monkeypatch.setattr(replicas, 'REPLICA_URLS', [replica])
+    monkeypatch.setattr(replicas, '_states', {})
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = primary
+    replicas.configure(app)
+    db = SQLAlchemy(session_options={'class_': replicas.RoutingSession})
+    db.init_app(app)
+    replicas.init_app(app, db)
+
+    @app.route('/note')
+    @replicas.read_only
+    def read_note():
+        return jsonify(db.session.execute(select(note.c.text)).scalars().first())
+
+    @app.route('/note', methods=['POST'])
+    def write_note():
+        db.session.execute(insert(note).values(text='new'))
+        db.session.commit()
+        return jsonify(db.session.execute(select(note.c.text)).scalars().first())
+
+    yield app.test_client()
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+
+def test_reads_go_to_a_fresh_replica(reads):
+    import replicas
+    before = replicas.READS.value(target='replica', reason='read_only')
+    assert reads.get('/note').get_json() == 'replica'
+    assert replicas.READS.value(target='replica', reason='read_only') == before + 1
+
+def test_users_read_their_own_writes(reads):
+    assert reads.post('/note').get_json() == 'primary'  # Not @read_only
+    assert reads.get_cookie('db_last_write') is not None
+    assert reads.get('/note').get_json() == 'primary'
+
+def test_lagging_replica_is_skipped(reads, monkeypatch):
+    import replicas
+    monkeypatch.setattr(replicas, 'REPLICA_MAX_LAG', -1)
+    assert reads.get('/note').get_json() == 'primary'
+
+def test_check_lag(tmp_path):
+    import replicas
+    from models import ReplicaHeartbeat
+    now = time.time()
+    primary = create_engine(_database(tmp_path / 'primary.db', 'primary', now))
+    replica = create_engine(_database(tmp_path / 'replica.db', 'replica', now - 30))
+    missing = create_engine(f"sqlite:///{tmp_path / 'missing.db'}")
+
+    behind, unavailable = replicas.check_lag(primary, [('replica_1', replica), ('replica_2', missing)])
+    assert 30 <= behind.lag < 31 and not behind.fresh
+    assert unavailable.lag is None and 'no such table' in unavailable.error
+    with primary.connect() as connection:
+        assert connection.execute(select(ReplicaHeartbeat.beat_at)).scalar() == now  # Stamped recently
@@ -0,0 +1,86 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+@pytest.fixture
+def last_month(db, make_user):
+    """Ten tickets created on the 3rd of last month and resolved 1 to 100
+    hours later (4h SLA), and one still open from then"""
+    import partitions
+    import reporting
+    from sqlalchemy import insert
+    from models import Ticket
+    now = datetime.utcnow()
+    start = partitions.add_months(now, -1)
+    created = start + timedelta(days=2)
+    admin = make_user()
+    technician = make_user('tecnico1', 'Técnico')
+    rows = [{
+        'title': f'Chamado {i}', 'description': 'd', 'department': 'TI' if i % 2 else 'RH', 'priority': 'Alta',
+        'status': 'Resolvido', 'created_at': created, 'updated_at': created, 'sla_due': created + timedelta(hours=4),
+        'resolved_at': created + timedelta(hours=hours), 'closed_at': None,
+        'creator_id': admin.id, 'assigned_to': technician.id if i < 5 else None,
+    } for i, hours in enumerate([1, 2, 3, 4, 10, 20, 30, 40, 50, 100])]
+    rows.append(dict(rows[0], title='Aberto', status='Aberto', resolved_at=None, assigned_to=None))
+    db.session.execute(insert(Ticket.__table__), rows)
+    db.session.commit()
+    return reporting.period_of(start), technician
+
+def test_month_figures(db, last_month):
+    import reporting
+    period, technician = last_month
+    with db.engine.connect() as connection:
+        figures = reporting.compute(connection, period)
+    assert figures['resolved'] == 10
+    assert figures['resolution_hours'] == {'avg': 26.0, 'p50': 10.0, 'p90': 50.0, 'p95': 100.0}
+    assert (figures['sla_met'], figures['sla_violations'], figures['sla_compliance']) == (4, 6, 40.0)
+    assert figures['backlog'] == 1
+    assert sum(figures['backlog_aging'].values()) == 1
+    assert figures['by_department']['TI']['resolved'] == 5
+    assert figures['by_technician'][str(technician.id)]['resolution_hours']['p50'] == 3.0
+    assert figures['by_technician'][reporting.NO_TECHNICIAN]['backlog'] == 1
+
+def test_closed_month_is_never_recomputed(db, last_month):
+    import reporting
+    from models import Ticket
+    period, _ = last_month
+    first = reporting.refresh(db.engine)[period]
+    Ticket.query.update({'resolved_at': None, 'status': 'Aberto'})
+    db.session.commit()
+    assert period not in reporting.refresh(db.engine)
+    assert reporting.stored(db.session, [period]) == {period: first}
+
+def test_current_month_is_refreshed(db, make_user, make_ticket):
+    import reporting
+    ticket = make_ticket(make_user())
+    now = datetime.utcnow()
+    period = reporting.period_of(now)
+    assert reporting.refresh(db.engine, now=now)[period]['backlog'] == 1
+
+    ticket.status = 'Resolvido'
+    db.session.commit()
+    later = now + timedelta(seconds=reporting.REPORT_CACHE_SECONDS + 1)
+    reporting.refresh(db.engine, now=later)
+    figures = reporting.stored(db.session, [period])[period]
+    assert figures['backlog'] == 0 and figures['resolved'] == 1
+
+def test_summary_endpoint(client, auth, db):
+    import reporting
+    from models import ReportPeriod
+    headers = auth()
+    assert client.get('/api/reports/summary?period=202613', headers=headers).status_code == 400
+    # Requests only read stored figures
+    assert client.get('/api/reports/summary', headers=headers).status_code == 404
+    assert ReportPeriod.query.count() == 0
+
+    reporting.refresh(db.engine, since=reporting.period_of(datetime.utcnow()))
+    response = client.get('/api/reports/summary', headers=headers)
+    assert response.status_code == 200
+    assert response.get_json()['resolved'] == 0
+
+def test_reports_page_without_figures(simple_client):
+    from models import ReportPeriod
+    response = simple_client.get('/reports')
+    assert response.status_code == 200
+    assert 'ainda não foram calculados' in response.get_data(as_text=True)
+    assert ReportPeriod.query.count() == 0
@@ -0,0 +1,43 @@
+import pytest
+
+@pytest.fixture
+def tickets(db, make_user, make_ticket):
+    """A ticket about a printer in its title, one mentioning it in a chat
+    message, and one that doesn't; returns (title, message) ids"""
+    from models import Message
+    admin = make_user()
+    colaborador = make_user('colab1', 'Colaborador')
+    in_title = make_ticket(admin, title='Impressora sem toner', description='Terceiro andar')
+    in_message = make_ticket(colaborador, title='Sala de reunião', description='Projetor não liga')
+    make_ticket(admin, title='Senha expirada', description='Não consigo entrar no email')
+    db.session.add(Message(content='A impressora da sala também parou', ticket_id=in_message.id,
+                           user_id=admin.id))
+    db.session.commit()
+    return in_title.id, in_message.id
+
+def _ids(client, headers, query):
+    response = client.get(f'/api/search?{query}', headers=headers)
+    assert response.status_code == 200
+    return [result['id'] for result in response.get_json()['results']]
+
+def test_title_matches_rank_first(client, auth, tickets):
+    headers = auth('diretor', 'Diretoria')
+    assert _ids(client, headers, 'q=impressora') == list(tickets)
+    # The last word matches as a prefix
+    assert _ids(client, headers, 'q=impres') == list(tickets)
+    assert _ids(client, headers, 'q=impressora toner') == [tickets[0]]
+    assert client.get('/api/search?q=', headers=headers).status_code == 400
+
+def test_results_follow_visibility(client, login, tickets):
+    headers = login('colab1')
+    assert _ids(client, headers, 'q=impressora') == [tickets[1]]
+
+def test_index_follows_edits_and_deletes(client, auth, db, tickets):
+    from models import Message, Ticket
+    headers = auth('diretor', 'Diretoria')
+    db.session.delete(Message.query.one())
+    ticket = db.session.get(Ticket, tickets[0])
+    ticket.title = 'Scanner sem toner'
+    db.session.commit()
+    assert _ids(client, headers, 'q=impressora') == []
+    assert _ids(client, headers, 'q=scanner') == [tickets[0]]
@@ -0,0 +1,63 @@
+import pytest
+
+@pytest.fixture
+def index(monkeypatch):
+    """A fresh process-wide index, loaded from the test's tickets on first use"""
+    import similarity
+    index = similarity.SimilarityIndex()
+    monkeypatch.setattr(similarity, 'index', index)
+    return index
+
+def test_tokenize():
+    import similarity
+    assert similarity.tokenize('Impressora NÃO imprime a página 2') == ['impressora', 'imprime', 'pagina']
+
+def test_similar_open_tickets_best_first(client, auth, make_user, make_ticket, db, index):
+    headers = auth('tecnico1', 'Técnico')
+    admin = make_user()
+    printer = make_ticket(admin, title='Impressora não imprime', description='Impressora do RH parada')
+    toner = make_ticket(admin, title='Toner acabou', description='Impressora sem toner')
+    make_ticket(admin, title='Senha expirada', description='Não consigo entrar')
+    closed = make_ticket(admin, title='Impressora não imprime', status='Fechado')
+
+    def similar(title):
+        response = client.get('/api/tickets/similar', headers=headers, query_string={'title': title})
+        return [match['id'] for match in response.get_json()]
+
+    assert similar('impressora') == [printer.id, toner.id]
+    assert similar('toner da impressora') == [toner.id, printer.id]
+    assert closed.id not in similar('impressora não imprime')
+
+    # Tickets created and closed later are picked up from the ticket events
+    new = make_ticket(admin, title='Scanner travado', description='Scanner não digitaliza')
+    assert similar('scanner') == [new.id]
+    new.status = 'Resolvido'
+    db.session.commit()
+    assert similar('scanner') == []
+
+def test_hidden_tickets_are_left_out(index):
+    index.load([
+        (1, 'Impressora parada', '', 'Aberto', 'Alta', 10, None),
+        (2, 'Impressora parada', '', 'Aberto', 'Alta', 11, None),
+    ])
+    matches = index.query('impressora', visible=lambda meta: meta['creator_id'] == 11)
+    assert [ticket_id for ticket_id, _, _ in matches] == [2]
+
+def test_index_is_rebuilt_after_refresh_interval(client, auth, make_user, make_ticket, index, monkeypatch):
+    import similarity
+    headers = auth('tecnico1', 'Técnico')
+    admin = make_user()
+
+    def similar(title):
+        response = client.get('/api/tickets/similar', headers=headers, query_string={'title': title})
+        return [match['id'] for match in response.get_json()]
+
+    assert similar('scanner') == []
+    # A ticket committed by another worker doesn't reach this process's index
+    with monkeypatch.context() as m:
+        m.setattr(index, 'apply', lambda changes: None)
+        other = make_ticket(admin, title='Scanner travado', description='Scanner não digitaliza')
+    assert similar('scanner') == []
+
+    index.loaded_at -= similarity.REFRESH_INTERVAL + 1
+    assert similar('scanner') == [other.id]
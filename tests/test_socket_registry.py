@@ -0,0 +1,59 @@
+import pytest
+
+def test_rooms_follow_their_sockets():
+    import socket_registry
+    registry = socket_registry.ConnectionRegistry()
+    registry.add('a', {'user_id': 1, 'name': 'Ana', 'role': 'Técnico'})
+    registry.add('b', {'user_id': 1, 'name': 'Ana', 'role': 'Técnico'})
+    registry.add('c', {'user_id': 2, 'name': 'Bia', 'role': 'Colaborador'})
+    for sid in ('a', 'b', 'c'):
+        registry.join(sid, 'ticket_7')
+    registry.join('a', 'technicians')
+    assert (len(registry), registry.users()) == (3, 2)
+    assert registry.occupancy() == {'ticket': (1, 3), 'technicians': (1, 1)}
+    assert registry.room_size('ticket_7', exclude='a') == 2
+    assert registry.room_size('ticket_7', exclude='zz') == 3
+
+    registry.leave('b', 'ticket_7')
+    assert registry.remove('a')['name'] == 'Ana'
+    assert 'a' not in registry and registry.remove('a') is None
+    assert registry.occupancy() == {'ticket': (1, 1)}
+
+def test_instrumented_handlers_are_counted():
+    import socket_registry
+
+    @socket_registry.instrumented('test_event')
+    def handler(fail=False):
+        if fail:
+            raise ValueError('boom')
+        return 'ok'
+
+    before = socket_registry.EVENTS.value(event='test_event')
+    errors = socket_registry.EVENT_ERRORS.value(event='test_event')
+    assert handler() == 'ok'
+    with pytest.raises(ValueError):
+        handler(fail=True)
+    assert socket_registry.EVENTS.value(event='test_event') == before + 2
+    assert socket_registry.EVENT_ERRORS.value(event='test_event') == errors + 1
+    assert socket_registry.EVENT_DURATION.count(event='test_event') >= 2
+
+def test_connections_are_registered(helpdesk, client, auth, monkeypatch):
+    import instrumentation
+    import socket_registry
+    monkeypatch.setattr(instrumentation, 'METRICS_ENABLED', True)
+    headers = auth('tecnico1', 'Técnico')
+    token = headers['Authorization'].split()[1]
+    before = len(socket_registry.connections)
+
+    socket = helpdesk.socketio.test_client(helpdesk.app, auth={'token': token})
+    assert socket.is_connected()
+    assert len(socket_registry.connections) == before + 1
+    assert socket_registry.connections.occupancy()['technicians'][1] >= 1
+    assert 'socketio_connections' in client.get('/metrics').get_data(as_text=True)
+
+    socket.disconnect()
+    assert len(socket_registry.connections) == before
+
+    rejected = helpdesk.socketio.test_client(helpdesk.app, auth={'token': 'bad'})
+    assert not rejected.is_connected()
+    assert len(socket_registry.connections) == before
@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta
+
+def test_listeners_keep_the_counters(db, make_user, make_ticket):
+    from models import Attachment, Message
+    admin = make_user()
+    ticket = make_ticket(admin)
+    updated_at = ticket.updated_at
+    later = ticket.created_at + timedelta(minutes=5)
+    db.session.add_all([
+        Message(content='Bom dia', ticket_id=ticket.id, user_id=admin.id, timestamp=later),
+        Message(content='Alguma novidade?', ticket_id=ticket.id, user_id=admin.id,
+                timestamp=later - timedelta(minutes=1)),
+        Attachment(filename='a.png', original_filename='print.png', file_size=10, mime_type='image/png',
+                   ticket_id=ticket.id, uploaded_by=admin.id, uploaded_at=later - timedelta(minutes=2)),
+    ])
+    db.session.commit()
+    assert (ticket.message_count, ticket.attachment_count, ticket.last_activity_at) == (2, 1, later)
+    # Activity isn't an edit
+    assert ticket.updated_at == updated_at
+
+    db.session.delete(Message.query.filter_by(content='Bom dia').one())
+    db.session.commit()
+    assert (ticket.message_count, ticket.last_activity_at) == (1, later)
+
+def test_repair_recounts_hot_and_archived_tickets(db, helpdesk, make_user, make_ticket):
+    import archive
+    import ticket_counters
+    from models import Message, Ticket, TicketArchive
+    admin = make_user()
+    year_ago = datetime.utcnow() - timedelta(days=365)
+    tickets = [make_ticket(admin, status='Fechado', created_at=year_ago, closed_at=year_ago), make_ticket(admin)]
+    ids = [t.id for t in tickets]
+    # Plain inserts go around the listeners, as benchmark seeding does
+    db.session.execute(Message.__table__.insert(), [
+        {'content': 'Oi', 'ticket_id': ticket_id, 'user_id': admin.id, 'timestamp': year_ago + timedelta(hours=n),
+         'message_type': 'message'}
+        for ticket_id in ids for n in range(3)
+    ])
+    db.session.commit()
+    with db.engine.begin() as connection:
+        archive.move_tickets(connection, ids[:1])
+    assert {t.message_count for t in Ticket.query} | {t.message_count for t in TicketArchive.query} == {0}
+
+    assert list(ticket_counters.repair(db.engine, batch_size=1)) == [(1, 1), (1, 1)]
+    db.session.expire_all()
+    archived, hot = db.session.get(TicketArchive, ids[0]), db.session.get(Ticket, ids[1])
+    assert (archived.message_count, archived.last_activity_at) == (3, year_ago + timedelta(hours=2))
+    # The hot ticket was created after its (backdated) messages
+    assert (hot.message_count, hot.last_activity_at) == (3, hot.created_at)
+
+    result = helpdesk.app.test_cli_runner().invoke(args=['repair-ticket-counters'])
+    assert 'Done: 2 ticket(s) checked, 0 fixed' in result.output
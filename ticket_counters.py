@@ -0,0 +1,121 @@
+import logging
+import os
+import click
+from sqlalchemy import bindparam, func, inspect, select, text, update
+
+# Ticket.message_count, attachment_count and last_activity_at are kept by the
+# listeners in models.py and by the bulk paths that go around them
+# (bulk_operations, partitions.retire). Anything else that writes messages or
+# attachments with plain statements, like benchmark seeding, recounts here.
+REPAIR_BATCH_SIZE = int(os.environ.get("TICKET_COUNTERS_BATCH_SIZE", 1000))
+
+COLUMNS = ('message_count', 'attachment_count', 'last_activity_at')
+
+def _tiers(connection):
+    """(ticket table, message tables, attachment table) of the hot tables
+    and of the archive (archive.py)"""
+    import models
+    import partitions
+    messages = [models.Message.__table__]
+    messages += [partitions.period_table(period) for period in partitions.periods(connection)]
+    return [
+        (models.Ticket.__table__, messages, models.Attachment.__table__),
+        (models.TicketArchive.__table__, [models.MessageArchive.__table__], models.AttachmentArchive.__table__),
+    ]
+
+def _recount(connection, tickets, messages, attachments, after_id, batch_size):
+    """Recount the batch_size tickets after after_id; returns (last id,
+    tickets checked, tickets fixed)"""
+    rows = connection.execute(
+        select(tickets.c.id, tickets.c.created_at, *(tickets.c[name] for name in COLUMNS))
+        .where(tickets.c.id > after_id).order_by(tickets.c.id).limit(batch_size)
+        # Writers bump the counters under the ticket's row lock (PostgreSQL),
+        # so nothing is counted twice or missed
+        .with_for_update()
+    ).all()
+    if not rows:
+        return None, 0, 0
+    ids = [row.id for row in rows]
+    counted = {row.id: {'message_count': 0, 'attachment_count': 0, 'last_activity_at': row.created_at}
+               for row in rows}
+
+    def add(table, column, at):
+        query = select(table.c.ticket_id, func.count(), func.max(at)).where(
+            table.c.ticket_id.in_(ids)).group_by(table.c.ticket_id)
+        for ticket_id, count, latest in connection.execute(query):
+            values = counted[ticket_id]
+            values[column] += count
+            if latest is not None and (values['last_activity_at'] is None or latest > values['last_activity_at']):
+                values['last_activity_at'] = latest
+
+    for table in messages:
+        add(table, 'message_count', table.c.timestamp)
+    add(attachments, 'attachment_count', attachments.c.uploaded_at)
+
+    fixes = [dict(counted[row.id], ticket_id=row.id) for row in rows
+             if any(getattr(row, name) != counted[row.id][name] for name in COLUMNS)]
+    if fixes:
+        values = {name: bindparam(name) for name in COLUMNS}
+        if 'updated_at' in tickets.c:
+            values['updated_at'] = tickets.c.updated_at
+        connection.execute(update(tickets).where(tickets.c.id == bindparam('ticket_id')).values(**values), fixes)
+    return ids[-1], len(rows), len(fixes)
+
+def repair(engine, batch_size=REPAIR_BATCH_SIZE):
+    """Recount every ticket, hot and archived, batch_size tickets per
+    transaction. Yields (tickets checked, tickets fixed) per batch."""
+    with engine.connect() as connection:
+        tiers = _tiers(connection)
+    for tickets, messages, attachments in tiers:
+        after_id = 0
+        while after_id is not None:
+            with engine.begin() as connection:
+                after_id, checked, fixed = _recount(connection, tickets, messages, attachments, after_id, batch_size)
+            if checked:
+                yield checked, fixed
+
+def forget_messages(connection, table):
+    """Take the messages of table off their tickets' counts, before the table
+    is dropped"""
+    import models
+    tickets = models.Ticket.__table__
+    counts = [{'ticket_id': ticket_id, 'n': n} for ticket_id, n in connection.execute(
+        select(table.c.ticket_id, func.count()).group_by(table.c.ticket_id))]
+    if counts:
+        connection.execute(update(tickets).where(tickets.c.id == bindparam('ticket_id')).values(
+            message_count=tickets.c.message_count - bindparam('n'), updated_at=tickets.c.updated_at
+        ), counts)
+
+def add_columns(db):
+    """Migration: add the counter columns to ticket and ticket_archive and
+    fill them (a full recount, so run it during a quiet period)"""
+    import models
+    with db.engine.begin() as connection:
+        for table in (models.Ticket.__table__, models.TicketArchive.__table__):
+            existing = {column['name'] for column in inspect(connection).get_columns(table.name)}
+            for name in COLUMNS:
+                if name in existing:
+                    continue
+                column = table.c[name]
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {name} {column.type.compile(connection.dialect)}"
+                if column.server_default is not None:
+                    ddl += f" DEFAULT {column.server_default.arg} NOT NULL"
+                connection.execute(text(ddl))
+        # After the ALTERs: the index is on a column they add
+        index = next(i for i in models.Ticket.__table__.indexes if i.name == 'ix_ticket_last_activity')
+        index.create(connection, checkfirst=True)
+    for _ in repair(db.engine):
+        pass
+
+def register_commands(app, db):
+
+    @app.cli.command('repair-ticket-counters')
+    @click.option('--batch-size', default=REPAIR_BATCH_SIZE, show_default=True, help='Tickets per transaction.')
+    def repair_ticket_counters_command(batch_size):
+        """Recount the messages, attachments and last activity of every ticket."""
+        checked = fixed = 0
+        for batch_checked, batch_fixed in repair(db.engine, batch_size):
+            checked += batch_checked
+            fixed += batch_fixed
+        logging.info(f"Ticket counters repaired: {fixed} of {checked} ticket(s) were off")
+        click.echo(f"Done: {checked} ticket(s) checked, {fixed} fixed")
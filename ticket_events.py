@@ -0,0 +1,76 @@
+import logging
+from collections import namedtuple
+from sqlalchemy import event, inspect
+
+# A committed change to a ticket. `previous` holds the old value of every
+# tracked field that changed (empty for created/deleted tickets).
+TicketChange = namedtuple('TicketChange', [
+    'action', 'ticket_id', 'title', 'description', 'department', 'status',
+    'priority', 'assigned_to', 'creator_id', 'sla_due', 'previous'
+])
+
+TRACKED_FIELDS = ('title', 'description', 'department', 'status', 'priority', 'assigned_to', 'sla_due')
+
+_subscribers = []
+
+def subscribe(callback):
+    """Call callback(changes) after every commit that changed tickets"""
+    if callback not in _subscribers:
+        _subscribers.append(callback)
+    return callback
+
+def change_from_ticket(action, ticket, previous=None):
+    return TicketChange(
+        action, ticket.id, ticket.title, ticket.description, ticket.department,
+        ticket.status, ticket.priority, ticket.assigned_to, ticket.creator_id,
+        ticket.sla_due, previous or {}
+    )
+
+def record(session, changes):
+    """Queue changes made outside the ORM (bulk statements) for this transaction"""
+    session.info.setdefault('ticket_changes', []).extend(changes)
+
+def _after_flush(session, flush_context):
+    changes = []
+    for obj in session.new:
+        if getattr(obj, '__tablename__', None) == 'ticket':
+            changes.append(change_from_ticket('created', obj))
+
+    for obj in session.dirty:
+        if getattr(obj, '__tablename__', None) != 'ticket':
+            continue
+        state = inspect(obj)
+        previous = {}
+        for field in TRACKED_FIELDS:
+            history = state.attrs[field].history
+            if history.has_changes():
+                previous[field] = history.deleted[0] if history.deleted else None
+        if previous:
+            changes.append(change_from_ticket('updated', obj, previous))
+
+    for obj in session.deleted:
+        if getattr(obj, '__tablename__', None) == 'ticket':
+            changes.append(change_from_ticket('deleted', obj))
+
+    if changes:
+        record(session, changes)
+
+def _after_commit(session):
+    changes = session.info.pop('ticket_changes', None)
+    if not changes:
+        return
+    for callback in _subscribers:
+        try:
+            callback(changes)
+        except Exception as e:
+            logging.error(f"Ticket event subscriber {callback.__name__} failed: {e}")
+
+def _after_rollback(session):
+    session.info.pop('ticket_changes', None)
+
+def register_listeners(scoped_session):
+    """Publish ticket changes committed through this session"""
+    for name, listener in (('after_flush', _after_flush), ('after_commit', _after_commit),
+                           ('after_rollback', _after_rollback)):
+        if not event.contains(scoped_session, name, listener):
+            event.listen(scoped_session, name, listener)
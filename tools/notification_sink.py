@@ -0,0 +1,141 @@
+"""Local stand-in for the notification endpoints (webhook + SMTP).
+
+Accepts webhook POSTs over HTTP and mail over a minimal SMTP server, and
+prints every delivery as a JSON line (also appended to --log if given), so
+the outbox dispatcher can be exercised without real services:
+
+    python tools/notification_sink.py --http-port 8099 --smtp-port 8025
+    NOTIFY_WEBHOOK_URLS=http://localhost:8099/hook \\
+    NOTIFY_SMTP_HOST=localhost NOTIFY_SMTP_PORT=8025 flask --app app dispatch-notifications
+
+--fail-rate makes that share of deliveries fail (HTTP 503 / SMTP 451) to
+exercise retries and backoff; --delay slows every delivery down.
+"""
+import argparse
+import json
+import random
+import socketserver
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_output_lock = threading.Lock()
+
+def record(log_path, entry):
+    line = json.dumps(entry, ensure_ascii=False)
+    with _output_lock:
+        print(line, flush=True)
+        if log_path:
+            with open(log_path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+
+def make_http_handler(options):
+
+    class WebhookHandler(BaseHTTPRequestHandler):
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            time.sleep(options.delay)
+            if random.random() < options.fail_rate:
+                self.send_response(503)
+                self.end_headers()
+                return
+            try:
+                payload = json.loads(body)
+            except ValueError:
+                payload = body.decode('utf-8', 'replace')
+            record(options.log, {'channel': 'webhook', 'path': self.path, 'payload': payload})
+            self.send_response(204)
+            self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    return WebhookHandler
+
+def make_smtp_handler(options):
+
+    class SMTPHandler(socketserver.StreamRequestHandler):
+        """Just enough SMTP for smtplib: EHLO/HELO, MAIL, RCPT, DATA, RSET, NOOP, QUIT"""
+
+        def reply(self, line):
+            self.wfile.write(f"{line}\r\n".encode())
+
+        def handle(self):
+            self.reply("220 notification-sink ESMTP")
+            sender, recipients = None, []
+            while True:
+                line = self.rfile.readline()
+                if not line:
+                    return
+                command = line.decode('utf-8', 'replace').strip()
+                verb = command[:4].upper()
+                if verb == 'EHLO':
+                    self.reply("250-notification-sink")
+                    self.reply("250 8BITMIME")
+                elif verb == 'HELO' or verb == 'NOOP':
+                    self.reply("250 OK")
+                elif verb == 'MAIL':
+                    sender, recipients = command[10:].strip(' <>'), []
+                    self.reply("250 OK")
+                elif verb == 'RCPT':
+                    recipients.append(command[8:].strip(' <>'))
+                    self.reply("250 OK")
+                elif verb == 'DATA':
+                    self.reply("354 End data with <CR><LF>.<CR><LF>")
+                    data = []
+                    while True:
+                        data_line = self.rfile.readline()
+                        if not data_line or data_line in (b'.\r\n', b'.\n'):
+                            break
+                        data.append(data_line[1:] if data_line.startswith(b'..') else data_line)
+                    time.sleep(options.delay)
+                    if random.random() < options.fail_rate:
+                        self.reply("451 Try again later")
+                        continue
+                    record(options.log, {
+                        'channel': 'email', 'from': sender, 'to': recipients,
+                        'message': b''.join(data).decode('utf-8', 'replace')
+                    })
+                    self.reply("250 OK")
+                elif verb == 'RSET':
+                    sender, recipients = None, []
+                    self.reply("250 OK")
+                elif verb == 'QUIT':
+                    self.reply("221 Bye")
+                    return
+                else:
+                    self.reply("502 Command not implemented")
+
+    return SMTPHandler
+
+class ThreadingTCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--http-port', type=int, default=8099)
+    parser.add_argument('--smtp-port', type=int, default=8025)
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    parser.add_argument('--delay', type=float, default=0.0)
+    parser.add_argument('--log', default=None, help='Also append deliveries to this file.')
+    options = parser.parse_args()
+
+    http_server = ThreadingHTTPServer((options.host, options.http_port), make_http_handler(options))
+    smtp_server = ThreadingTCPServer((options.host, options.smtp_port), make_smtp_handler(options))
+    threading.Thread(target=smtp_server.serve_forever, daemon=True).start()
+    print(f"Webhooks on http://{options.host}:{options.http_port}/, SMTP on {options.host}:{options.smtp_port}",
+          file=sys.stderr, flush=True)
+    try:
+        http_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        http_server.server_close()
+        smtp_server.shutdown()
+
+if __name__ == '__main__':
+    main()